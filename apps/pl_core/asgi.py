@@ -0,0 +1,63 @@
+from typing import AsyncIterator, Iterator
+
+from asgiref.sync import async_to_sync
+from django.core.handlers import asgi
+from django.http import StreamingHttpResponse
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    """`StreamingHttpResponse` whose content is an asynchronous iterator.
+
+    Django 3.2 iterates the streaming responses synchronously, on the event loop with ASGI, so
+    `ASGIHandler` sends `async_streaming_content` by awaiting its chunks instead. The other
+    handlers (WSGI, test client) iterate the content synchronously, each chunk being awaited
+    from a new event loop.
+
+    Args:
+        async_streaming_content (`AsyncIterator[bytes]`): Content of the response.
+    """
+
+    def __init__(self, async_streaming_content: AsyncIterator[bytes], *args, **kwargs):
+        super().__init__(self.__iter_sync(async_streaming_content), *args, **kwargs)
+        self.async_streaming_content = async_streaming_content
+
+    @staticmethod
+    def __iter_sync(chunks: AsyncIterator[bytes]) -> Iterator[bytes]:
+        iterator = chunks.__aiter__()
+        try:
+            while True:
+                try:
+                    yield async_to_sync(iterator.__anext__)()
+                except StopAsyncIteration:
+                    return
+        finally:
+            if hasattr(iterator, 'aclose'):
+                async_to_sync(iterator.aclose)()
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """`ASGIHandler` which streams `AsyncStreamingHttpResponse` without blocking the event loop."""
+
+    async def send_response(self, response, send):
+        if not isinstance(response, AsyncStreamingHttpResponse):
+            return await super().send_response(response, send)
+
+        headers = []
+        for header, value in response.items():
+            headers.append((header.encode('ascii'), value.encode('latin1')))
+        for cookie in response.cookies.values():
+            headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        chunks = response.async_streaming_content
+        try:
+            async for chunk in chunks:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(chunks, 'aclose'):
+                await chunks.aclose()
+        await send({'type': 'http.response.body'})
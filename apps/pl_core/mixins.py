@@ -7,6 +7,8 @@ from rest_framework import mixins, exceptions, viewsets
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.response import Response
 
+from .pagination import CappedPagination, CursorPagination
+
 
 class AsyncView(View):
     """Base Async View."""
@@ -34,6 +36,15 @@ class CrudViewSet(
     mixins.DestroyModelMixin,
     mixins.RetrieveModelMixin,
 ):
+    """Base viewset of the CRUD endpoints.
+
+    The list is paginated with `limit` and `offset` by default, returned as a plain list
+    capped to `PAGINATION_MAX_RESULTS` items with `no_page` or paginated with a cursor when
+    the viewset declares a `cursor_ordering` (an unique indexed ordering) and the query
+    parameter `cursor` is given (empty for the first page).
+    """
+
+    cursor_ordering = None
 
     def initialize_request(self, request, *args, **kwargs):
         request = super().initialize_request(request, *args, **kwargs)
@@ -65,7 +76,9 @@ class CrudViewSet(
 
     def list(self, request, *args, **kwargs):
         if 'no_page' in self.request.query_params:
-            self.pagination_class = None
+            self.pagination_class = CappedPagination
+        elif self.cursor_ordering and 'cursor' in self.request.query_params:
+            self.pagination_class = CursorPagination
         return super().list(request, *args, **kwargs)
 
     @classmethod
@@ -0,0 +1,141 @@
+from typing import Any, Dict, Type
+
+import dgeq
+from dgeq.exceptions import InvalidCommandError
+from django.conf import settings
+from django.db import models
+from django.http import QueryDict
+from rest_framework import pagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+PAGINATION_MAX_RESULTS = settings.PAGINATION_MAX_RESULTS
+
+
+class LimitOffsetPagination(pagination.LimitOffsetPagination):
+    """`LimitOffsetPagination` whose `limit` cannot exceed `PAGINATION_MAX_RESULTS`."""
+
+    max_limit = PAGINATION_MAX_RESULTS
+
+
+class CursorPagination(pagination.CursorPagination):
+    """Keyset pagination on the `cursor_ordering` of the view.
+
+    The pages are read with an indexed range scan whatever their depth instead of
+    an `OFFSET` and the total number of results is only computed (in `count`)
+    when the query parameter `count=true` is given.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = PAGINATION_MAX_RESULTS
+
+    def get_ordering(self, request, queryset, view):
+        # the `ordering` query parameter is ignored: a cursor is only stable on an unique indexed ordering
+        ordering = getattr(view, 'cursor_ordering', None) or self.ordering
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get('count', '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+        return response
+
+
+class CappedPagination(pagination.BasePagination):
+    """Returns the results as a plain list truncated to `PAGINATION_MAX_RESULTS` items.
+
+    The header `X-Truncated` is added to the response when some results were dropped.
+    """
+
+    max_results = PAGINATION_MAX_RESULTS
+
+    def paginate_queryset(self, queryset, request, view=None):
+        results = list(queryset[:self.max_results + 1])
+        self.truncated = len(results) > self.max_results
+        return results[:self.max_results]
+
+    def get_paginated_response(self, data):
+        return Response(data, headers={'X-Truncated': 'true'} if self.truncated else None)
+
+
+def evaluate_query(model: Type[models.Model], query_dict: QueryDict, user) -> Dict[str, Any]:
+    """Evaluates a `dgeq` query on `model` with at most `PAGINATION_MAX_RESULTS` rows.
+
+    The rows are capped with `c:limit` when it is absent, null or greater than the maximum.
+    `c:count` still counts every matching row in this case.
+
+    `c:cursor` paginates on the primary key instead of `c:start`: the rows are ordered by
+    decreasing id and start after the id given as cursor (from the first row if empty). The
+    cursor of the next page is then returned in `next` (`None` on the last page).
+
+    Args:
+        model (`Type[Model]`): Model to query.
+        query_dict (`QueryDict`): Parameters of the query.
+        user (`User`): User used to check the permissions.
+
+    Returns:
+        `dict`: The result of the query like `GenericQuery.evaluate`.
+    """
+
+    params = query_dict.copy()
+    cursor = params.pop('c:cursor', [None])[-1]
+
+    error = None
+    if cursor is not None and ('c:start' in params or 'c:sort' in params):
+        error = InvalidCommandError('c:cursor', "cannot be used with 'c:start' or 'c:sort'")
+    elif cursor and not cursor.isdigit():
+        error = InvalidCommandError('c:cursor', f"value must be an id (received '{cursor}')")
+    if error:
+        return {
+            'status': False,
+            'message': str(error),
+            'code': error.code,
+            **{a: getattr(error, a) for a in error.details}
+        }
+
+    def build(params: QueryDict) -> dgeq.GenericQuery:
+        query = dgeq.GenericQuery(model, params, user=user, use_permissions=True)
+        if cursor is not None:
+            query.queryset = query.queryset.order_by('-pk')
+        if cursor:
+            query.queryset = query.queryset.filter(pk__lt=int(cursor))
+        return query
+
+    # an invalid limit is kept to be reported by dgeq
+    bounded = params.copy()
+    limit = bounded.get('c:limit', '0')
+    capped = limit.isdigit() and not 0 < int(limit) <= PAGINATION_MAX_RESULTS
+    counted = None
+    if capped:
+        bounded['c:limit'] = str(PAGINATION_MAX_RESULTS)
+        counted = bounded.pop('c:count', None)
+
+    query = build(bounded)
+    result = query.evaluate()
+    if not result['status']:
+        return result
+
+    if counted is not None:
+        # the count of the capped query would be capped too: it is computed without the cap
+        params['c:evaluate'] = '0'
+        count = build(params).evaluate()
+        if not count['status']:
+            return count
+        if 'count' in count:
+            result['count'] = count['count']
+
+    rows = result.get('rows')
+    if cursor is not None and rows is not None:
+        result['next'] = None
+        if rows and len(rows) == int(bounded['c:limit']):
+            # the ids are read from the same slice since `id` may be hidden from the rows
+            result['next'] = str(list(query.queryset.values_list('pk', flat=True))[-1])
+    return result
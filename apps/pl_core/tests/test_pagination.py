@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.test import TestCase
+from mock import patch
+
+from pl_core.pagination import evaluate_query
+from pl_sandbox.models import Sandbox, Usage
+
+
+User = get_user_model()
+
+
+
+class EvaluateQueryTestCase(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('test', is_superuser=True)
+        sandbox = Sandbox.objects.create(name='Test', url='http://sandbox', enabled=True)
+        cls.usages = [Usage.objects.create(sandbox=sandbox) for _ in range(5)]
+    
+    
+    def test_cursor(self):
+        ids = []
+        cursor = ''
+        while cursor is not None:
+            result = evaluate_query(Usage, QueryDict(f'c:cursor={cursor}&c:limit=2'), self.user)
+            self.assertTrue(result['status'])
+            ids += [row['id'] for row in result['rows']]
+            cursor = result['next']
+        self.assertEqual(ids, sorted((usage.pk for usage in self.usages), reverse=True))
+        
+        result = evaluate_query(Usage, QueryDict('c:cursor=&c:limit=2&c:hide=id'), self.user)
+        self.assertEqual(result['next'], str(self.usages[-2].pk))
+        
+        # `c:show` since the regex of dgeq's `Show` command never matches `c:hide`
+        pages = []
+        cursor = ''
+        while cursor is not None:
+            result = evaluate_query(Usage, QueryDict(f'c:cursor={cursor}&c:limit=2&c:show=date'), self.user)
+            self.assertNotIn('id', result['rows'][0])
+            pages.append(len(result['rows']))
+            cursor = result['next']
+        self.assertEqual(pages, [2, 2, 1])
+        
+        result = evaluate_query(Usage, QueryDict('c:cursor=abc'), self.user)
+        self.assertFalse(result['status'])
+        result = evaluate_query(Usage, QueryDict('c:cursor=&c:start=2'), self.user)
+        self.assertFalse(result['status'])
+    
+    
+    def test_limit(self):
+        with patch('pl_core.pagination.PAGINATION_MAX_RESULTS', 3):
+            result = evaluate_query(Usage, QueryDict('c:count=1'), self.user)
+            self.assertEqual((len(result['rows']), result['count']), (3, 5))
+            self.assertEqual(len(evaluate_query(Usage, QueryDict('c:limit=0'), self.user)['rows']), 3)
+            self.assertEqual(len(evaluate_query(Usage, QueryDict('c:limit=2'), self.user)['rows']), 2)
+            
+            result = evaluate_query(Usage, QueryDict('c:cursor=&c:limit=10'), self.user)
+            self.assertEqual(result['next'], str(self.usages[-3].pk))
+            
+            result = evaluate_query(Usage, QueryDict('c:cursor=&c:show=date&c:count=1'), self.user)
+            self.assertEqual((len(result['rows']), result['count'], result['next']), (3, 5, str(self.usages[-3].pk)))
+            self.assertFalse(evaluate_query(Usage, QueryDict('c:limit=-1'), self.user)['status'])
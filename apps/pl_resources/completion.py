@@ -0,0 +1,117 @@
+import threading
+from typing import Dict, Iterable, List, Tuple, Type
+
+from django.conf import settings
+from django.db import models
+from django.db.models.aggregates import Count
+
+from .models import CacheStamp, Circle, Resource
+
+
+COMPLETION_PARTS = ('names', 'topics', 'levels')
+COMPLETION_LIMIT = settings.COMPLETION_LIMIT
+
+
+class CompletionIndex:
+    """Completion index of the names, topics and levels used by the objects of a model.
+
+    Each part of the index lists its distinct terms with their number of references and is
+    read with a single grouped query (from the through table for the topics and the levels)
+    instead of the cross product of the two many to many joins. The parts are kept in the
+    local memory with the version stamp they were built for. The stamps are shared by the
+    processes through `CacheStamp` rows (read with one query by lookup) and renewed by
+    `invalidate` when the objects change so only the changed parts are rebuilt, on their
+    next lookup in each process.
+
+    Args:
+        model (`Type[Model]`): Indexed model (`Circle` or `Resource`).
+    """
+
+    def __init__(self, model: Type[models.Model]):
+        self.model = model
+        self.__lock = threading.Lock()
+        self.__parts: Dict[str, Tuple[str, List[Tuple[str, str]]]] = {}
+
+    def terms(self, part: str) -> List[str]:
+        """Gets the terms of the given `part` of the index.
+
+        Args:
+            part (`str`): Part of the index (`names`, `topics` or `levels`).
+
+        Returns:
+            `List[str]`: The terms sorted by decreasing number of references.
+        """
+
+        return [term for term, _ in self.__entries(part, self.__stamps([part])[part])]
+
+    def search(self, prefix: str, limit: int) -> Dict[str, List[str]]:
+        """Gets the terms of each part of the index starting with the given `prefix`.
+
+        Args:
+            prefix (`str`): Case insensitive prefix of the terms.
+            limit (`int`): Maximum number of terms returned for each part.
+
+        Returns:
+            `Dict[str, List[str]]`: The `limit` most referenced matching terms of each part.
+        """
+
+        prefix = prefix.casefold()
+        stamps = self.__stamps(COMPLETION_PARTS)
+        result = {}
+        for part in COMPLETION_PARTS:
+            matches = result[part] = []
+            for term, folded in self.__entries(part, stamps[part]):
+                if len(matches) >= limit:
+                    break
+                if folded.startswith(prefix):
+                    matches.append(term)
+        return result
+
+    def invalidate(self, *parts: str):
+        """Forces all the processes to rebuild the given `parts` of the index (all by default)."""
+
+        CacheStamp.renew(*(self.__stamp_key(part) for part in parts or COMPLETION_PARTS))
+
+    def clear(self):
+        """Removes all the parts of the index from the local memory."""
+
+        with self.__lock:
+            self.__parts.clear()
+
+    def __stamps(self, parts: Iterable[str]) -> Dict[str, str]:
+        for part in parts:
+            if part not in COMPLETION_PARTS:
+                raise ValueError(f'{part}: unknown part of the completion index')
+
+        stamps = CacheStamp.get_many(self.__stamp_key(part) for part in parts)
+        return {part: stamps[self.__stamp_key(part)] for part in parts}
+
+    def __entries(self, part: str, stamp: str) -> List[Tuple[str, str]]:
+        with self.__lock:
+            entry = self.__parts.get(part)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        # the stamp is read before the terms so a concurrent change is seen by the next lookup
+        entries = [(term, term.casefold()) for term in self.__build(part)]
+        with self.__lock:
+            self.__parts[part] = (stamp, entries)
+        return entries
+
+    def __build(self, part: str) -> List[str]:
+        if part == 'names':
+            queryset = self.model.objects.all()
+            field = 'name'
+        else:
+            queryset = getattr(self.model, part).through.objects.all()
+            field = part[:-1]  # `topic` or `level` column of the through table
+
+        rows = queryset.order_by().values_list(field).annotate(count=Count('pk'))
+        return [term for term, _ in sorted(rows, key=lambda row: (-row[1], row[0]))]
+
+    def __stamp_key(self, part: str) -> str:
+        return f'pl_resources.completion.{self.model._meta.model_name}.{part}'
+
+
+CIRCLE_COMPLETION = CompletionIndex(Circle)
+RESOURCE_COMPLETION = CompletionIndex(Resource)
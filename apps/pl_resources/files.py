@@ -11,27 +11,80 @@
 # https://www.devdungeon.com/content/working-git-repositories-python
 # https://github.com/ishepard/pydriller/blob/master/pydriller/git.py
 
+import asyncio
+import atexit
+import base64
+import difflib
+import fcntl
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import mimetypes
 import os
+import posixpath
+import re
 import shutil
+import stat
 import subprocess
-import tempfile
+import threading
+import time
 import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
 from pathlib import Path
-from typing import Any, List, Literal, Optional, Tuple, TypedDict, Union
-from wsgiref.util import FileWrapper
+from struct import pack
+from typing import (Any, AsyncIterator, BinaryIO, Callable, Dict, Iterable, Iterator, List, Literal, NamedTuple,
+                    Optional, Set, Tuple, TypedDict, Union)
+from urllib.parse import quote
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.temp import NamedTemporaryFile
+from django.core.cache import caches
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.http.response import HttpResponse
-from git import Actor, Repo
-from git.objects import Blob, Tree
+from django.db import close_old_connections
+from django.http.response import HttpResponse, StreamingHttpResponse
+from django.utils.http import RFC3986_SUBDELIMS, quote_etag
+from git import Actor, Git, Repo
+from git.compat import defenc
+from git.index import IndexFile
+from git.index.fun import stat_mode_to_index_mode
+from git.index.typ import BaseIndexEntry, IndexEntry
+from git.objects import Blob, Commit, Tree
+from gitdb import IStream
+from gitdb.exc import BadName
+from pl_core.asgi import AsyncStreamingHttpResponse
 from rest_framework.request import Request
 from rest_framework.reverse import reverse
 
+from pl_resources.signals import directory_committed
+
 User = get_user_model()
+logger = logging.getLogger(__name__)
+CHUNK_SIZE = 64 * 1024
+STREAM_MIN_SIZE = 1024 * 1024  # files bigger than this size are streamed instead of being loaded in memory
 DIRECTORIES_ROOT = settings.DIRECTORIES_ROOT
+DIRECTORIES_REPO_POOL_SIZE = settings.DIRECTORIES_REPO_POOL_SIZE
+DIRECTORIES_TREE_CACHE_SIZE = settings.DIRECTORIES_TREE_CACHE_SIZE
+DIRECTORIES_TREE_CACHE_ALIAS = settings.DIRECTORIES_TREE_CACHE_ALIAS
+DIRECTORIES_BARE = settings.DIRECTORIES_BARE
+DIRECTORIES_SEARCH_LIMIT = settings.DIRECTORIES_SEARCH_LIMIT
+DIRECTORIES_SEARCH_MAX_FILE_SIZE = settings.DIRECTORIES_SEARCH_MAX_FILE_SIZE
+DIRECTORIES_EXECUTOR_WORKERS = settings.DIRECTORIES_EXECUTOR_WORKERS
+DIRECTORIES_LOCK_TIMEOUT = settings.DIRECTORIES_LOCK_TIMEOUT
+DIRECTORIES_COMMIT_DELAY = settings.DIRECTORIES_COMMIT_DELAY
+DIRECTORIES_UPLOAD_MAX_SIZE = settings.DIRECTORIES_UPLOAD_MAX_SIZE
+DIRECTORIES_UPLOAD_MAX_ENTRIES = settings.DIRECTORIES_UPLOAD_MAX_ENTRIES
+DIRECTORIES_DIFF_MAX_FILE_SIZE = settings.DIRECTORIES_DIFF_MAX_FILE_SIZE
+DIRECTORIES_BUNDLE_CACHE_SIZE = settings.DIRECTORIES_BUNDLE_CACHE_SIZE
+DIRECTORIES_BUNDLE_MAX_BASES = settings.DIRECTORIES_BUNDLE_MAX_BASES
+DIRECTORIES_MAINTENANCE_LOOSE_OBJECTS = settings.DIRECTORIES_MAINTENANCE_LOOSE_OBJECTS
+DIRECTORIES_MAINTENANCE_MAX_PACKS = settings.DIRECTORIES_MAINTENANCE_MAX_PACKS
+DIRECTORIES_MAINTENANCE_PRUNE_EXPIRE = settings.DIRECTORIES_MAINTENANCE_PRUNE_EXPIRE
 
 
 def uniquify_filename(directory, filename) -> Tuple[str, str]:
@@ -63,10 +116,336 @@ def uniquify_filename(directory, filename) -> Tuple[str, str]:
     return abspath, filename
 
 
+def is_git_path(path: str) -> bool:
+    """Checks whether the given relative `path` goes through a `.git` file or folder.
+
+    Such a path must never be written: it would reach the repository itself or be
+    committed as a `.git` tree entry (refused by `git fsck`) which is unsafe to checkout.
+    The comparison ignores the case like git does on case-insensitive filesystems.
+    """
+
+    return any(part.casefold() == '.git' for part in re.split(r'[/\\]', path))
+
+
+@contextmanager
+def open_archive(
+    data: InMemoryUploadedFile,
+    max_size: int = None,
+    max_entries: int = None,
+) -> Iterator[Tuple[zipfile.ZipFile, List[zipfile.ZipInfo]]]:
+    """Opens an uploaded zip archive without copying it and checks the extraction limits.
+
+    The archive is read from the uploaded file itself (memory or temporary file) so the
+    entries can be streamed to their destination one at a time. The sizes declared by the
+    archive can be trusted since `zipfile` stops reading an entry at its declared size and
+    checks its CRC.
+
+    Args:
+        data (`InMemoryUploadedFile`): The uploaded archive.
+        max_size (`int`, optional): Maximum total uncompressed size in bytes.
+            (default to `DIRECTORIES_UPLOAD_MAX_SIZE`)
+        max_entries (`int`, optional): Maximum number of files.
+            (default to `DIRECTORIES_UPLOAD_MAX_ENTRIES`)
+
+    Raises:
+        `ValueError`: If `data` is not a valid zip archive or if it exceeds one of the limits.
+
+    Yields:
+        `Tuple[zipfile.ZipFile, List[zipfile.ZipInfo]]`: The archive and its entries that are not folders.
+    """
+
+    max_size = DIRECTORIES_UPLOAD_MAX_SIZE if max_size is None else max_size
+    max_entries = DIRECTORIES_UPLOAD_MAX_ENTRIES if max_entries is None else max_entries
+
+    try:
+        data.seek(0)
+        with zipfile.ZipFile(data) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            if len(members) > max_entries:
+                raise ValueError(f'{data.name}: the archive contains more than {max_entries} files')
+            if sum(info.file_size for info in members) > max_size:
+                raise ValueError(f'{data.name}: the extracted files would exceed {max_size} bytes')
+            yield archive, members
+    except zipfile.BadZipFile as error:
+        raise ValueError(f'{data.name}: {error}') from error
+
+
+class RepoPool:
+    """Process-wide, size-bounded LRU pool of open `git.Repo` objects.
+
+    `Repo` objects keep persistent `git cat-file` processes and caches, so reusing
+    them across requests avoids paying their initialization on every call to `Directory.get`.
+    GitPython objects are not thread-safe, so each thread gets its own `Repo` for a given directory.
+
+    Args:
+        maxsize (`int`): Maximum number of `Repo` objects kept open.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.__lock = threading.Lock()
+        self.__repos: 'OrderedDict[Tuple[str, int], Repo]' = OrderedDict()
+
+    def get(self, name: str, path: Path) -> Repo:
+        """Gets an open `Repo` for the directory `name` located at `path`.
+
+        Args:
+            name (`str`): Name of the directory.
+            path (`Path`): Absolute path of the directory.
+
+        Returns:
+            `Repo`: A cached `Repo` object or a new one if there is no cached entry.
+        """
+
+        key = (str(name), threading.get_ident())
+        with self.__lock:
+            repo = self.__repos.get(key)
+            if repo is not None:
+                self.__repos.move_to_end(key)
+                return repo
+
+        repo = Repo(path)
+        evicted: List[Repo] = []
+        with self.__lock:
+            self.__repos[key] = repo
+            self.__repos.move_to_end(key)
+            while len(self.__repos) > self.maxsize:
+                evicted.append(self.__repos.popitem(last=False)[1])
+
+        for item in evicted:
+            item.close()
+        return repo
+
+    def invalidate(self, name: str):
+        """Closes and removes all the cached `Repo` objects of the directory `name`.
+
+        Args:
+            name (`str`): Name of the directory.
+        """
+
+        name = str(name)
+        with self.__lock:
+            keys = [key for key in self.__repos if key[0] == name]
+            evicted = [self.__repos.pop(key) for key in keys]
+
+        for item in evicted:
+            item.close()
+
+    def clear(self):
+        """Closes and removes all the cached `Repo` objects."""
+
+        with self.__lock:
+            evicted = list(self.__repos.values())
+            self.__repos.clear()
+
+        for item in evicted:
+            item.close()
+
+
+REPO_POOL = RepoPool(DIRECTORIES_REPO_POOL_SIZE)
+
+
+def git_actor(user: Optional[User]) -> Actor:
+    """Gets the git identity of the commits made by `user` (`admin` if `None`)."""
+
+    if user:
+        return Actor(user.username, getattr(user, 'email', 'admin@platon'))
+    return Actor('admin', 'admin@platon')
+
+
+def notify_commit(directory: 'Directory', before: Optional[str], after: str):
+    """Sends `directory_committed` signal once `HEAD` of `directory` moved from `before` to `after`.
+
+    The errors of the receivers are logged instead of being raised since the commit is already done.
+    """
+
+    responses = directory_committed.send_robust(
+        sender=directory.__class__,
+        directory=directory,
+        before=before,
+        after=after
+    )
+    for receiver, response in responses:
+        if isinstance(response, Exception):
+            logger.error(f'{receiver.__name__} failed to handle {after} of {directory.root.name}: {response}')
+
+
+DIRECTORIES_EXECUTOR = ThreadPoolExecutor(max_workers=DIRECTORIES_EXECUTOR_WORKERS, thread_name_prefix='directories')
+
+
+async def run_in_executor(function, *args) -> Any:
+    """Runs the blocking `function(*args)` inside `DIRECTORIES_EXECUTOR` without blocking the event loop."""
+
+    def call():
+        # the receivers of `directory_committed` use the database from the threads of the executor
+        close_old_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+
+    return await asyncio.get_running_loop().run_in_executor(DIRECTORIES_EXECUTOR, call)
+
+
+def iter_command(args: List[str], cwd: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Runs the command `args` and yields its standard output chunk by chunk.
+
+    The process is killed if the iteration stops before the end of the output
+    (e.g. the client closes the connection while downloading a file).
+
+    Args:
+        args (`List[str]`): The command to run.
+        cwd (`Path`): Working directory of the command.
+        chunk_size (`int`, optional): Maximum size of the yielded chunks.
+    """
+
+    process = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.wait()
+
+
+async def aiter_command(args: List[str], cwd: Path, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Asynchronous version of `iter_command` that does not block the event loop."""
+
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        while True:
+            chunk = await process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:  # pragma: no cover
+                pass
+        await process.wait()
+
+
+def iter_file(file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields the content of the opened `file` chunk by chunk then closes it."""
+
+    with file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def aiter_file(file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Asynchronous version of `iter_file` reading the chunks inside `DIRECTORIES_EXECUTOR`."""
+
+    with file:
+        while True:
+            chunk = await run_in_executor(file.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def aiter_response(streamed: StreamingHttpResponse) -> AsyncIterator[bytes]:
+    """Yields the content of the streaming response `streamed`, each chunk being read inside `DIRECTORIES_EXECUTOR`."""
+
+    chunks = iter(streamed)
+    try:
+        while True:
+            chunk = await run_in_executor(next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        await run_in_executor(streamed.close)
+
+
+def async_streaming_response(streamed: HttpResponse) -> HttpResponse:
+    """Converts a streaming response into an `AsyncStreamingHttpResponse` with the same headers.
+
+    Only one chunk of the content is held in memory at a time and it is read inside
+    `DIRECTORIES_EXECUTOR` (see `aiter_response`) so the event loop is never blocked.
+    """
+
+    if not streamed.streaming:
+        return streamed
+    response = AsyncStreamingHttpResponse(aiter_response(streamed), status=streamed.status_code)
+    for header, value in streamed.items():
+        response[header] = value
+    return response
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parses the value of a `Range` header for a content of `size` bytes.
+
+    Only single byte ranges are supported (`bytes=0-99`, `bytes=100-` and `bytes=-100`),
+    the other forms are ignored and the full content should be sent as allowed by RFC 7233.
+
+    Args:
+        header (`str`): The value of the `Range` header.
+        size (`int`): Size of the content in bytes.
+
+    Raises:
+        `ValueError`: If the range cannot be satisfied (a `416` response should be sent).
+
+    Returns:
+        `Optional[Tuple[int, int]]`: The first and last (inclusive) positions of the range or `None`.
+    """
+
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        return None  # invalid range, ignored
+
+    if not first:  # suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(f'{header}: unsatisfiable range')
+        return max(size - length, 0), size - 1
+
+    first = int(first)
+    if first >= size:
+        raise ValueError(f'{header}: unsatisfiable range')
+    return first, size - 1 if not last else min(int(last), size - 1)
+
+
+def iter_range(chunks: Iterable[bytes], first: int, last: int) -> Iterator[bytes]:
+    """Yields the bytes between the positions `first` and `last` (inclusive) of `chunks`.
+
+    The iteration over `chunks` stops as soon as the range is sent.
+    """
+
+    position = 0
+    for chunk in chunks:
+        end = position + len(chunk)
+        if end > first:
+            yield chunk[max(first - position, 0):last + 1 - position]
+        position = end
+        if position > last:
+            break
+
+
 class Version(TypedDict):
     name: str
     date: int
     message: str
+    target: str
 
 
 class TreeNode(TypedDict):
@@ -76,26 +455,226 @@ class TreeNode(TypedDict):
     children: Optional[List['TreeNode']]
 
 
+class TreeCache:
+    """Cache of the file trees listed by `Directory.read`.
+
+    A tree is identified by its git hash so its listing never changes, the entries
+    are stored without request specific urls and never expire. The entries are kept
+    in a local LRU cache and optionally in a django cache shared by all the processes.
+
+    Args:
+        maxsize (`int`): Maximum number of trees kept in the local memory.
+        alias (`str`, optional): Alias of the django cache to use as a shared cache.
+    """
+
+    def __init__(self, maxsize: int, alias: str = None):
+        self.maxsize = maxsize
+        self.alias = alias
+        self.__lock = threading.Lock()
+        self.__trees: 'OrderedDict[Tuple[str, str, str], List[TreeNode]]' = OrderedDict()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[List[TreeNode]]:
+        """Gets the tree cached for the given `(directory, hexsha, path)` key or `None`."""
+
+        with self.__lock:
+            tree = self.__trees.get(key)
+            if tree is not None:
+                self.__trees.move_to_end(key)
+                return tree
+
+        if self.alias:
+            tree = caches[self.alias].get(self.__shared_key(key))
+            if tree is not None:
+                self.__store(key, tree)
+        return tree
+
+    def set(self, key: Tuple[str, str, str], tree: List[TreeNode]):
+        """Caches the given `tree` for the given `(directory, hexsha, path)` key."""
+
+        self.__store(key, tree)
+        if self.alias:
+            caches[self.alias].set(self.__shared_key(key), tree, timeout=None)
+
+    def clear(self):
+        """Removes all the trees from the local memory."""
+
+        with self.__lock:
+            self.__trees.clear()
+
+    def __store(self, key: Tuple[str, str, str], tree: List[TreeNode]):
+        with self.__lock:
+            self.__trees[key] = tree
+            self.__trees.move_to_end(key)
+            while len(self.__trees) > self.maxsize:
+                self.__trees.popitem(last=False)
+
+    def __shared_key(self, key: Tuple[str, str, str]) -> str:
+        # paths may contain characters that are not supported by some cache backends
+        return 'pl_resources:tree:' + hashlib.sha1('\0'.join(key).encode()).hexdigest()
+
+
+TREE_CACHE = TreeCache(DIRECTORIES_TREE_CACHE_SIZE, DIRECTORIES_TREE_CACHE_ALIAS)
+
+
+def locked(method):
+    """Decorates a write method of `Directory` so that it runs while holding the lock of the directory."""
+
+    @functools.wraps(method)
+    def wrapper(self: 'Directory', *args, **kwargs):
+        with self.lock():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class CommitQueue:
+    """Coalesces the commits of the writes made to a directory within `delay` seconds.
+
+    The first write to a directory schedules a commit `delay` seconds later and the
+    paths of the following writes are added to it, so a burst of writes (an autosaving
+    editor, several co-editors...) creates a single commit instead of one commit per write.
+    The files are written immediately but they are only visible in the history once committed.
+
+    The author of the commit is the user of the first write and the users of the following
+    writes are credited with `Co-authored-by` trailers. `Directory.commit` commits the pending
+    changes of its directory first so they are never attributed to another commit.
+
+    Args:
+        delay (`float`): Number of seconds to wait before committing.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.__lock = threading.Lock()
+        self.__pending: Dict[str, Tuple[User, List[Actor], Set[str], List[str]]] = {}
+
+    def push(self, directory: 'Directory', message: str, paths: Iterable[str]):
+        """Schedules the commit of the `paths` changed in the `directory`.
+
+        Args:
+            directory (`Directory`): The changed directory.
+            message (`str`): Description of the change.
+            paths (`Iterable[str]`): Changed paths relative to the directory.
+        """
+
+        name = directory.root.name
+        with self.__lock:
+            pending = self.__pending.get(name)
+            if pending is None:
+                pending = self.__pending[name] = (directory.user, [], set(), [])
+                timer = threading.Timer(self.delay, self.__flush_timer, args=(name,))
+                timer.daemon = True
+                timer.start()
+            if directory.actor not in pending[1]:
+                pending[1].append(directory.actor)
+            pending[2].update(paths)
+            pending[3].append(message)
+
+    def take(self, name: str) -> Optional[Tuple[User, Set[str], str]]:
+        """Removes the pending changes of the directory `name` from the queue.
+
+        Args:
+            name (`str`): Name of the directory.
+
+        Returns:
+            `Optional[Tuple[User, Set[str], str]]`: The author, the paths and the message of
+                the commit of the pending changes or `None` if there is no pending change.
+        """
+
+        with self.__lock:
+            pending = self.__pending.pop(name, None)
+        if pending is None:
+            return None
+
+        user, actors, paths, messages = pending
+        message = messages[0] if len(messages) == 1 else f'{len(messages)} changes\n\n' + '\n'.join(messages)
+        trailers = [f'Co-authored-by: {actor.name} <{actor.email}>' for actor in actors[1:]]
+        if trailers:
+            message += '\n\n' + '\n'.join(trailers)
+        return user, paths, message
+
+    def flush(self, name: str = None):
+        """Commits the pending changes of the directory `name` (all the directories by default)."""
+
+        with self.__lock:
+            names = list(self.__pending) if name is None else [name]
+
+        for name in names:
+            pending = self.take(name)
+            if pending is None:
+                continue
+            user, paths, message = pending
+            path = Path(os.path.join(DIRECTORIES_ROOT, name))
+            try:
+                # a fresh repository since the pool is per thread and the thread of the timer is short-lived
+                with Repo(path) as repo:
+                    Directory(path, user, repo).commit(message, paths)
+            except Exception as error:
+                logger.error(f'failed to commit the pending changes of {name}: {error}')
+
+    def __flush_timer(self, name: str):
+        try:
+            self.flush(name)
+        finally:
+            close_old_connections()  # the receivers of the commit may use the database of the timer thread
+
+
+COMMIT_QUEUE = CommitQueue(DIRECTORIES_COMMIT_DELAY)
+atexit.register(COMMIT_QUEUE.flush)
+
+# depth of the `Directory.lock` held by the current thread for each git directory, shared by
+# all the `Directory` objects of the thread since `flock` is not reentrant across open files,
+# and the callbacks to run once the thread releases it (see `Directory.on_unlock`).
+LOCK_DEPTHS = threading.local()
+
+
+class SearchMatch(TypedDict):
+    path: str
+    line: int
+    column: int
+    match: str
+
+
+class FileChange(TypedDict):
+    path: str
+    status: Literal['added', 'deleted', 'modified', 'type-changed']
+    old_hexsha: Optional[str]
+    new_hexsha: Optional[str]
+    patch: Optional[str]
+
+
+class MaintenanceReport(TypedDict):
+    name: str
+    actions: List[str]
+    duration: float
+    loose_before: int
+    loose_after: int
+    packs_before: int
+    packs_after: int
+    size_before: int
+    size_after: int
+
+
+class TreeEntry(NamedTuple):
+    mode: str
+    type: str
+    hexsha: str
+    size: int
+    path: str
+
+
 class Directory:
     """Representation of a versioned directory.
     """
 
-    def __init__(self, root: Path, user: User):
+    def __init__(self, root: Path, user: User, repo: Repo = None):
         self.root = root.resolve()
         self.user = user
-        self.ignore_commits = False
-        self.repo = Repo(root)
-
-        if user:
-            with self.repo.config_writer() as cw:
-                cw.set_value('user', 'name', user.username)
-                cw.set_value('user', 'email', getattr(user, 'email', 'admin@platon'))
-                cw.release()
-        else:
-            with self.repo.config_writer() as cw:
-                cw.set_value('user', 'name', 'admin')
-                cw.set_value('user', 'email', getattr(user, 'email', 'admin@platon'))
-                cw.release()
+        self.repo = repo or Repo(root)
+        self.__transaction: Optional[Set[str]] = None
+
+        # the identity is given to each git command instead of being written to .git/config
+        self.actor = git_actor(user)
 
 
     # STATIC
@@ -115,18 +694,25 @@ class Directory:
             `FileNotFoundError`: If the directory does not exists.
 
         Returns:
-            `Directory`: A Directory object.
+            `Directory`: A Directory object (a `BareDirectory` if the repository is bare).
         """
 
         path = Path(os.path.join(DIRECTORIES_ROOT, str(name)))
         if not path.exists():
+            REPO_POOL.invalidate(name)
             raise FileNotFoundError(f'{name}: No such file or directory')
-        return cls(path, user)
+
+        repo = REPO_POOL.get(name, path)
+        if repo.bare:
+            return BareDirectory(path, user, repo)
+        return cls(path, user, repo)
 
     @classmethod
     def create(cls, name: str, user: User = None) -> 'Directory':
         """Creates new directory tree.
 
+        The directory is stored as a bare repository if `DIRECTORIES_BARE` setting is enabled.
+
         Args:
             name (`str`): Name of the directory to create.
         Returns:
@@ -138,13 +724,13 @@ class Directory:
             return cls.get(name, user)
 
         path.mkdir(parents=True, exist_ok=True)
-        Repo.init(path)
+        Repo.init(path, bare=DIRECTORIES_BARE)
 
-        directory = cls(path, user)
+        directory = cls.get(name, user)
 
         # create a file to force git to create master branch
-        directory.create_file('.keep')
-        directory.commit('init')
+        with directory.transaction('init'):
+            directory.create_file('.keep')
 
         return directory
 
@@ -158,6 +744,7 @@ class Directory:
             `bool`: `True` if deleted `False` otherwise.
         """
 
+        REPO_POOL.invalidate(name)
         path = Path(os.path.join(DIRECTORIES_ROOT, str(name)))
         if not path.exists():
             return False
@@ -214,6 +801,7 @@ class Directory:
         return self.__as_abspath(path).is_file()
 
 
+    @locked
     def move(self, src: str, dst: str, copy: bool = False):
         """Moves the file/folder `src` to `dst`
 
@@ -244,11 +832,12 @@ class Directory:
                 shutil.copytree(abs_src_path, abs_dst_path)
             else:
                 shutil.copyfile(abs_src_path, abs_dst_path)
+            self.__changed(f'copy {src} to {dst}', abs_dst_path)
         else:
             shutil.move(abs_src_path, abs_dst_path)
+            self.__changed(f'move {src} to {dst}', abs_src_path, abs_dst_path)
 
-        self.commit(f'move {src} to {dst}')
-
+    @locked
     def remove(self, path: str):
         """Delete the file/folder at the given `path`.
 
@@ -270,10 +859,11 @@ class Directory:
         elif abspath.is_dir():
             shutil.rmtree(abspath)
 
-        self.commit(f'delete {path}')
+        self.__changed(f'delete {path}', abspath)
 
         return True
 
+    @locked
     def rename(self, oldpath: str, newpath: str):
         """Rename `oldpath` to `newpath`.
 
@@ -304,8 +894,9 @@ class Directory:
 
         oabspath.rename(nabspath)
 
-        self.commit(f'rename {oldpath} to {newpath}')
+        self.__changed(f'rename {oldpath} to {newpath}', oabspath, nabspath)
 
+    @locked
     def create_dir(self, path: str):
         """Creates a new directory at the given `path`
 
@@ -322,8 +913,9 @@ class Directory:
         abspath = self.__as_abspath(path)
         abspath.mkdir(parents=False, exist_ok=False)
         abspath.joinpath('./.keep').touch()  # allow to list empty directories
-        self.commit(f'create {path}')
+        self.__changed(f'create {path}', abspath)
 
+    @locked
     def create_file(self, path: str, content: str = None):
         """Creates a new file at the given `path`
 
@@ -343,10 +935,11 @@ class Directory:
         if content:
             abspath.write_text(content)
 
-        self.commit(f'create {path}')
+        self.__changed(f'create {path}', abspath)
 
     # WRITE
 
+    @locked
     def write_text(self, path: str, data: str):
         """Write text at the given `path`
 
@@ -364,8 +957,9 @@ class Directory:
         abspath = self.__as_abspath(path)
         abspath.write_text(data)
 
-        self.commit(f'update {path}')
+        self.__changed(f'update {path}', abspath)
 
+    @locked
     def write_bytes(self, path: str, data: bytes):
         """Write bytes at the given `path`
 
@@ -383,8 +977,9 @@ class Directory:
         abspath = self.__as_abspath(path)
         abspath.write_bytes(data)
 
-        self.commit(f'update {path}')
+        self.__changed(f'update {path}', abspath)
 
+    @locked
     def write_file(
         self,
         path: str,
@@ -396,12 +991,14 @@ class Directory:
         Args:
             path (`str`): A path relative to the directory.
             data: File to write.
+            unzip (`bool`, optional): Extract the content of `data` if it is a zip archive.
 
         Raises:
             `TypeError`: If `path` is null or empty.
             `FileNotFoundError`: If `path` does not points to an existing file.
             `FileExistsError`: If `path` points to an existing file.
             `PermissionError`: If `path` points to a file outside of the current directory.
+            `ValueError`: If `data` is an invalid zip archive or exceeds the extraction limits.
         """
 
         path = "." if not path else path
@@ -410,6 +1007,27 @@ class Directory:
         if not abspath.is_dir():
             raise NotADirectoryError("[Errno 20] No such directory: '{path}'")
 
+        message = f'upload {data.name} into {path}'
+        if unzip and data.content_type == 'application/zip':
+            # the entries are streamed from the upload to their destination and only
+            # the extracted files are staged, the zip itself is never written to the disk.
+            with self.transaction(message), open_archive(data) as (archive, members):
+                targets = [
+                    (info, self.__as_abspath(posixpath.join(path, info.filename)))
+                    for info in members
+                ]
+                for info, target in targets:
+                    # registered before being written so a failed copy is rolled back with the created folders
+                    created = next((parent for parent in reversed(target.parents) if not parent.exists()), None)
+                    self.__changed(message, *([created] if created else []), target)
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    with archive.open(info) as source, target.open('wb') as destfile:
+                        shutil.copyfileobj(source, destfile, CHUNK_SIZE)
+            return
+
+        if is_git_path(data.name):
+            raise PermissionError(f'{data.name}: points to an invalid file')
+
         abspath, _ = uniquify_filename(abspath, data.name)
         abspath = Path(abspath)
 
@@ -417,11 +1035,7 @@ class Directory:
             for chunk in data.chunks():
                 destfile.write(chunk)
 
-        if unzip and data.content_type == 'application/zip':
-            shutil.unpack_archive(abspath, abspath.parent)
-            abspath.unlink()  # delete the zip
-
-        self.commit(f'upload {data.name} into {path}')
+        self.__changed(message, abspath)
 
     # READ
 
@@ -429,26 +1043,41 @@ class Directory:
         self,
         path: str = ".",
         version: str = "master",
-        request: Request = None
+        request: Request = None,
+        depth: int = None,
+        cursor: str = None,
+        limit: int = None
     ) -> Union[bytes, List[TreeNode]]:
         """Gets the file tree or the file at the given `path` for the given the `version`.
 
+        Big trees can be loaded lazily: `depth` limits the number of expanded levels (the folders
+        of the last level have `None` children, unlike the empty folders which have an empty list,
+        and the levels below are not read) and `cursor`/`limit` paginate the entries of `path`.
+
         Args:
             path (`str`, optional): Path to a file/directory. Defaults to `.` which means the root.
             version (`str`, optional): Specify which version (v1..vN) to find. Defaults to "master".
+            depth (`int`, optional): Number of levels to include (`1` means only the entries of `path`).
+            cursor (`str`, optional): `next_cursor` of the previous page.
+            limit (`int`, optional): Maximum number of entries of `path` to include.
+
+        Raises:
+            `ValueError`: If `depth` or `limit` are not positive or if `cursor` is invalid.
 
         Returns:
             List[TreeNode]: A recursive list of TreeNode objects.
         """
 
-        path = "." if not path else path
-        object = self.repo.tree(version)
+        if (depth is not None and depth < 1) or (limit is not None and limit < 1):
+            raise ValueError('"depth" and "limit" should be positive integers')
 
-        if path != ".":
-            object = object[path]
+        path = "." if not path else path
+        object = self.__resolve(path, version)
 
         if object.type == "tree":
-            return self.__list_files(object, path, version, request=request)
+            return self.__list_files(
+                object, path, version, request=request, depth=depth, cursor=cursor, limit=limit
+            )
 
         return object.data_stream.read()
 
@@ -459,203 +1088,1016 @@ class Directory:
         version: str = "master",
         match_word: bool = False,
         match_case: bool = False,
-        use_regex: bool = False
-    ):
-        if not query:
-            raise TypeError('argument "query" is missing')
+        use_regex: bool = False,
+        limit: int = DIRECTORIES_SEARCH_LIMIT
+    ) -> List[SearchMatch]:
+        """Searches `query` inside the files of `path` at the given `version`.
 
-        args = []
-        args.append("-I")  # no binary files
-        if not use_regex:
-            args.append("-F")
+        See `iter_search` for the description of the arguments.
+
+        Returns:
+            `List[SearchMatch]`: At most `limit` matches.
+        """
 
-        args.append("--full-name")  # forces paths to be output relative to repo root
-        args.append("-n")  # line numbers
+        return list(self.iter_search(
+            query,
+            path=path,
+            version=version,
+            match_word=match_word,
+            match_case=match_case,
+            use_regex=use_regex,
+            limit=limit
+        ))
+
+    def iter_search(
+        self,
+        query: str,
+        path: str = ".",
+        version: str = "master",
+        match_word: bool = False,
+        match_case: bool = False,
+        use_regex: bool = False,
+        limit: int = None,
+        cancel: threading.Event = None
+    ) -> Iterator[SearchMatch]:
+        """Lazily searches `query` inside the files of `path` at the given `version`.
 
-        if match_word:
-            args.append("-w")
+        The blobs are read from the object database of the process so the search neither
+        spawns a command per query nor depends on the current working directory.
+        Binary files are ignored like `git grep -I` does (only the head of the blobs is
+        read to detect them) and so are the files bigger than `DIRECTORIES_SEARCH_MAX_FILE_SIZE`.
 
-        if not match_case:
-            args.append('-i')
+        Args:
+            query (`str`): The text (or regular expression) to search.
+            path (`str`, optional): Path to a file/directory. Defaults to `.` which means the root.
+            version (`str`, optional): Specify which version (v1..vN) to search. Defaults to "master".
+            match_word (`bool`, optional): Only match whole words.
+            match_case (`bool`, optional): Make the search case sensitive.
+            use_regex (`bool`, optional): Interpret `query` as a regular expression.
+            limit (`int`, optional): Maximum number of matches to yield.
+            cancel (`threading.Event`, optional): Stops the search once set.
+
+        Raises:
+            `TypeError`: If `query` is null or empty.
+            `ValueError`: If `query` is not a valid regular expression.
 
-        args.append(f'"{query}"')
-        args.append(version)
+        Yields:
+            `SearchMatch`: The matches ordered by path then by position, one per line.
+        """
 
-        if path != "." and path != '':
-            args.append("--")
-            args.append(path)
+        if not query:
+            raise TypeError('argument "query" is missing')
 
-        # https://git-scm.com/docs/git-grep
-        cwd = os.getcwd()
+        pattern = query if use_regex else re.escape(query)
+        if match_word:
+            pattern = rf'(?<!\w)(?:{pattern})(?!\w)'
         try:
-            os.chdir(self.root)
-            command = "git grep " + " ".join(args)
-            p = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True
-            )
-            out, err = p.communicate()
-        finally:
-            os.chdir(cwd)
-        ret, out, err = p.returncode, out.decode().strip("\n"), err.decode()
-
-        prefix = len(f'{version}:')
-
-        def parse_match(match):
-            match = match[prefix:]
-            tokens = match.split(':')
-            return {
-                "path": tokens[0],
-                "line": tokens[1],
-                "match": "".join(tokens[2:])
-            }
+            regex = re.compile(pattern, 0 if match_case else re.IGNORECASE)
+        except re.error as error:
+            raise ValueError(f'{query}: invalid regular expression ({error})')
 
-        if not err:
-            return [] if not out else ([parse_match(m) for m in out.split('\n')])
-        else:  # pragma: no cover
-            raise Exception(f'{out}: {err}')
+        path = "." if not path else path
+        object = self.__resolve(path, version)
+        if object.type == 'tree':
+            prefix = object.path + '/' if object.path else ''
+            blobs = [
+                (prefix + entry.path, bytes.fromhex(entry.hexsha), entry.size)
+                for entry in self.__ls_tree(object) if entry.type == 'blob'
+            ]
+        else:
+            blobs = [(object.path, object.binsha, self.repo.odb.info(object.binsha).size)]
+
+        count = 0
+        for blobpath, binsha, size in blobs:
+            if cancel is not None and cancel.is_set():
+                return
+            if size > DIRECTORIES_SEARCH_MAX_FILE_SIZE:
+                continue
+
+            # the whole blob is read before the next lookup since the stream is a part of the output
+            # of the `git cat-file --batch` process shared by the repository.
+            stream = self.repo.odb.stream(binsha)
+            head = stream.read(8000)
+            rest = stream.read()
+            if b'\0' in head:  # same heuristic as git to detect binary files
+                continue
+
+            text = (head + rest).decode(defenc, 'replace')
+            for number, line in enumerate(text.splitlines(), start=1):
+                match = regex.search(line)
+                if match is None:
+                    continue
+                yield {
+                    'path': blobpath,
+                    'line': number,
+                    'column': match.start() + 1,
+                    'match': line,
+                }
+                count += 1
+                if limit is not None and count >= limit:
+                    return
 
     # GIT
 
+    @locked
     def merge(self, bundle: InMemoryUploadedFile) -> Any:
         path = os.path.join(DIRECTORIES_ROOT, str(uuid.uuid4()) + '.git')
         with open(path, 'wb+') as file:
             for chunk in bundle.chunks():
                 file.write(chunk)
-        self.repo.git.pull(path)
+        before = self.repo.head.commit.hexsha
+        self.repo.git.pull(path, env=self._environ())
         Path(path).unlink()
 
-    def commit(self, message: str) -> bool:
-        if self.ignore_commits:
-            return False
+        after = self.repo.head.commit.hexsha
+        if before != after:
+            notify_commit(self, before, after)
 
-        if not self.repo.is_dirty(untracked_files=True):
-            return False
+    @locked
+    def commit(self, message: str, paths: Iterable[str] = None) -> bool:
+        """Commits the changes of the working tree.
 
-        self.repo.git.add('--all')
-        author = None
-        committer = None
-        if self.user:
-            author = Actor(self.user.username, self.user.email)
-            committer = Actor(self.user.username, self.user.email)
+        The changes of the directory waiting in `COMMIT_QUEUE` are committed before, with
+        their own author and message.
 
-        self.repo.index.commit(message, author=author, committer=committer)
+        Args:
+            message (`str`): The commit message.
+            paths (`Iterable[str]`, optional): Paths (relative to the directory) to stage.
+                The whole working tree is scanned and staged if not specified.
 
-        return True
+        Returns:
+            `bool`: `True` if a commit is created `False` if there is nothing to commit.
+        """
 
-    def describe(self) -> str:
-        return self.repo.git.describe('--always')
+        self.__commit_pending()
+        return self.__commit(message, paths, self.actor)
 
-    def bundle(self, version: str = "master") -> HttpResponse:
-        path = os.path.join(tempfile.gettempdir(), str(uuid.uuid4()) + '.git')
-        self.repo.git.bundle('create', path, 'HEAD', version)
-        with open(path, 'rb') as file:
-            response = HttpResponse(content_type="application/force-download")
-            response['Content-Disposition'] = f'attachment; filename=bundle.git'
-            response.write(file.read())
-            return response
+    @contextmanager
+    def transaction(self, message: str):
+        """Batches the write operations made inside the `with` block into a single commit.
 
-    def download(self, path: str = '.', version: str = "master") -> HttpResponse:
-        abspath = self.__as_abspath(path, authorize_root=True)
-        if abspath.is_file():
-            tree = self.repo.tree(version)
-            response = HttpResponse(content_type="application/force-download")
-            response['Content-Disposition'] = f'attachment; filename={os.path.basename(path)}'
-            response.write(tree[path].data_stream.read())
-            return response
+        Only the paths touched by the operations are staged. If an exception is raised
+        inside the block, the touched paths are restored to their state in `HEAD` and
+        nothing is committed. Nested transactions are merged into the outermost one.
 
-        relpath = str(abspath.relative_to(self.root))
-        with NamedTemporaryFile(suffix='.zip') as zip:
-            self.repo.archive(zip, version, path=None if relpath == "." else relpath)
+        Usage:
 
-            # https://docs.python.org/3/library/tempfile.html#examples
-            zip.seek(0)
+        ```python
+        with directory.transaction('create files'):
+            directory.create_dir('src')
+            directory.create_file('src/main.py', 'print("hello")')
+        ```
 
-            response = HttpResponse(FileWrapper(zip), content_type='application/zip')
-            response['Content-Disposition'] = f'attachment; filename=archive.zip'
-            return response
+        Args:
+            message (`str`): The commit message.
+        """
 
-    def list_versions(self) -> List[Version]:
-        """List all versions of the directory.
+        if self.__transaction is not None:
+            yield self
+            return
+
+        with self.lock():
+            # the pending changes are committed first so the writes of the block are not attributed to them
+            self.__commit_pending()
+            self.__transaction = set()
+            try:
+                yield self
+                self.commit(message, self.__transaction)
+            except BaseException:
+                self.__rollback(self.__transaction)
+                raise
+            finally:
+                self.__transaction = None
+
+    @contextmanager
+    def lock(self):
+        """Locks the directory against the writes of the other threads and processes.
+
+        The lock is an exclusive `flock` on a file inside the git directory so it works across
+        the workers of a deployment sharing `DIRECTORIES_ROOT`. It is reentrant for the thread
+        that holds it, whatever the `Directory` object used to take it. The write operations take
+        it automatically.
+
+        Raises:
+            `TimeoutError`: If the lock cannot be acquired within `DIRECTORIES_LOCK_TIMEOUT` seconds.
         """
 
-        return [
-            {
-                'name': item.name,
-                'date': item.tag.tagged_date,
-                'message': item.tag.message
-            }
-            for item in self.repo.tags
-        ]
+        depths: Dict[str, int] = vars(LOCK_DEPTHS).setdefault('depths', {})
+        callbacks: Dict[str, List[Callable[[], Any]]] = vars(LOCK_DEPTHS).setdefault('callbacks', {})
+        key = os.path.realpath(self.repo.git_dir)
+        if depths.get(key):
+            depths[key] += 1
+            try:
+                yield self
+            finally:
+                depths[key] -= 1
+            return
 
-    def create_version(self, name: str, message: str) -> Version:
-        """Creates new version of the directory by tagging the current git index.
+        lockfile = open(os.path.join(self.repo.git_dir, 'platon.lock'), 'w')
+        try:
+            deadline = time.monotonic() + DIRECTORIES_LOCK_TIMEOUT
+            while True:
+                try:
+                    fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f'{self.root.name}: the directory is locked by another writer')
+                    time.sleep(0.01)
+
+            depths[key] = 1
+            try:
+                yield self
+            finally:
+                del depths[key]
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+        finally:
+            lockfile.close()
+            for callback in callbacks.pop(key, []):
+                try:
+                    callback()
+                except Exception as error:
+                    logger.error(f'{callback} failed after unlocking {self.root.name}: {error}')
 
-        Args:
-            name (`str`): Name of the release.
-            message (`str`): Message associated to the release.
+    def on_unlock(self, callback: Callable[[], Any]):
+        """Calls `callback` once the current thread releases the lock of the directory.
 
-        Returns:
-            `Version`: The newly created version.
+        The receivers of `directory_committed` are called under the lock: slow work such as
+        indexing the changed files should be deferred with this method so the other writers
+        do not wait for it. `callback` is called immediately if the lock is not held and its
+        errors are logged.
+
+        Args:
+            callback (`Callable[[], Any]`): Function to call without arguments.
         """
 
-        object = self.repo.create_tag(name, message=message)
+        key = os.path.realpath(self.repo.git_dir)
+        if not vars(LOCK_DEPTHS).get('depths', {}).get(key):
+            callback()
+            return
+        vars(LOCK_DEPTHS).setdefault('callbacks', {}).setdefault(key, []).append(callback)
 
-        return {
-            'name': object.name,
-            'date': object.tag.tagged_date,
-            'message': object.tag.message
-        }
+    def etag(
+        self,
+        path: str = ".",
+        version: str = "master",
+        variant: str = None,
+        bases: Iterable[str] = None,
+    ) -> str:
+        """Gets a strong ETag identifying the content of `path` at the given `version`.
 
+        The ETag is derived from the git hashes so it can be computed without reading
+        the content of the objects. The `download` variant of a folder depends on the
+        commit and the path since its zip archive embeds the commit id and time.
 
-    # PRIVATE
+        Args:
+            path (`str`, optional): Path to a file/directory. Defaults to `.` which means the root.
+            version (`str`, optional): Specify which version (v1..vN) to find. Defaults to "master".
+            variant (`str`, optional): Representation of the content (`download`, `git-bundle`...).
+            bases (`Iterable[str]`, optional): Commits excluded from the `git-bundle` variant (see `bundle`).
 
+        Returns:
+            `str`: A quoted ETag.
+        """
 
-    def __iterate(self, object: Union[Tree, Blob], version: str, request=None) -> TreeNode:
-        node: TreeNode = {
-            'path': object.path,
-            'size': object.size,
-            'type': 'folder' if object.type == 'tree' else 'file',
-            'hexsha': object.hexsha
-        }
+        if variant == 'git-bundle':
+            hexsha, _ = self.__bundle_key(version, bases)
+        else:
+            path = "." if not path else path
+            object = self.__resolve(path, version)
+            hexsha = object.hexsha
+            if variant == 'download' and object.type == 'tree':
+                commit = self.repo.commit(version)
+                hexsha = hashlib.sha1(f'{commit.hexsha}\0{posixpath.normpath(path)}'.encode()).hexdigest()
+        return quote_etag(f'{variant}-{hexsha}' if variant else hexsha)
 
-        if node['type'] == 'folder':
-            children: List[TreeNode] = []
-            for o in object:
-                if os.path.basename(o.path).startswith('.'):
-                    continue
-                children.append(self.__iterate(o, version, request))
+    def describe(self) -> str:
+        return self.repo.git.describe('--always')
 
-            node['children'] = sorted(
-                children,
-                key=lambda x: (x['type'], x['path'])
-            )
-        else:
-            node['mime'] = object.mime_type
+    def iter_changes(
+        self,
+        before: Optional[str],
+        after: str,
+        max_size: int = None
+    ) -> Iterator[Tuple[str, Optional[str]]]:
+        """Lists the files changed between the commits `before` and `after`.
 
-        if request:
-            self.__build_urls(node, version, request)
+        Args:
+            before (`str`, optional): A commit hexsha. All the files of `after` are listed if `None`.
+            after (`str`): A commit hexsha.
+            max_size (`int`, optional): Files bigger than this size (in bytes) are not read.
 
-        return node
+        Yields:
+            `Tuple[str, Optional[str]]`: The path of each changed file and its new text content
+            which is `None` if the file is deleted, binary or bigger than `max_size`.
+        """
 
-    def __build_urls(self, object: Any, version: str, request):
-        kwargs = {
-            'directory': self.root.name,
-        }
+        args = ['-r', '-z', '--no-renames', '--no-commit-id']
+        args += [before, after] if before else ['--root', after]
+        tokens = self.repo.git.diff_tree(*args, stdout_as_string=False).split(b'\0')
 
-        if object['path'] != '.':
-            kwargs['path'] = object['path']
+        # each change is written as ":<old mode> <new mode> <old sha> <new sha> <status>\0<path>\0"
+        for info, path in zip(tokens[0::2], tokens[1::2]):
+            _, mode, _, hexsha, status = info.decode().split(' ')
+            path = path.decode(defenc, 'surrogateescape')
+            if status == 'D' or mode == '160000':  # deleted file or submodule
+                yield path, None
+                continue
+
+            blob = Blob(self.repo, bytes.fromhex(hexsha), int(mode, 8), path)
+            if max_size is not None and blob.size > max_size:
+                yield path, None
+                continue
+
+            data = blob.data_stream.read()
+            yield path, None if b'\0' in data else data.decode(defenc, 'replace')
+
+    def diff(
+        self,
+        base: str,
+        version: str = "master",
+        path: str = ".",
+        patch: bool = False,
+    ) -> List[FileChange]:
+        """Lists the files of `path` changed between the versions `base` and `version`.
+
+        The changes are computed by `git diff-tree` which compares the hashes of the trees
+        so the unchanged folders are skipped without being read.
+
+        Args:
+            base (`str`): The version (a tag, a branch or a commit hexsha) to compare with.
+            version (`str`, optional): Specify which version (v1..vN) to compare. Defaults to "master".
+            path (`str`, optional): Path to a file/directory. Defaults to `.` which means the root.
+            patch (`bool`, optional): Include the unified diff of each changed text file.
+                Binary files and files bigger than `DIRECTORIES_DIFF_MAX_FILE_SIZE` have no patch.
+
+        Raises:
+            `ValueError`: If `base` or `version` does not exists.
+
+        Returns:
+            `List[FileChange]`: The changed files sorted by path.
+        """
+
+        abspath = self.__as_abspath("." if not path else path, authorize_root=True)
+        relpath = abspath.relative_to(self.root).as_posix()
+
+        try:
+            commits = [self.repo.commit(base).hexsha, self.repo.commit(version).hexsha]
+        except (BadName, ValueError) as error:
+            raise ValueError(f'{error}: No such version')
+
+        args = ['-r', '-z', '--no-renames', '--no-commit-id', *commits]
+        if relpath != '.':
+            args += ['--', relpath]
+        tokens = self.repo.git.diff_tree(*args, stdout_as_string=False).split(b'\0')
+
+        changes: List[FileChange] = []
+        statuses = {'A': 'added', 'D': 'deleted', 'M': 'modified', 'T': 'type-changed'}
+        for info, path in zip(tokens[0::2], tokens[1::2]):
+            old_mode, mode, old_hexsha, hexsha, status = info.decode().lstrip(':').split(' ')
+            path = path.decode(defenc, 'surrogateescape')
+            old = self.__read_text(old_hexsha, old_mode) if patch else None
+            new = self.__read_text(hexsha, mode) if patch else None
+            changes.append({
+                'path': path,
+                'status': statuses.get(status[0], 'modified'),
+                'old_hexsha': None if status == 'A' else old_hexsha,
+                'new_hexsha': None if status == 'D' else hexsha,
+                'patch': None if old is None or new is None else ''.join(difflib.unified_diff(
+                    old,
+                    new,
+                    '/dev/null' if status == 'A' else f'a/{path}',
+                    '/dev/null' if status == 'D' else f'b/{path}',
+                )),
+            })
+        return changes
+
+    def bundle(self, version: str = "master", bases: Iterable[str] = None) -> StreamingHttpResponse:
+        """Streams a git bundle containing the history of `HEAD` and `version`.
+
+        A client that already has some commits can list them in `bases` to receive an incremental
+        bundle with only the missing objects (the bases become the prerequisites of the bundle).
+        The bases unknown to the directory are ignored.
+
+        The bundles are cached inside the git directory for each (`HEAD`, `version`, `bases`) so the
+        clients syncing from the same commits download the same file without running git again.
+        Only the `DIRECTORIES_BUNDLE_CACHE_SIZE` most recently used bundles are kept and only the
+        first `DIRECTORIES_BUNDLE_MAX_BASES` bases are considered.
+
+        Args:
+            version (`str`, optional): Specify which version (v1..vN) to bundle. Defaults to "master".
+            bases (`Iterable[str]`, optional): Commits already known by the client.
+
+        Raises:
+            `ValueError`: If the bases already contain `HEAD` and `version` (the bundle would be empty).
+
+        Returns:
+            `StreamingHttpResponse`: A response streaming the bundle.
+        """
+
+        file = self.__bundle_file(version, bases)
+        response = StreamingHttpResponse(iter_file(file), content_type="application/force-download")
+        response['Content-Length'] = str(os.fstat(file.fileno()).st_size)
+        response['Content-Disposition'] = 'attachment; filename=bundle.git'
+        return response
+
+    def download(self, path: str = '.', version: str = "master", range: str = None) -> HttpResponse:
+        """Downloads the file at the given `path` or a zip archive if `path` points to a directory.
+
+        The content of a file is read from the object database of the repository if it is not
+        bigger than `STREAM_MIN_SIZE`, otherwise from a `git cat-file` command chunk by chunk
+        (and streamed if the requested part is still bigger). A part of the file can be requested
+        with `range`, the value of a `Range` header, to resume an interrupted download.
+
+        Args:
+            path (`str`, optional): Path to a file/directory. Defaults to `.` which means the root.
+            version (`str`, optional): Specify which version (v1..vN) to find. Defaults to "master".
+            range (`str`, optional): Value of the `Range` header of the request (ignored for directories).
+
+        Returns:
+            `HttpResponse`: A response with the content (or a part of the content) of the file or a streamed
+            zip archive.
+        """
+
+        abspath = self.__as_abspath(path, authorize_root=True)
+        relpath = str(abspath.relative_to(self.root))
+
+        object = self.__resolve(relpath, version)
+        if object.type == 'blob':
+            return self.__blob_response(object, os.path.basename(path), range)
+
+        response = StreamingHttpResponse(self.iter_archive(relpath, version), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename=archive.zip'
+        return response
+
+    def iter_bundle(self, version: str = "master", bases: Iterable[str] = None) -> Iterator[bytes]:
+        """Iterates over the content of the git bundle of `HEAD` and `version` chunk by chunk (see `bundle`)."""
+
+        return iter_file(self.__bundle_file(version, bases))
+
+    def aiter_bundle(self, version: str = "master", bases: Iterable[str] = None) -> AsyncIterator[bytes]:
+        """Asynchronous version of `iter_bundle` to use with ASGI responses.
+
+        The bundle is created (if not cached) before returning so this method should be
+        called inside the executor (see `AsyncDirectory`).
+        """
+
+        return aiter_file(self.__bundle_file(version, bases))
+
+    def iter_archive(self, path: str = ".", version: str = "master") -> Iterator[bytes]:
+        """Iterates over the content of the zip archive of `path` at `version` chunk by chunk."""
+
+        self.__resolve(path, version)
+        return iter_command(self.__archive_args(path, version), self.root)
+
+    def aiter_archive(self, path: str = ".", version: str = "master") -> AsyncIterator[bytes]:
+        """Asynchronous version of `iter_archive` to use with ASGI responses."""
+
+        self.__resolve(path, version)
+        return aiter_command(self.__archive_args(path, version), self.root)
+
+    def list_versions(self) -> List[Version]:
+        """List all versions of the directory.
+
+        The versions are read from a cache file of the git directory kept up to date by
+        `create_version`. The cache is rebuilt with a single `git for-each-ref` if the
+        tags were changed by another way (its stamp is the modification time of the refs).
+        """
+
+        try:
+            with open(self.__versions_path()) as file:
+                cache = json.load(file)
+            if cache['stamp'] == self.__versions_stamp():
+                return cache['versions']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        versions = self.__read_versions()
+        self.__cache_versions(versions)
+        return versions
+
+    @locked
+    def create_version(self, name: str, message: str) -> Version:
+        """Creates new version of the directory by tagging the current git index.
+
+        Args:
+            name (`str`): Name of the release.
+            message (`str`): Message associated to the release.
+
+        Returns:
+            `Version`: The newly created version.
+        """
+
+        versions = self.list_versions()
+        object = self.repo.create_tag(name, message=message, env=self._environ())
+
+        version: Version = {
+            'name': object.name,
+            'date': object.tag.tagged_date,
+            'message': object.tag.message,
+            'target': object.commit.hexsha,
+        }
+        self.__cache_versions(sorted([*versions, version], key=lambda item: item['name']))
+        return version
+
+    def count_objects(self) -> Dict[str, int]:
+        """Counts the objects of the repository with `git count-objects -v`.
+
+        Returns:
+            `Dict[str, int]`: The statistics of git (`count`, `size`, `in-pack`, `packs`, `size-pack`...),
+            sizes are in KiB.
+        """
+
+        counts = {}
+        for line in self.repo.git.count_objects('-v').splitlines():
+            key, _, value = line.partition(':')
+            counts[key.strip()] = int(value)
+        return counts
+
+    def maintain(
+        self,
+        loose_objects: int = None,
+        max_packs: int = None,
+        force: bool = False,
+    ) -> MaintenanceReport:
+        """Repacks the repository if it has too many loose objects or packs.
+
+        Each commit adds loose objects to the repository so reading the history becomes slower
+        over time. When the number of loose objects reaches `loose_objects` they are moved
+        into a new pack, when there are more than `max_packs` packs everything is repacked into
+        a single pack. The unreachable objects older than `DIRECTORIES_MAINTENANCE_PRUNE_EXPIRE`
+        are then pruned and the commit-graph is rewritten. The writes are blocked meanwhile.
+
+        Args:
+            loose_objects (`int`, optional): Minimum number of loose objects to repack.
+                (default to `DIRECTORIES_MAINTENANCE_LOOSE_OBJECTS`)
+            max_packs (`int`, optional): Maximum number of packs before a full repack.
+                (default to `DIRECTORIES_MAINTENANCE_MAX_PACKS`)
+            force (`bool`, optional): Fully repack the repository whatever its statistics.
+
+        Raises:
+            `TimeoutError`: If the lock of the directory cannot be acquired.
+
+        Returns:
+            `MaintenanceReport`: The actions run and the statistics before and after the maintenance.
+        """
+
+        loose_objects = DIRECTORIES_MAINTENANCE_LOOSE_OBJECTS if loose_objects is None else loose_objects
+        max_packs = DIRECTORIES_MAINTENANCE_MAX_PACKS if max_packs is None else max_packs
+
+        start = time.monotonic()
+        actions = []
+        with self.lock():
+            before = self.count_objects()
+            if force or before['packs'] > max_packs:
+                self.repo.git.repack('-a', '-d', '-q')
+                actions.append('repack-all')
+            elif before['count'] >= loose_objects:
+                self.repo.git.repack('-d', '-q')  # packs the loose objects only
+                actions.append('repack')
+
+            if actions:
+                self.repo.git.prune(f'--expire={DIRECTORIES_MAINTENANCE_PRUNE_EXPIRE}')
+                self.repo.git.commit_graph('write', '--reachable')
+                actions += ['prune', 'commit-graph']
+            after = self.count_objects() if actions else before
+
+        return {
+            'name': self.root.name,
+            'actions': actions,
+            'duration': time.monotonic() - start,
+            'loose_before': before['count'],
+            'loose_after': after['count'],
+            'packs_before': before['packs'],
+            'packs_after': after['packs'],
+            'size_before': (before['size'] + before['size-pack'] + before['size-garbage']) * 1024,
+            'size_after': (after['size'] + after['size-pack'] + after['size-garbage']) * 1024,
+        }
+
+
+    # PRIVATE
+
+
+    def _environ(self) -> dict:
+        # identity of the git commands which create objects (also used by `BareDirectory`)
+        return {
+            'GIT_AUTHOR_NAME': self.actor.name,
+            'GIT_AUTHOR_EMAIL': self.actor.email,
+            'GIT_COMMITTER_NAME': self.actor.name,
+            'GIT_COMMITTER_EMAIL': self.actor.email,
+        }
+
+    def __commit(self, message: str, paths: Optional[Iterable[str]], actor: Actor) -> bool:
+        if paths is None:
+            if not self.repo.is_dirty(untracked_files=True):
+                return False
+            self.repo.git.add('--all')
+            index = self.repo.index
+        else:
+            paths = set(paths)
+            if not paths:
+                return False
+            if '.' in paths:
+                return self.__commit(message, None, actor)
+            index = self.__stage(paths)
+
+        # the tree is built from the index so only the touched entries are hashed
+        tree = index.write_tree()
+        parents = [self.repo.head.commit] if self.repo.head.is_valid() else []
+        if parents and parents[0].tree.binsha == tree.binsha:
+            return False
+
+        commit = Commit.create_from_tree(
+            self.repo,
+            tree,
+            message,
+            parent_commits=parents,
+            head=True,
+            author=actor,
+            committer=actor
+        )
+
+        notify_commit(self, parents[0].hexsha if parents else None, commit.hexsha)
+        return True
+
+    def __commit_pending(self):
+        pending = COMMIT_QUEUE.take(self.root.name)
+        if pending is not None:
+            user, paths, message = pending
+            self.__commit(message, paths, git_actor(user))
+
+    def __changed(self, message: str, *abspaths: Path):
+        paths = [str(Path(abspath).relative_to(self.root)) for abspath in abspaths]
+        if self.__transaction is not None:
+            self.__transaction.update(paths)
+        elif COMMIT_QUEUE.delay > 0:
+            COMMIT_QUEUE.push(self, message, paths)
+        else:
+            self.commit(message, paths)
+
+    def __stage(self, paths: Set[str]) -> IndexFile:
+        index = self.repo.index
+
+        # drop the entries of the touched paths (files or folders)...
+        for key in list(index.entries):
+            parts = key[0].split('/')
+            if any('/'.join(parts[:i]) in paths for i in range(1, len(parts) + 1)):
+                del index.entries[key]
+
+        # ...then add back the files that still exist in the working tree (never the repository itself).
+        for path in paths:
+            if is_git_path(path):
+                continue
+            abspath = self.root.joinpath(path)
+            if abspath.is_dir() and not abspath.is_symlink():
+                for dirpath, dirnames, filenames in os.walk(abspath):
+                    dirnames[:] = [name for name in dirnames if not is_git_path(name)]
+                    for filename in filenames:
+                        if is_git_path(filename):
+                            continue
+                        entry = self.__index_entry(os.path.join(dirpath, filename))
+                        index.entries[(entry.path, 0)] = entry
+            elif os.path.lexists(abspath):
+                entry = self.__index_entry(str(abspath))
+                index.entries[(entry.path, 0)] = entry
+
+        index.write()
+        return index
+
+    def __index_entry(self, abspath: str) -> IndexEntry:
+        st = os.lstat(abspath)
+        if stat.S_ISLNK(st.st_mode):
+            stream = BytesIO(os.fsencode(os.readlink(abspath)))
+        else:
+            stream = open(abspath, 'rb')
+
+        with stream:
+            istream = self.repo.odb.store(IStream(Blob.type, st.st_size, stream))
+
+        # the stat data is kept so that git does not need to rehash the file on the next status
+        return IndexEntry((
+            stat_mode_to_index_mode(st.st_mode),
+            istream.binsha,
+            0,
+            Path(abspath).relative_to(self.root).as_posix(),
+            pack('>LL', int(st.st_ctime) & 0xFFFFFFFF, st.st_ctime_ns % 1000000000),
+            pack('>LL', int(st.st_mtime) & 0xFFFFFFFF, st.st_mtime_ns % 1000000000),
+            st.st_dev & 0xFFFFFFFF,
+            st.st_ino & 0xFFFFFFFF,
+            st.st_uid & 0xFFFFFFFF,
+            st.st_gid & 0xFFFFFFFF,
+            st.st_size & 0xFFFFFFFF,
+        ))
+
+    def __rollback(self, paths: Iterable[str]):
+        paths = sorted(set(paths))
+        if not paths:
+            return
+
+        tracked = []
+        if self.repo.head.is_valid():
+            head = self.repo.tree('HEAD')
+            for path in paths:
+                try:
+                    if path != '.':
+                        head[path]
+                    tracked.append(path)
+                except KeyError:
+                    continue
+            self.repo.git.reset('-q', 'HEAD', '--', *paths)
+
+        # `git clean` keeps the folders whose files are given as pathspecs so only the outermost paths are given
+        outermost = [path for path in paths if not any(path.startswith(other + '/') for other in paths)]
+        self.repo.git.clean('-fdq', '--', *outermost)
+        if tracked:
+            self.repo.git.checkout('HEAD', '--', *tracked)
+
+    def __blob_response(self, blob: Blob, filename: str, range: str = None) -> HttpResponse:
+        try:
+            bounds = parse_range(range, blob.size) if range else None
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{blob.size}'
+            return response
+
+        first, last = bounds or (0, blob.size - 1)
+        length = last - first + 1
+        if blob.size <= STREAM_MIN_SIZE:
+            # read from the `git cat-file` process of the repository instead of spawning one
+            content = blob.data_stream.read()[first:last + 1]
+            response = HttpResponse(content, content_type="application/force-download")
+        else:
+            chunks = iter_command([Git.GIT_PYTHON_GIT_EXECUTABLE, 'cat-file', 'blob', blob.hexsha], self.root)
+            if bounds:
+                chunks = iter_range(chunks, first, last)
+            if length > STREAM_MIN_SIZE:
+                response = StreamingHttpResponse(chunks, content_type="application/force-download")
+            else:
+                response = HttpResponse(b''.join(chunks), content_type="application/force-download")
+
+        if bounds:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {first}-{last}/{blob.size}'
+        response['Content-Length'] = str(length)
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
+
+    def __read_text(self, hexsha: str, mode: str) -> Optional[List[str]]:
+        # lines of a blob for difflib, `None` for a binary, big or submodule entry.
+        if mode == '000000':  # missing side of an added/deleted file
+            return []
+        if mode == '160000':
+            return None
+
+        blob = Blob(self.repo, bytes.fromhex(hexsha), int(mode, 8))
+        if blob.size > DIRECTORIES_DIFF_MAX_FILE_SIZE:
+            return None
+        data = blob.data_stream.read()
+        if b'\0' in data[:8000]:
+            return None
+
+        lines = data.decode(defenc, 'replace').splitlines(keepends=True)
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n\\ No newline at end of file\n'
+        return lines
+
+    def __versions_path(self) -> str:
+        return os.path.join(self.repo.git_dir, 'platon-versions.json')
+
+    def __versions_stamp(self) -> List[int]:
+        stamp = []
+        for path in ('refs/tags', 'packed-refs'):
+            try:
+                stamp.append(os.stat(os.path.join(self.repo.git_dir, path)).st_mtime_ns)
+            except FileNotFoundError:
+                stamp.append(0)
+        return stamp
+
+    def __read_versions(self) -> List[Version]:
+        # creatordate is the date of the tagger (or of the commit for a lightweight tag)
+        # and `*objectname` the commit of an annotated tag.
+        output = self.repo.git.for_each_ref(
+            'refs/tags',
+            format='%(refname:strip=2)%00%(creatordate:unix)%00%(objectname)%00%(*objectname)%00%(contents)%00',
+        )
+        tokens = output.split('\0')
+        return [
+            {
+                'name': name.lstrip('\n'),
+                'date': int(date or 0),
+                'message': message.rstrip('\n'),
+                'target': target or hexsha,
+            }
+            for name, date, hexsha, target, message in zip(*[iter(tokens[:-1])] * 5)
+        ]
+
+    def __cache_versions(self, versions: List[Version]):
+        path = self.__versions_path()
+        tmp = f'{path}.{uuid.uuid4()}'
+        with open(tmp, 'w') as file:
+            json.dump({'stamp': self.__versions_stamp(), 'versions': versions}, file)
+        os.replace(tmp, path)
+
+    def __bundle_key(self, version: str, bases: Iterable[str] = None) -> Tuple[str, List[str]]:
+        known = set()
+        for base in itertools.islice(bases or [], DIRECTORIES_BUNDLE_MAX_BASES):
+            if not base or any(char.isspace() for char in base):
+                continue  # the bases are written line by line to the `git cat-file` process
+            try:
+                # the persistent `git cat-file --batch-check` of the repository resolves all the bases
+                hexsha, _, _ = self.repo.git.get_object_header(f'{base}^{{commit}}')
+            except ValueError:
+                continue  # the client may have commits that were never pushed to the directory
+            known.add(hexsha.decode())
+
+        known = sorted(known)
+        refs = [self.repo.head.commit.hexsha, self.repo.commit(version).hexsha, *known]
+        return hashlib.sha1(' '.join(refs).encode()).hexdigest(), known
+
+    def __bundle_file(self, version: str, bases: Iterable[str] = None) -> BinaryIO:
+        # the bundle is opened before it can be evicted: an opened file stays readable once unlinked.
+        bases = list(itertools.islice(bases or [], DIRECTORIES_BUNDLE_MAX_BASES))
+        cache = Path(self.repo.git_dir, 'bundles')
+        key, _ = self.__bundle_key(version, bases)
+        path = cache.joinpath(f'{key}.bundle')
+        try:
+            file = open(path, 'rb')
+            os.utime(path)  # least recently used bundles are evicted first
+            return file
+        except FileNotFoundError:
+            pass
+
+        # HEAD cannot move while the bundle is created since the writers take the same lock.
+        with self.lock():
+            key, known = self.__bundle_key(version, bases)
+            path = cache.joinpath(f'{key}.bundle')
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                pass
+
+            tips = [self.repo.head.commit, self.repo.commit(version)]
+            if known and all(any(self.repo.is_ancestor(tip, base) for base in known) for tip in tips):
+                raise ValueError('the bases already contain the requested versions')
+
+            cache.mkdir(exist_ok=True)
+            tmp = cache.joinpath(f'.{key}.{uuid.uuid4()}')
+            try:
+                self.repo.git.bundle('create', str(tmp), 'HEAD', version, *(f'^{base}' for base in known))
+                os.replace(tmp, path)
+            finally:
+                tmp.unlink(missing_ok=True)
+            file = open(path, 'rb')
+
+            bundles = sorted(cache.glob('*.bundle'), key=lambda item: item.stat().st_mtime, reverse=True)
+            for item in bundles[DIRECTORIES_BUNDLE_CACHE_SIZE:]:
+                item.unlink(missing_ok=True)
+        return file
+
+    def __archive_args(self, path: str, version: str) -> List[str]:
+        args = [Git.GIT_PYTHON_GIT_EXECUTABLE, 'archive', '--format=zip', version]
+        if path not in ('', '.'):
+            args += ['--', path]
+        return args
+
+    def __resolve(self, path: str, version: str) -> Union[Tree, Blob]:
+        object = self.repo.tree(version)
+        if path != ".":
+            object = object[path]
+        return object
+
+    def __ls_tree(self, tree: Tree, recursive: bool = True) -> List['TreeEntry']:
+        # a single `git ls-tree` call gives the metadata of all the entries (or of the direct
+        # entries if not `recursive`) instead of one `git cat-file` round trip per object.
+        args = ['-r', '-t'] if recursive else []
+        output = self.repo.git.ls_tree(*args, '-l', '-z', tree.hexsha, stdout_as_string=False)
+
+        entries: List[TreeEntry] = []
+        for line in output.split(b'\0'):
+            if not line:
+                continue
+            info, path = line.split(b'\t', 1)
+            mode, type, hexsha, size = info.split()
+            entries.append(TreeEntry(
+                mode=mode.decode(),
+                type=type.decode(),
+                hexsha=hexsha.decode(),
+                size=0 if size == b'-' else int(size),
+                path=path.decode(defenc, 'surrogateescape'),
+            ))
+        return entries
+
+    def __iterate(self, tree: Tree) -> List[TreeNode]:
+        nodes: Dict[str, TreeNode] = {}
+        sizes: Dict[str, int] = {}
+        children: List[TreeNode] = []
+
+        for entry in self.__ls_tree(tree):
+            parent, name = os.path.split(entry.path)
+
+            # size of the entry inside the raw object of the parent tree: "<mode> <name>\0<binsha>"
+            sizes[parent] = sizes.get(parent, 0) + len(entry.mode.lstrip('0')) + len(
+                name.encode(defenc, 'surrogateescape')
+            ) + 22
+
+            if any(part.startswith('.') for part in entry.path.split('/')):
+                continue
+
+            node: TreeNode = {
+                'path': os.path.join(tree.path, entry.path),
+                'size': entry.size,
+                'type': 'folder' if entry.type == 'tree' else 'file',
+                'hexsha': entry.hexsha
+            }
+
+            if node['type'] == 'folder':
+                node['children'] = []
+            else:
+                node['mime'] = mimetypes.guess_type(entry.path)[0] or Blob.DEFAULT_MIME_TYPE
+
+            nodes[entry.path] = node
+            if parent:
+                nodes[parent]['children'].append(node)
+            else:
+                children.append(node)
+
+        for path, node in nodes.items():
+            if node['type'] == 'folder':
+                node['size'] = sizes.get(path, 0)
+                node['children'].sort(key=lambda x: (x['type'], x['path']))
+
+        return sorted(children, key=lambda x: (x['type'], x['path']))
+
+    def __iterate_levels(self, tree: Tree, depth: int) -> List[TreeNode]:
+        # same nodes as `__iterate` but only the first `depth` levels are read from git: the
+        # folders of the last level have `None` children and their size is read from the odb.
+        children: List[TreeNode] = []
+        for entry in self.__ls_tree(tree, recursive=False):
+            if entry.path.startswith('.'):
+                continue
+
+            node: TreeNode = {
+                'path': os.path.join(tree.path, entry.path),
+                'size': entry.size,
+                'type': 'folder' if entry.type == 'tree' else 'file',
+                'hexsha': entry.hexsha
+            }
+            if node['type'] == 'folder':
+                subtree = Tree(self.repo, bytes.fromhex(entry.hexsha), path=node['path'])
+                node['size'] = self.repo.odb.info(subtree.binsha).size
+                node['children'] = self.__iterate_levels(subtree, depth - 1) if depth > 1 else None
+            else:
+                node['mime'] = mimetypes.guess_type(entry.path)[0] or Blob.DEFAULT_MIME_TYPE
+            children.append(node)
+
+        return sorted(children, key=lambda x: (x['type'], x['path']))
+
+    def __build_urls(self, object: Any, version: str, base_url: str):
+        url = base_url
+        if object['path'] != '.':
+            # same escaping as `reverse()` so the urls are identical to the ones built by django
+            url = base_url + quote(object['path'], safe=RFC3986_SUBDELIMS + '/~:@')
 
-        url = reverse('pl_resources:files', request=request, kwargs=kwargs)
         object['url'] = f'{url}?version={version}'
         object['download_url'] = f'{url}?version={version}&download'
         if object['path'] == '.':
             object['bundle_url'] = f'{url}?version={version}&git-bundle'
             object['describe_url'] = f'{url}?version={version}&git-describe'
 
-    def __list_files(self, tree: Tree, path: str, version: str, request=None):
+    def __splice_urls(
+        self,
+        nodes: List[TreeNode],
+        version: str,
+        base_url: Optional[str],
+        depth: int = None
+    ) -> List[TreeNode]:
+        # cached nodes are shared so they are copied instead of being updated in place.
+        copies: List[TreeNode] = []
+        for node in nodes:
+            copy = dict(node)
+            if 'children' in node:
+                if node['children'] is None or (depth is not None and depth <= 1):
+                    copy['children'] = None  # not listed: loaded on demand by reading the folder
+                else:
+                    copy['children'] = self.__splice_urls(
+                        node['children'], version, base_url, None if depth is None else depth - 1
+                    )
+            if base_url is not None:
+                self.__build_urls(copy, version, base_url)
+            copies.append(copy)
+        return copies
+
+    def __list_files(
+        self,
+        tree: Tree,
+        path: str,
+        version: str,
+        request=None,
+        depth: int = None,
+        cursor: str = None,
+        limit: int = None
+    ):
         relpath = str(self.root.joinpath(path).relative_to(self.root))
 
         response = {
@@ -664,11 +2106,46 @@ class Directory:
             'version': version,
             'directory': self.root.name,
         }
+        if depth is not None:
+            response['depth'] = depth
 
+        base_url = None
         if request:
-            self.__build_urls(response, version, request)
-
-        response['files'] = self.__iterate(tree, version, request)['children']
+            base_url = reverse('pl_resources:files', request=request, kwargs={'directory': self.root.name})
+            self.__build_urls(response, version, base_url)
+
+        key = (self.root.name, tree.hexsha, relpath)
+        files = TREE_CACHE.get(key)
+        if files is None and depth is not None:
+            # only the requested levels are read unless the whole tree is already cached
+            key = (self.root.name, tree.hexsha, f'{relpath}?depth={depth}')
+            files = TREE_CACHE.get(key)
+            if files is None:
+                files = self.__iterate_levels(tree, depth)
+                TREE_CACHE.set(key, files)
+        elif files is None:
+            files = self.__iterate(tree)
+            TREE_CACHE.set(key, files)
+
+        # the nodes are sorted by (type, path) so the cursor is the key of the last node of the page
+        if cursor:
+            try:
+                after = tuple(json.loads(base64.urlsafe_b64decode(cursor.encode())))
+            except (ValueError, TypeError):
+                after = None
+            if not after or len(after) != 2 or not all(isinstance(item, str) for item in after):
+                raise ValueError(f'{cursor}: invalid cursor')
+            files = [node for node in files if (node['type'], node['path']) > after]
+
+        if limit is not None:
+            if len(files) > limit:
+                last = files[limit - 1]
+                response['next_cursor'] = base64.urlsafe_b64encode(
+                    json.dumps([last['type'], last['path']]).encode()
+                ).decode()
+            files = files[:limit]
+
+        response['files'] = self.__splice_urls(files, version, base_url, depth)
         return response
 
     def __as_abspath(self, path: str = '.', authorize_root: bool = False) -> Path:
@@ -686,8 +2163,565 @@ class Directory:
 
         abspath = Path(os.path.join(self.root, path)).resolve()
 
-        # ensure that path does not point to a file outside of self.root
-        if not abspath.is_relative_to(self.root):
+        # ensure that path does not point to a file outside of self.root nor inside the repository
+        if not abspath.is_relative_to(self.root) or is_git_path(abspath.relative_to(self.root).as_posix()):
             raise PermissionError(f'{path}: points to an invalid file')
 
         return abspath
+
+
+class BareDirectory(Directory):
+    """Representation of a versioned directory stored as a bare git repository.
+
+    There is no working tree on the disk: the write operations are applied to an in-memory
+    index built from `HEAD` and committed directly from it. The read operations of `Directory`
+    only use the object database so they are inherited as is.
+
+    The writes are always committed synchronously: `COMMIT_QUEUE` is not used since the pending
+    changes only live in the in-memory index of the object that made them.
+    """
+
+    def __init__(self, root: Path, user: User, repo: Repo = None):
+        super().__init__(root, user, repo)
+        self.__index: Optional[IndexFile] = None
+        self.__folders: Optional[Set[str]] = None
+        self.__batching = False
+
+
+    def exists(self, path: str):
+        return self.is_file(path) or self.is_dir(path)
+
+    def is_dir(self, path: str):
+        return self.__as_relpath(path) in self.__pending_folders()
+
+    def is_file(self, path: str):
+        return (self.__as_relpath(path), 0) in self.__pending().entries
+
+
+    def move(self, src: str, dst: str, copy: bool = False):
+        with self.transaction(f'{"copy" if copy else "move"} {src} to {dst}'):
+            relsrc = self.__as_relpath(src)
+            reldst = self.__as_relpath(dst, authorize_root=True)
+
+            if not self.exists(src):
+                raise FileNotFoundError(f'{src}: does not points to a valid file')
+
+            if reldst != '.' and not self.is_dir(dst):
+                raise NotADirectoryError(f"[Errno 20] No such directory: '{dst}'")
+
+            # move inside the same directory
+            if not copy and (posixpath.dirname(relsrc) or '.') == reldst:
+                return
+
+            if reldst == relsrc or reldst.startswith(relsrc + '/'):
+                raise PermissionError(f'{src}: cannot be moved inside itself')
+
+            self.__copy(relsrc, self.__uniquify(reldst, posixpath.basename(relsrc)))
+            if not copy:
+                self.__delete(relsrc)
+
+    def remove(self, path: str):
+        with self.transaction(f'delete {path}'):
+            relpath = self.__as_relpath(path)
+            if not self.exists(path):
+                raise FileNotFoundError(f'{path}: does not points to a valid file')
+            self.__delete(relpath)
+
+        return True
+
+    def rename(self, oldpath: str, newpath: str):
+        with self.transaction(f'rename {oldpath} to {newpath}'):
+            relold = self.__as_relpath(oldpath)
+            relnew = self.__as_relpath(newpath)
+
+            if not self.exists(oldpath):
+                raise FileNotFoundError(f'"{oldpath}"" does not points to a valid file')
+
+            if self.exists(newpath):
+                raise FileExistsError(f'"{newpath}"" points to an existing file')
+
+            if posixpath.dirname(relold) != posixpath.dirname(relnew):
+                raise PermissionError('new file name should be inside the same directory')
+
+            self.__copy(relold, relnew)
+            self.__delete(relold)
+
+    def create_dir(self, path: str):
+        with self.transaction(f'create {path}'):
+            relpath = self.__check_new(path)
+            self.__put(posixpath.join(relpath, '.keep'), b'')  # allow to list empty directories
+
+    def create_file(self, path: str, content: str = None):
+        with self.transaction(f'create {path}'):
+            self.__put(self.__check_new(path), (content or '').encode())
+
+    # WRITE
+
+    def write_text(self, path: str, data: str):
+        self.write_bytes(path, data.encode())
+
+    def write_bytes(self, path: str, data: bytes):
+        with self.transaction(f'update {path}'):
+            relpath = self.__as_relpath(path)
+            if self.is_dir(path):
+                raise IsADirectoryError(f"[Errno 21] Is a directory: '{path}'")
+            self.__check_parent(relpath)
+            self.__put(relpath, data)
+
+    def write_file(
+        self,
+        path: str,
+        data: InMemoryUploadedFile,
+        unzip: bool = True
+    ):
+        path = "." if not path else path
+        with self.transaction(f'upload {data.name} into {path}'):
+            relpath = self.__as_relpath(path, authorize_root=True)
+
+            if relpath != '.' and not self.is_dir(path):
+                raise NotADirectoryError("[Errno 20] No such directory: '{path}'")
+
+            if unzip and data.content_type == 'application/zip':
+                with open_archive(data) as (archive, members):
+                    targets = [
+                        (info, self.__as_relpath(posixpath.join(relpath, info.filename)))
+                        for info in members
+                    ]
+                    for info, target in targets:
+                        with archive.open(info) as stream:
+                            self.__put(target, stream, info.file_size)
+            else:
+                if is_git_path(data.name):
+                    raise PermissionError(f'{data.name}: points to an invalid file')
+                data.seek(0)
+                self.__put(self.__uniquify(relpath, data.name), data, data.size)
+
+    # GIT
+
+    @locked
+    def merge(self, bundle: InMemoryUploadedFile) -> Any:
+        # there is no working tree to resolve conflicts so only fast-forwards are accepted.
+        path = os.path.join(DIRECTORIES_ROOT, str(uuid.uuid4()) + '.git')
+        with open(path, 'wb+') as file:
+            for chunk in bundle.chunks():
+                file.write(chunk)
+        try:
+            self.repo.git.fetch(path, 'HEAD', env=self._environ())
+        finally:
+            Path(path).unlink()
+
+        head = self.repo.head.commit
+        fetched = self.repo.commit('FETCH_HEAD')
+        if head == fetched or self.repo.is_ancestor(fetched, head):
+            return
+        if not self.repo.is_ancestor(head, fetched):
+            raise ValueError('the history of the bundle diverges from the history of the directory')
+        self.repo.head.commit = fetched
+        notify_commit(self, head.hexsha, fetched.hexsha)
+
+    @locked
+    def commit(self, message: str, paths: Iterable[str] = None) -> bool:
+        """Commits the pending changes of the in-memory index.
+
+        Unlike `Directory.commit`, the changes are never delayed by `COMMIT_QUEUE`.
+
+        Args:
+            message (`str`): The commit message.
+            paths (`Iterable[str]`, optional): Paths (relative to the directory) to commit. The
+                pending changes of the other paths stay in the index. Every pending change is
+                committed if not specified.
+
+        Returns:
+            `bool`: `True` if a commit is created `False` if there is nothing to commit.
+        """
+
+        if self.__index is None:
+            return False
+
+        if paths is not None:
+            paths = {self.__as_relpath(path, authorize_root=True) for path in paths}
+            if not paths:
+                return False
+
+        if paths is None or '.' in paths:
+            index, self.__index, self.__folders = self.__index, None, None
+        else:
+            index = self.__staged(paths)
+
+        tree = index.write_tree()
+        parents = [self.repo.head.commit] if self.repo.head.is_valid() else []
+        if parents and parents[0].tree.binsha == tree.binsha:
+            return False
+
+        commit = Commit.create_from_tree(
+            self.repo,
+            tree,
+            message,
+            parent_commits=parents,
+            head=True,
+            author=self.actor,
+            committer=self.actor
+        )
+
+        notify_commit(self, parents[0].hexsha if parents else None, commit.hexsha)
+        return True
+
+    @contextmanager
+    def transaction(self, message: str):
+        if self.__batching:
+            yield self
+            return
+
+        with self.lock():
+            # another writer may have moved HEAD since the index was loaded
+            self.__index, self.__folders = None, None
+            self.__batching = True
+            try:
+                yield self
+                self.commit(message)
+            except BaseException:
+                # nothing was written outside of the in-memory index
+                self.__index, self.__folders = None, None
+                raise
+            finally:
+                self.__batching = False
+
+
+    # PRIVATE
+
+
+    def __pending(self) -> IndexFile:
+        if self.__index is None:
+            trees = [self.repo.head.commit.tree] if self.repo.head.is_valid() else []
+            self.__index = IndexFile.new(self.repo, *trees)
+        return self.__index
+
+    def __pending_folders(self) -> Set[str]:
+        # the folders only exist as prefixes of the index entries: they are collected once
+        # per index and kept up to date by `__add` instead of scanning the entries each time.
+        if self.__folders is None:
+            self.__folders = set()
+            for path, _ in self.__pending().entries:
+                self.__folders.update(self.__parents(path))
+        return self.__folders
+
+    def __staged(self, paths: Set[str]) -> IndexFile:
+        # index of `HEAD` with only the pending changes of `paths` applied to it
+        def touched(path: str) -> bool:
+            return any(path == prefix or path.startswith(prefix + '/') for prefix in paths)
+
+        index = IndexFile.new(self.repo, *([self.repo.head.commit.tree] if self.repo.head.is_valid() else []))
+        for key in [key for key in index.entries if touched(key[0])]:
+            del index.entries[key]
+        for key, entry in self.__index.entries.items():
+            if touched(key[0]):
+                index.entries[key] = entry
+        return index
+
+    def __walk(self, relpath: str) -> Iterator[Tuple[str, int]]:
+        prefix = '' if relpath == '.' else relpath + '/'
+        for key in self.__pending().entries:
+            if key[0].startswith(prefix):
+                yield key
+
+    def __add(self, relpath: str, mode: int, binsha: bytes):
+        # same errors as the writes of the working tree on a file/folder conflict
+        if relpath in self.__pending_folders():
+            raise IsADirectoryError(f"[Errno 21] Is a directory: '{relpath}'")
+        entries = self.__pending().entries
+        for parent in self.__parents(relpath):
+            if (parent, 0) in entries:
+                raise FileExistsError(f"[Errno 17] File exists: '{parent}'")
+
+        entries[(relpath, 0)] = IndexEntry.from_base(BaseIndexEntry((mode, binsha, 0, relpath)))
+        self.__folders.update(self.__parents(relpath))
+
+    def __put(self, relpath: str, data: Union[bytes, Any], size: int = None):
+        if isinstance(data, bytes):
+            data, size = BytesIO(data), len(data)
+        istream = self.repo.odb.store(IStream(Blob.type, size, data))
+        # an overwritten file keeps its mode (executable, symlink...)
+        current = self.__pending().entries.get((relpath, 0))
+        self.__add(relpath, current.mode if current is not None else Blob.file_mode, istream.binsha)
+
+    def __copy(self, relsrc: str, reldst: str):
+        entries = self.__pending().entries
+        for key in [(relsrc, 0), *self.__walk(relsrc)]:
+            entry = entries.get(key)
+            if entry is not None:
+                self.__add(reldst + entry.path[len(relsrc):], entry.mode, entry.binsha)
+
+    def __delete(self, relpath: str):
+        entries = self.__pending().entries
+        for key in [(relpath, 0), *self.__walk(relpath)]:
+            entries.pop(key, None)
+        self.__folders = None  # the emptied folders disappear with their last entry
+
+    @staticmethod
+    def __parents(relpath: str) -> Iterator[str]:
+        parent = posixpath.dirname(relpath)
+        while parent:
+            yield parent
+            parent = posixpath.dirname(parent)
+
+    def __uniquify(self, reldst: str, filename: str) -> str:
+        # same naming scheme as `uniquify_filename` but checked against the index
+        name, ext = os.path.splitext(filename)
+        relpath = posixpath.normpath(posixpath.join(reldst, filename))
+        counter = 1
+        while self.exists(relpath):
+            relpath = posixpath.normpath(posixpath.join(reldst, f'{name}({counter}){ext}'))
+            counter += 1
+        return relpath
+
+    def __check_parent(self, relpath: str):
+        parent = posixpath.dirname(relpath)
+        if parent and not self.is_dir(parent):
+            raise FileNotFoundError(f"[Errno 2] No such file or directory: '{parent}'")
+
+    def __check_new(self, path: str) -> str:
+        relpath = self.__as_relpath(path)
+        if self.exists(path):
+            raise FileExistsError(f"[Errno 17] File exists: '{path}'")
+        self.__check_parent(relpath)
+        return relpath
+
+    def __as_relpath(self, path: str = '.', authorize_root: bool = False) -> str:
+        if path is None:
+            raise TypeError('argument "path" is required')
+
+        path = path.strip()
+        if path.startswith('/'):
+            raise PermissionError(f'{path}: should not starts with "/"')
+
+        relpath = posixpath.normpath(path) if path else '.'
+        if relpath == '.':
+            if authorize_root:
+                return relpath
+            raise TypeError('argument "path" is required')
+
+        # ensure that path does not point to a file outside of the directory nor inside the repository
+        if relpath == '..' or relpath.startswith('../') or is_git_path(relpath):
+            raise PermissionError(f'{path}: points to an invalid file')
+
+        return relpath
+
+
+class AsyncDirectory:
+    """Asynchronous facade of `Directory` for ASGI views.
+
+    The blocking operations run inside `DIRECTORIES_EXECUTOR`, a bounded thread pool shared
+    by the process, so a slow git operation never blocks the event loop. The git commands that
+    stream their output (archives) run with `asyncio.create_subprocess_exec`.
+
+    Git repositories are not thread-safe so each call resolves the `Directory` in the thread
+    of the executor that runs it (see `RepoPool`).
+
+    Usage:
+
+    ```python
+    directory = await AsyncDirectory.get('resource:1', user)
+    await directory.create_file('main.py', 'print("hello")')
+    content = await directory.read('main.py')
+    ```
+    """
+
+    def __init__(self, name: str, user: User = None):
+        self.name = name
+        self.user = user
+
+
+    # STATIC
+
+
+    @classmethod
+    async def get(cls, name: str, user: User = None) -> 'AsyncDirectory':
+        """Asynchronous version of `Directory.get`."""
+
+        await run_in_executor(Directory.get, name, user)
+        return cls(name, user)
+
+    @classmethod
+    async def create(cls, name: str, user: User = None) -> 'AsyncDirectory':
+        """Asynchronous version of `Directory.create`."""
+
+        await run_in_executor(Directory.create, name, user)
+        return cls(name, user)
+
+    @classmethod
+    async def delete(cls, name: str) -> bool:
+        """Asynchronous version of `Directory.delete`."""
+
+        return await run_in_executor(Directory.delete, name)
+
+
+    async def exists(self, path: str) -> bool:
+        return await self.__run('exists', path)
+
+    async def is_dir(self, path: str) -> bool:
+        return await self.__run('is_dir', path)
+
+    async def is_file(self, path: str) -> bool:
+        return await self.__run('is_file', path)
+
+
+    async def move(self, src: str, dst: str, copy: bool = False):
+        return await self.__run('move', src, dst, copy)
+
+    async def remove(self, path: str):
+        return await self.__run('remove', path)
+
+    async def rename(self, oldpath: str, newpath: str):
+        return await self.__run('rename', oldpath, newpath)
+
+    async def create_dir(self, path: str):
+        return await self.__run('create_dir', path)
+
+    async def create_file(self, path: str, content: str = None):
+        return await self.__run('create_file', path, content)
+
+    # WRITE
+
+    async def write_text(self, path: str, data: str):
+        return await self.__run('write_text', path, data)
+
+    async def write_bytes(self, path: str, data: bytes):
+        return await self.__run('write_bytes', path, data)
+
+    async def write_file(self, path: str, data: InMemoryUploadedFile, unzip: bool = True):
+        return await self.__run('write_file', path, data, unzip)
+
+    # READ
+
+    async def read(
+        self,
+        path: str = ".",
+        version: str = "master",
+        request: Request = None,
+        depth: int = None,
+        cursor: str = None,
+        limit: int = None
+    ) -> Union[bytes, List[TreeNode]]:
+        return await self.__run('read', path, version, request, depth, cursor, limit)
+
+    async def search(
+        self,
+        query: str,
+        path: str = ".",
+        version: str = "master",
+        match_word: bool = False,
+        match_case: bool = False,
+        use_regex: bool = False,
+        limit: int = DIRECTORIES_SEARCH_LIMIT
+    ) -> List[SearchMatch]:
+        """Asynchronous version of `Directory.search`.
+
+        The search running in the executor is stopped if the awaiting task is cancelled.
+        """
+
+        cancel = threading.Event()
+
+        def search(directory: Directory):
+            return list(directory.iter_search(
+                query,
+                path=path,
+                version=version,
+                match_word=match_word,
+                match_case=match_case,
+                use_regex=use_regex,
+                limit=limit,
+                cancel=cancel
+            ))
+
+        try:
+            return await self.apply(search)
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+
+    async def download(self, path: str = '.', version: str = "master", range: str = None) -> HttpResponse:
+        """Asynchronous version of `Directory.download`.
+
+        The streamed content (zip archive of a folder, big file) is returned as an
+        `AsyncStreamingHttpResponse` whose chunks are read one by one inside the executor.
+        """
+
+        path = "." if not path else path
+        return await self.apply(lambda directory: async_streaming_response(directory.download(path, version, range)))
+
+    async def diff(
+        self,
+        base: str,
+        version: str = "master",
+        path: str = ".",
+        patch: bool = False,
+    ) -> List[FileChange]:
+        return await self.__run('diff', base, version, path, patch)
+
+    async def bundle(self, version: str = "master", bases: Iterable[str] = None) -> HttpResponse:
+        """Asynchronous version of `Directory.bundle` (see `download` about streaming)."""
+
+        return await self.apply(lambda directory: async_streaming_response(directory.bundle(version, bases)))
+
+    async def aiter_bundle(self, version: str = "master", bases: Iterable[str] = None) -> AsyncIterator[bytes]:
+        return await self.__run('aiter_bundle', version, bases)
+
+    async def aiter_archive(self, path: str = ".", version: str = "master") -> AsyncIterator[bytes]:
+        return await self.__run('aiter_archive', path, version)
+
+    # GIT
+
+    async def merge(self, bundle: InMemoryUploadedFile) -> Any:
+        return await self.__run('merge', bundle)
+
+    async def commit(self, message: str, paths: Iterable[str] = None) -> bool:
+        return await self.__run('commit', message, paths)
+
+    async def etag(
+        self,
+        path: str = ".",
+        version: str = "master",
+        variant: str = None,
+        bases: Iterable[str] = None,
+    ) -> str:
+        return await self.__run('etag', path, version, variant, bases)
+
+    async def describe(self) -> str:
+        return await self.__run('describe')
+
+    async def list_versions(self) -> List[Version]:
+        return await self.__run('list_versions')
+
+    async def create_version(self, name: str, message: str) -> Version:
+        return await self.__run('create_version', name, message)
+
+    async def apply(self, function, *args) -> Any:
+        """Calls `function(directory, *args)` inside the executor with the `Directory` object.
+
+        Several operations can be batched into a single executor call (and a single commit with
+        `Directory.transaction`) instead of awaiting each of them.
+
+        Args:
+            function (`Callable`): A function taking a `Directory` as first argument.
+        """
+
+        def call():
+            return function(Directory.get(self.name, self.user), *args)
+
+        return await run_in_executor(call)
+
+    async def transaction(self, message: str, function, *args) -> Any:
+        """Calls `function(directory, *args)` inside a `Directory.transaction`."""
+
+        def call(directory: Directory):
+            with directory.transaction(message):
+                return function(directory, *args)
+
+        return await self.apply(call)
+
+
+    # PRIVATE
+
+
+    async def __run(self, method: str, *args) -> Any:
+        return await self.apply(lambda directory: getattr(directory, method)(*args))
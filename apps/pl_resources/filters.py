@@ -58,6 +58,7 @@ class CircleFilter(filters.FilterSet):
 
 class ResourceFilter(filters.FilterSet):
     author = filters.CharFilter(label='Author', method='filter_author')
+    subtree = filters.NumberFilter(label='Circle subtree', method='filter_subtree')
     updated_at = filters.NumberFilter(label='Updated at', method='filter_updated_at')
 
     class Meta:
@@ -73,6 +74,12 @@ class ResourceFilter(filters.FilterSet):
     def filter_author(self, queryset, name, value):
         return queryset.filter(author__username=value)
 
+    def filter_subtree(self, queryset, name, value):
+        path = Circle.objects.filter(pk=value).values_list('path', flat=True).first()
+        if not path:
+            return queryset.none()
+        return queryset.filter(circle__path__startswith=Circle.subtree_prefix(path))
+
     def filter_updated_at(self, queryset, name, value):
         date = timezone.now() - datetime.timedelta(days=int(value))
         return queryset.filter(updated_at__date__gte=date)
@@ -0,0 +1,79 @@
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from django.core.management import BaseCommand
+from git import Repo
+from pl_resources import files
+from pl_resources.files import REPO_POOL, Directory
+
+
+class Command(BaseCommand):
+    """Django command to convert the directories to bare repositories (or back to working trees).
+
+    The command should be run while the servers and the workers are stopped.
+    """
+
+    help = 'Converts the directories to bare git repositories (or back to working trees with --to-worktree)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='names of the directories to convert (all by default)')
+        parser.add_argument(
+            '--to-worktree',
+            action='store_true',
+            help='convert bare repositories back to repositories with a working tree'
+        )
+
+    def handle(self, *args, **options):
+        root = Path(files.DIRECTORIES_ROOT)
+        names = options['names']
+        if not names and root.exists():
+            names = sorted(entry.name for entry in root.iterdir() if entry.is_dir() and not entry.name.startswith('.'))
+
+        converted = 0
+        for name in names:
+            path = root.joinpath(name)
+            if not path.is_dir():
+                self.stderr.write(f'{name}: No such directory')
+                continue
+
+            with Repo(path) as repo:
+                bare = repo.bare
+            if options['to_worktree'] and bare:
+                self.to_worktree(name, path)
+            elif not options['to_worktree'] and not bare:
+                self.to_bare(name, path)
+            else:
+                continue
+
+            REPO_POOL.invalidate(name)
+            converted += 1
+            self.stdout.write(f'{name}: converted')
+
+        self.stdout.write(self.style.SUCCESS(f'{converted} directories converted'))
+
+    def to_bare(self, name: str, path: Path):
+        # uncommitted changes would be lost with the working tree
+        Directory.get(name).commit('commit changes before conversion')
+        REPO_POOL.invalidate(name)
+
+        tmp = path.with_name(f'.{name}.{uuid.uuid4()}.git')
+        shutil.move(str(path.joinpath('.git')), str(tmp))
+        shutil.rmtree(path)
+        os.rename(tmp, path)
+
+        path.joinpath('index').unlink(missing_ok=True)
+        with Repo(path) as repo, repo.config_writer('repository') as writer:
+            writer.set_value('core', 'bare', True)
+
+    def to_worktree(self, name: str, path: Path):
+        tmp = path.with_name(f'.{name}.{uuid.uuid4()}.git')
+        os.rename(path, tmp)
+        path.mkdir()
+        shutil.move(str(tmp), str(path.joinpath('.git')))
+
+        with Repo(path) as repo, repo.config_writer('repository') as writer:
+            writer.set_value('core', 'bare', False)
+        with Repo(path) as repo:
+            repo.git.reset('--hard', '-q')
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+from pl_resources.files import Directory
+from pl_resources.models import Resource, ResourceFile
+
+
+class Command(BaseCommand):
+    """Django command to rebuild the full-text index of the files of the resources.
+
+    The index is updated on each commit so the command is only needed to index
+    the resources created before the index (or to repair it).
+    """
+
+    help = 'Rebuilds the full-text index of the files of the resources'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='identifiers of the resources to index (all by default)')
+
+    def handle(self, *args, **options):
+        resources = Resource.objects.all()
+        if options['ids']:
+            resources = resources.filter(pk__in=options['ids'])
+
+        indexed = 0
+        for pk in resources.values_list('pk', flat=True).iterator():
+            try:
+                directory = Directory.get(f'resource:{pk}')
+            except FileNotFoundError:
+                self.stderr.write(f'resource:{pk}: No such directory')
+                continue
+
+            ResourceFile.objects.filter(resource_id=pk).delete()
+            ResourceFile.update_index(pk, directory.iter_changes(
+                None,
+                directory.repo.head.commit.hexsha,
+                max_size=settings.DIRECTORIES_INDEX_MAX_FILE_SIZE
+            ))
+            indexed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{indexed} resources indexed'))
@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+from pl_resources.tasks import maintain_directories
+
+
+class Command(BaseCommand):
+    """Django command to run the maintenance of the directories without waiting for celery beat."""
+
+    help = 'Repacks, prunes and writes the commit-graph of the directories with too many loose objects or packs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='names of the directories to maintain (all by default)')
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='fully repack the directories whatever their number of loose objects and packs'
+        )
+
+    def handle(self, *args, **options):
+        summary = maintain_directories(options['names'], force=options['force'])
+
+        for report in summary['reports']:
+            self.stdout.write(
+                f'{report["name"]}: {", ".join(report["actions"])} in {report["duration"]:.2f}s '
+                f'({report["loose_before"]} -> {report["loose_after"]} loose objects, '
+                f'{report["packs_before"]} -> {report["packs_after"]} packs, '
+                f'{report["size_before"]} -> {report["size_after"]} bytes)'
+            )
+        for name, error in summary['failures'].items():
+            self.stderr.write(f'{name}: maintenance failed: {error}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{summary["maintained"]}/{summary["directories"]} directories maintained in '
+            f'{summary["duration"]:.2f}s, {summary["saved"]} bytes saved'
+        ))
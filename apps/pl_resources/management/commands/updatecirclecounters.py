@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+from pl_resources.models import Circle
+
+
+class Command(BaseCommand):
+    """Django command to recompute the persisted counters of the circles.
+
+    The counters are updated by signals so the command is only needed to repair them
+    after changes made without signals (`QuerySet.update`, raw SQL, fixtures...).
+    """
+
+    help = 'Recomputes the counters (members, watchers, children, resources...) of the circles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='identifiers of the circles to update (all by default)')
+
+    def handle(self, *args, **options):
+        updated = Circle.update_counters(options['ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'{updated} circles updated'))
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_trigram_index(apps, schema_editor):
+    # pg_trgm is a contrib extension: without it the searches still work but scan the whole table.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # `icontains` lookups are compiled to `UPPER(content) LIKE ...` so the expression is indexed
+    schema_editor.execute(
+        'CREATE INDEX pl_resources_resourcefile_content_trgm '
+        'ON pl_resources_resourcefile USING gin (UPPER(content) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS pl_resources_resourcefile_content_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pl_resources', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024)),
+                ('content', models.TextField()),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='pl_resources.resource')),
+            ],
+            options={
+                'unique_together': {('resource', 'path')},
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    Circle = apps.get_model('pl_resources', 'Circle')
+    circles = list(Circle.objects.only('id', 'parent_id', 'path'))
+    children = {}
+    for circle in circles:
+        children.setdefault(circle.parent_id, []).append(circle)
+
+    # walk down from the roots so each parent has its path before its children
+    pending = [(circle, '/') for circle in children.get(None, [])]
+    while pending:
+        circle, parent_path = pending.pop()
+        circle.path = f'{parent_path}{circle.pk}/'
+        pending += [(child, circle.path) for child in children.get(circle.pk, [])]
+    Circle.objects.bulk_update(circles, ['path'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pl_resources', '0002_resourcefile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='circle',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
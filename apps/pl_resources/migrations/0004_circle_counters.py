@@ -0,0 +1,77 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:12
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    # same computation as `Circle.update_counters` which is not available on the historical model
+    Circle = apps.get_model('pl_resources', 'Circle')
+    Member = apps.get_model('pl_resources', 'Member')
+    Resource = apps.get_model('pl_resources', 'Resource')
+
+    def count(queryset, field='circle', **kwargs):
+        return Coalesce(models.Subquery(
+            queryset.filter(**{field: models.OuterRef('pk')}, **kwargs)
+            .order_by()
+            .values(field)
+            .annotate(count=models.Count('pk'))
+            .values('count')
+        ), 0)
+
+    resources = Resource.objects.all()
+    Circle.objects.update(
+        members_count=count(Member.objects.all()),
+        children_count=count(Circle.objects.all(), 'parent'),
+        watchers_count=count(Circle.watchers.through.objects.all()),
+        models_count=count(resources, type='MODEL'),
+        exercises_count=count(resources, type='EXERCISE'),
+        activities_count=count(resources, type='ACTIVITY'),
+        resources_count=count(resources, type__in=['MODEL', 'EXERCISE', 'ACTIVITY']),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pl_resources', '0003_circle_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='circle',
+            name='activities_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circle',
+            name='children_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circle',
+            name='exercises_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circle',
+            name='members_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circle',
+            name='models_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circle',
+            name='resources_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='circle',
+            name='watchers_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pl_resources', '0004_circle_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['circle', '-date', '-id'], name='pl_resource_circle__2f1ed2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['-updated_at', '-id'], name='pl_resource_updated_a8c8dc_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pl_resources', '0005_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheStamp',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('stamp', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -7,13 +7,21 @@
 #       - Mamadou CISSE <mciissee.@gmail.com>
 #
 
+import uuid
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db import models, transaction
 from django.db.models.aggregates import Count
+from django.db.models.functions import Coalesce, Concat, Length, Substr
 
 from .enums import EventTypes, MemberStatus, ResourceStatus, ResourceTypes
 
 User = get_user_model()
+CIRCLES_TREE_CACHE_KEY = 'pl_resources.circles.tree'
+CIRCLES_TREE_CACHE_TIMEOUT = settings.CIRCLES_TREE_CACHE_TIMEOUT
 
 
 class Topic(models.Model):
@@ -64,6 +72,12 @@ class Circle(models.Model):
 
         parent (`Circle`): Parent of the circle.
         children (`QuerySet`): Children of the circle (related_name in `Circle.parent`).
+        path (`str`): Materialized path of the circle (ids of its ancestors and itself like `/1/4/9/`)
+            maintained by `save` to query the subtrees without recursion.
+
+        members_count, children_count, watchers_count (`int`): Persisted counters (see `update_counters`).
+        models_count, exercises_count, activities_count, resources_count (`int`): Persisted counters of
+            the resources of the circle by type (see `update_counters`).
 
         topics (`QuerySet`): List of topics associated to the circle.
         levels (`QuerySet`): List of levels associated to the circle.
@@ -87,16 +101,111 @@ class Circle(models.Model):
         blank=True,
         null=True
     )
+    path = models.CharField(max_length=1024, db_index=True, editable=False, default='')
+
+    members_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    children_count = models.PositiveIntegerField(default=0, editable=False)
+    watchers_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    models_count = models.PositiveIntegerField(default=0, editable=False)
+    exercises_count = models.PositiveIntegerField(default=0, editable=False)
+    activities_count = models.PositiveIntegerField(default=0, editable=False)
+    resources_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+
+    COUNTERS = (
+        'members_count',
+        'children_count',
+        'watchers_count',
+        'models_count',
+        'exercises_count',
+        'activities_count',
+        'resources_count',
+    )
 
     topics = models.ManyToManyField(Topic, related_name='circles', blank=True)
     levels = models.ManyToManyField(Level, related_name='circles', blank=True)
     watchers = models.ManyToManyField(User, related_name='watched_circles', blank=True)
 
+    class QS(models.QuerySet):
+        def descendants(self, circle: 'Circle', include_self: bool = False):
+            """Filters the circles of the subtree of `circle` with a single indexed lookup on `path`.
+
+            Raises:
+                `ValueError`: If the path of `circle` is not computed yet (unsaved circle).
+            """
+
+            queryset = self.filter(path__startswith=Circle.subtree_prefix(circle.path))
+            return queryset if include_self else queryset.exclude(pk=circle.pk)
+
+        def ancestors(self, circle: 'Circle', include_self: bool = False):
+            """Filters the circles from the root to the parent (or to `circle` if `include_self`)."""
+
+            ids = [int(pk) for pk in circle.path.strip('/').split('/') if pk]
+            if not include_self:
+                ids = ids[:-1]
+            return self.filter(pk__in=ids).order_by(Length('path'))
+
+    objects = QS.as_manager()
+
 
     def __str__(self):
         return self.name
 
-    def is_editable_by(self, user: User) -> bool:
+    @staticmethod
+    def subtree_prefix(path: str) -> str:
+        """Gets the prefix shared by the paths of the subtree of the circle with the given `path`.
+
+        The prefix ends with a separator so the circles whose id starts with the same digits
+        (`/1/` and `/12/`) are not matched.
+
+        Raises:
+            `ValueError`: If `path` is empty since it would match every circle.
+        """
+
+        if not path.strip('/'):
+            raise ValueError(f'"{path}" is not a valid circle path')
+        return path.rstrip('/') + '/'
+
+    def save(self, *args, **kwargs):
+        """Saves the circle then updates its `path` and the paths of its subtree if it moved.
+
+        Raises:
+            `ValueError`: If the circle is moved inside its own subtree.
+        """
+
+        parent_path = '/'
+        if self.parent_id is not None:
+            parent_path = Circle.objects.values_list('path', flat=True).get(pk=self.parent_id)
+
+        # the path in memory is outdated if an ancestor moved since this object was loaded
+        old = Circle.objects.filter(pk=self.pk).values_list('path', flat=True).first() if self.pk else None
+        if old and parent_path.startswith(old):
+            raise ValueError(f'{self}: a circle cannot be moved inside its own subtree')
+
+        # the counters in memory are outdated as soon as they are updated by `update_counters` and
+        # so is the path if an ancestor moved: it is only written below if the circle moved.
+        if not self._state.adding and not kwargs.get('update_fields'):
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in (*self.COUNTERS, 'path')
+            ]
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.path = f'{parent_path}{self.pk}/'
+            if self.path == old:
+                return
+
+            Circle.objects.filter(pk=self.pk).update(path=self.path)
+            if old:
+                Circle.objects.filter(path__startswith=old).exclude(pk=self.pk).update(
+                    path=Concat(models.Value(self.path), Substr('path', len(old) + 1), output_field=models.CharField())
+                )
+
+            # the circle is new or moved: the old parent is the second to last id of the old path
+            previous = [int(pk) for pk in old.strip('/').split('/')[-2:-1]] if old else []
+            Circle.update_counters([pk for pk in [self.parent_id, *previous] if pk is not None])
+
+    def is_editable_by(self, user: User, circles: Optional[Set[int]] = None) -> bool:
         """Indicates whether the given `user` can edit this circle.
         A circle is editable by an user if:
         - The user is an admin.
@@ -105,6 +214,8 @@ class Circle(models.Model):
 
         Args:
             user (User): An user object.
+            circles (Set[int]): Ids of the circles the user is a member of (see `member_circles`).
+                The membership is queried when omitted.
 
         Returns:
             bool: `True` if the user can edit the circle `False` otherwise.
@@ -113,7 +224,10 @@ class Circle(models.Model):
         if user.is_admin:
             return True
 
-        if Member.objects.filter(
+        if circles is not None:
+            if self.id in circles:
+                return True
+        elif Member.objects.filter(
             user_id=user.id,
             circle_id=self.id,
         ).exists():
@@ -144,6 +258,106 @@ class Circle(models.Model):
     def find_root(cls):
         return cls.__queryset(parent=None).get()
 
+    @classmethod
+    def tree(cls) -> dict:
+        """Gets the hierarchy of the circles starting from the root circle.
+
+        The tree is built in memory from a single query then cached by each process with
+        the `CacheStamp` of the tree in its key so it is rebuilt by all the processes once a
+        circle is saved or deleted (see `invalidate_tree`).
+
+        Raises:
+            `Circle.DoesNotExist`: If there is no root circle.
+
+        Returns:
+            `dict`: The root node with `id`, `name`, `desc` and `children` (omitted for the leaves).
+        """
+
+        stamp = CacheStamp.get_many([CIRCLES_TREE_CACHE_KEY])[CIRCLES_TREE_CACHE_KEY]
+        key = f'{CIRCLES_TREE_CACHE_KEY}.{stamp}'
+        tree = cache.get(key)
+        if tree is not None:
+            return tree
+
+        nodes = {}
+        roots = []
+        rows = cls.objects.order_by('pk').values('id', 'parent_id', 'name', 'desc')
+        for row in rows:
+            nodes[row['id']] = {'id': row['id'], 'name': row['name'], 'desc': row['desc']}
+        for row in rows:
+            node = nodes[row['id']]
+            parent = nodes.get(row['parent_id'])
+            if parent is None:
+                roots.append(node)
+            else:
+                parent.setdefault('children', []).append(node)
+
+        if not roots:
+            raise cls.DoesNotExist('Circle matching query does not exist.')
+
+        cache.set(key, roots[0], CIRCLES_TREE_CACHE_TIMEOUT)
+        return roots[0]
+
+    @classmethod
+    def invalidate_tree(cls):
+        """Forces all the processes to rebuild the tree returned by `tree`."""
+
+        CacheStamp.renew(CIRCLES_TREE_CACHE_KEY)
+
+    @classmethod
+    def update_counters(cls, ids: Iterable[int] = None) -> int:
+        """Recomputes the persisted counters of the circles `ids` with a single `UPDATE`.
+
+        The receivers of `pl_resources.receivers` call this method each time a member, a watcher,
+        a child or a resource is added/removed/moved. The command `updatecirclecounters` calls it
+        for all the circles to repair the counters modified without signals (`QuerySet.update`...).
+
+        Args:
+            ids (`Iterable[int]`, optional): Identifiers of the circles to update (all the circles if `None`).
+
+        Returns:
+            `int`: The number of updated circles.
+        """
+
+        queryset = cls.objects.all() if ids is None else cls.objects.filter(pk__in=list(ids))
+
+        def count(queryset: models.QuerySet, field: str = 'circle', **kwargs):
+            return Coalesce(models.Subquery(
+                queryset.filter(**{field: models.OuterRef('pk')}, **kwargs)
+                .order_by()
+                .values(field)
+                .annotate(count=Count('pk'))
+                .values('count')
+            ), 0)
+
+        resources = Resource.objects.all()
+        return queryset.update(
+            members_count=count(Member.objects.all()),
+            children_count=count(cls.objects.all(), 'parent'),
+            watchers_count=count(cls.watchers.through.objects.all()),
+            models_count=count(resources, type=ResourceTypes.MODEL),
+            exercises_count=count(resources, type=ResourceTypes.EXERCISE),
+            activities_count=count(resources, type=ResourceTypes.ACTIVITY),
+            resources_count=count(resources, type__in=[
+                ResourceTypes.MODEL, ResourceTypes.EXERCISE, ResourceTypes.ACTIVITY
+            ]),
+        )
+
+    @classmethod
+    def member_circles(cls, user: User) -> Set[int]:
+        """Gets the ids of the circles the given `user` is a member of.
+
+        Args:
+            user (User): An user object.
+
+        Returns:
+            Set[int]: The ids of the circles (empty for an anonymous user).
+        """
+
+        if not user.id:
+            return set()
+        return set(Member.objects.filter(user_id=user.id).values_list('circle_id', flat=True))
+
     @classmethod
     def is_member(cls, user: User, circle_id: int) -> bool:
         if user.is_admin:
@@ -156,33 +370,8 @@ class Circle(models.Model):
 
     @classmethod
     def __queryset(cls, **kwargs):
-        return cls.objects.prefetch_related('topics', 'levels') \
-            .filter(**kwargs) \
-            .annotate(
-                members_count=Count("members", distinct=True),
-                children_count=Count("children", distinct=True),
-                watchers_count=Count("watchers", distinct=True),
-                models_count=Count(
-                    "resources",
-                    distinct=True,
-                    filter=models.Q(resources__type=ResourceTypes.MODEL)
-                ),
-                exercises_count=Count(
-                    "resources",
-                    distinct=True,
-                    filter=models.Q(resources__type=ResourceTypes.EXERCISE)
-                ),
-                activities_count=Count(
-                    "resources",
-                    distinct=True,
-                    filter=models.Q(resources__type=ResourceTypes.ACTIVITY)
-                ),
-                resources_count=(
-                    models.F("models_count")
-                    + models.F("exercises_count")
-                    + models.F("activities_count")
-                ),
-        )
+        # the statistics are persisted counters (see `update_counters`) instead of aggregates
+        return cls.objects.prefetch_related('topics', 'levels').filter(**kwargs)
 
 
 class Member(models.Model):
@@ -280,6 +469,9 @@ class Resource(models.Model):
     author = models.ForeignKey(User, related_name="resources",  on_delete=models.CASCADE)
     circle: Circle = models.ForeignKey(Circle, related_name="resources", on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [models.Index(fields=['-updated_at', '-id'])]  # cursor pagination
+
     def __str__(self):
         return f'''
             <Resource
@@ -288,7 +480,7 @@ class Resource(models.Model):
                 type="{self.type}">
         '''
 
-    def is_editable_by(self, user: User) -> bool:
+    def is_editable_by(self, user: User, circles: Optional[Set[int]] = None) -> bool:
         """Indicates whether the given `user` can edit this resource.
         A resource is editable by an user if:
         - The user is an admin.
@@ -298,6 +490,8 @@ class Resource(models.Model):
 
         Args:
             user (User): An user object.
+            circles (Set[int]): Ids of the circles the user is a member of (see `Circle.member_circles`).
+                The membership is queried when omitted.
 
         Returns:
             bool: `True` if the user can edit the resource `False` otherwise.
@@ -306,9 +500,15 @@ class Resource(models.Model):
         if user.is_admin or user.id == self.author_id:
             return True
 
+        if circles is not None and self.circle_id in circles:
+            return True
+
         if user.is_editor and self.circle.opened:
             return True
 
+        if circles is not None:
+            return False
+
         return Member.objects.filter(
             user_id=user.id,
             circle_id=self.circle_id,
@@ -337,6 +537,110 @@ class Resource(models.Model):
             .prefetch_related('topics', 'levels')
 
 
+class ResourceFile(models.Model):
+    """Indexed content of a text file of a resource (at the `HEAD` of its directory).
+
+    The table is fed incrementally from the commits of the directories and is
+    searched through a trigram index on the content.
+
+    Attributes:
+        resource (`Resource`): Resource on which the file belongs to.
+        path (`str`): Path of the file relative to the directory of the resource.
+        content (`str`): Text content of the file.
+    """
+
+    resource: Resource = models.ForeignKey(Resource, related_name='files', on_delete=models.CASCADE)
+    path = models.CharField(max_length=1024)
+    content = models.TextField()
+
+    class Meta:
+        unique_together = (
+            ('resource', 'path')
+        )
+
+    def __str__(self):
+        return f'<ResourceFile resource="{self.resource_id}" path="{self.path}">'
+
+    @classmethod
+    def update_index(cls, resource_id: int, changes: Iterable[Tuple[str, Optional[str]]]):
+        """Updates the indexed files of the resource identified by the pk `resource_id`.
+
+        Args:
+            resource_id (`int`): Identifier of a `Resource`.
+            changes (`Iterable[Tuple[str, Optional[str]]]`): Changed paths with their new content
+                (`None` removes the path from the index).
+        """
+
+        changes = dict(changes)
+        if not changes:
+            return
+
+        with transaction.atomic():
+            cls.objects.filter(resource_id=resource_id, path__in=list(changes)).delete()
+            cls.objects.bulk_create([
+                cls(resource_id=resource_id, path=path, content=content)
+                for path, content in changes.items() if content
+            ])
+
+    @classmethod
+    def search(cls, query: str):
+        """Finds the indexed files containing `query` (case insensitive).
+
+        Args:
+            query (`str`): The text to search.
+
+        Returns:
+            `QuerySet`: A query that resolves with the matched `ResourceFile` objects.
+        """
+
+        # the lookup is compiled to `UPPER(content) LIKE UPPER(%query%)` which is served by the trigram index.
+        return cls.objects.filter(content__icontains=query)
+
+
+class CacheStamp(models.Model):
+    """Version stamp of a data cached in the memory of each process.
+
+    The processes keep the cached data with the stamp it was built for and rebuild it
+    once the stamp read from the database changes, so `renew` reaches all the processes
+    unlike the default django cache which is local to each of them.
+
+    Attributes:
+        key (`str`): Key of the cached data.
+        stamp (`str`): Current version of the cached data.
+    """
+
+    key = models.CharField(max_length=255, primary_key=True)
+    stamp = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f'<CacheStamp key="{self.key}" stamp="{self.stamp}">'
+
+    @classmethod
+    def get_many(cls, keys: Iterable[str]) -> Dict[str, str]:
+        """Gets the current stamps of the given `keys` with a single query.
+
+        Args:
+            keys (`Iterable[str]`): Keys of the cached data.
+
+        Returns:
+            `Dict[str, str]`: The stamp of each key (created if missing).
+        """
+
+        keys = list(keys)
+        stamps = dict(cls.objects.filter(key__in=keys).values_list('key', 'stamp'))
+        for key in keys:
+            if key not in stamps:
+                stamps[key] = cls.objects.get_or_create(key=key, defaults={'stamp': uuid.uuid4().hex})[0].stamp
+        return stamps
+
+    @classmethod
+    def renew(cls, *keys: str):
+        """Changes the stamps of the given `keys` so every process rebuilds the cached data."""
+
+        # a missing stamp is never cached by a process: it is created with a new value on its first read.
+        cls.objects.filter(key__in=keys).update(stamp=uuid.uuid4().hex)
+
+
 class Event(models.Model):
     """Representation of an event in a `Circle`.
 
@@ -351,6 +655,9 @@ class Event(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     circle: Circle = models.ForeignKey(Circle, on_delete=models.CASCADE, related_name='events')
 
+    class Meta:
+        indexes = [models.Index(fields=['circle', '-date', '-id'])]  # cursor pagination
+
     def __str__(self):
         return f'<Event pk="{self.pk}" type="{self.type}">'
 
@@ -16,6 +16,8 @@ from .models import Circle, Member, Resource
 
 User = get_user_model()
 
+UNDELETABLE_PATHS = ['', '.', 'resource-info.json']
+
 
 class CirclePermission(permissions.BasePermission):
     def has_permission(self,  request: Request, view: ViewSetMixin):
@@ -112,37 +114,60 @@ class ResourcePermission(permissions.BasePermission):
 class FilePermission(permissions.BasePermission):
 
     def has_permission(self, request: Request, view: ViewSetMixin):
-        if request.method in permissions.SAFE_METHODS:
+        return self.check(
+            request.user,
+            request.method,
+            view.kwargs.get('directory'),
+            view.kwargs.get('path'),
+            request.query_params.get('version', 'master')
+        )
+
+    def check(self, user: User, method: str, directory: str, path: str, version: str = 'master') -> bool:
+        """Checks whether `user` can send a request with the given `method` to the file `path` of `directory`.
+
+        The check does not depend on a DRF request so it is shared with the asynchronous views.
+
+        Args:
+            user (`User`): The user sending the request.
+            method (`str`): HTTP method of the request.
+            directory (`str`): Name of the directory (`resource:<id>` or `circle:<id>`).
+            path (`str`): Path of the file relative to the directory.
+            version (`str`, optional): Version of the file. Defaults to "master".
+
+        Returns:
+            `bool`: `True` if the request is allowed. `self.message` explains the refusals.
+        """
+
+        if method in permissions.SAFE_METHODS:
             return True
 
-        if not bool(request.user and request.user.is_authenticated):
+        if not bool(user and user.is_authenticated):
             return False
 
-        if request.query_params.get('version', 'master') != 'master':
+        if version != 'master':
             self.message = 'Cannot update versioned file'
             return False
 
-        undeletable_paths = ['', '.', 'resource-info.json']
-        path = view.kwargs.get('path').strip()
-        if request.method == 'DELETE' and path in undeletable_paths:
+        path = (path or '').strip()
+        if method == 'DELETE' and path in UNDELETABLE_PATHS:
             self.message = f'Cannot delete "{path}"'
             return False
 
-        if not request.user.is_editor:
+        if not user.is_editor:
             return False
 
-        if request.user.is_admin:
+        if user.is_admin:
             return True
 
-        type, id = view.kwargs.get('directory').split(':')
+        type, id = directory.split(':')
         if type == 'resource':
             resource = Resource.objects.filter(pk=int(id)).first()
             if not resource:
                 return False
-            return resource.is_editable_by(request.user)
+            return resource.is_editable_by(user)
 
         circle = Circle.objects.filter(pk=int(id)).first()
         if not circle:
             return False
 
-        return Circle.is_member(request.user, id)
+        return Circle.is_member(user, id)
@@ -1,14 +1,20 @@
 import logging
 
-from django.db.models.signals import post_delete, post_save
+from django.apps import apps
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_save
 from django.dispatch.dispatcher import receiver
 from pl_core.signals import create_defaults
 
+from pl_resources.completion import CIRCLE_COMPLETION, RESOURCE_COMPLETION
 from pl_resources.files import Directory
-from pl_resources.models import Circle, Level, Member, Topic
+from pl_resources.models import Circle, Level, Member, Resource, ResourceFile, Topic
+from pl_resources.signals import directory_committed
 
 logger = logging.getLogger(__name__)
 
+DIRECTORIES_MAINTENANCE_TASK = 'directories_maintenance'
+
 
 @receiver(post_save, sender=Member)
 def on_save_member(sender, instance: Member, created: bool, **kwargs):
@@ -24,6 +30,135 @@ def on_delete_member(sender, instance: Member, **kwargs):
     instance.circle.watchers.remove(instance.user)
 
 
+@receiver(post_save, sender=Circle)
+@receiver(post_delete, sender=Circle)
+def on_change_circle(sender, instance: Circle, **kwargs):
+    Circle.invalidate_tree()
+
+
+@receiver(post_delete, sender=Circle)
+def on_delete_circle(sender, instance: Circle, **kwargs):
+    if instance.parent_id is not None:
+        Circle.update_counters([instance.parent_id])
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def on_change_member_counters(sender, instance: Member, **kwargs):
+    Circle.update_counters([instance.circle_id])
+
+
+@receiver(m2m_changed, sender=Circle.watchers.through)
+def on_change_watchers(sender, instance, action: str, reverse: bool, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:  # the circles are unknown after the clear
+        instance._cleared_circles = list(instance.watched_circles.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            ids = [instance.pk]
+        elif action == 'post_clear':
+            ids = getattr(instance, '_cleared_circles', [])
+        else:
+            ids = pk_set
+        Circle.update_counters(ids)
+
+
+@receiver(pre_save, sender=Resource)
+def on_pre_save_resource(sender, instance: Resource, **kwargs):
+    # the counters of the previous circle have to be updated if the resource moves
+    # and the completion index if it is renamed
+    previous = Resource.objects.filter(pk=instance.pk).values_list(
+        'circle_id', 'name'
+    ).first() if instance.pk else None
+    instance._previous_circle_id, instance._previous_name = previous or (None, None)
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def on_change_resource_counters(sender, instance: Resource, **kwargs):
+    ids = {instance.circle_id, getattr(instance, '_previous_circle_id', None)}
+    Circle.update_counters([pk for pk in ids if pk is not None])
+
+
+@receiver(post_save, sender=Circle)
+def on_save_circle_completion(sender, instance: Circle, **kwargs):
+    CIRCLE_COMPLETION.invalidate('names')
+
+
+@receiver(post_save, sender=Resource)
+def on_save_resource_completion(sender, instance: Resource, created: bool, **kwargs):
+    if created or instance.name != getattr(instance, '_previous_name', None):
+        RESOURCE_COMPLETION.invalidate('names')
+
+
+@receiver(post_delete, sender=Circle)
+def on_delete_circle_completion(sender, instance: Circle, **kwargs):
+    CIRCLE_COMPLETION.invalidate()
+
+
+@receiver(post_delete, sender=Resource)
+def on_delete_resource_completion(sender, instance: Resource, **kwargs):
+    RESOURCE_COMPLETION.invalidate()
+
+
+@receiver(post_delete, sender=Topic)
+@receiver(post_delete, sender=Level)
+def on_delete_term(sender, instance, **kwargs):
+    # the deletion cascades to the through tables without sending `m2m_changed`
+    part = 'topics' if sender is Topic else 'levels'
+    CIRCLE_COMPLETION.invalidate(part)
+    RESOURCE_COMPLETION.invalidate(part)
+
+
+COMPLETION_THROUGHS = {
+    Circle.topics.through: (CIRCLE_COMPLETION, 'topics'),
+    Circle.levels.through: (CIRCLE_COMPLETION, 'levels'),
+    Resource.topics.through: (RESOURCE_COMPLETION, 'topics'),
+    Resource.levels.through: (RESOURCE_COMPLETION, 'levels'),
+}
+
+
+@receiver(m2m_changed, sender=Circle.topics.through)
+@receiver(m2m_changed, sender=Circle.levels.through)
+@receiver(m2m_changed, sender=Resource.topics.through)
+@receiver(m2m_changed, sender=Resource.levels.through)
+def on_change_terms(sender, action: str, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        index, part = COMPLETION_THROUGHS[sender]
+        index.invalidate(part)
+
+
+@receiver(post_migrate)
+def setup_maintenance_task(sender, *args, **kwargs):
+    """Creates the periodic task running `maintain_directories` every `DIRECTORIES_MAINTENANCE_EVERY` seconds.
+
+    The interval of the existing task is updated to match the setting.
+    """
+
+    if sender.label != 'pl_resources':  # the signal is sent once for each application
+        return
+
+    if not isinstance(settings.DIRECTORIES_MAINTENANCE_EVERY, int) or settings.DIRECTORIES_MAINTENANCE_EVERY < 1:
+        raise ValueError(
+            f"Incorrect DIRECTORIES_MAINTENANCE_EVERY settings:{settings.DIRECTORIES_MAINTENANCE_EVERY}"
+        )
+
+    PeriodicTask = apps.get_model(app_label='django_celery_beat', model_name='PeriodicTask')
+    IntervalSchedule = apps.get_model(app_label='django_celery_beat', model_name='IntervalSchedule')
+
+    schedule, _ = IntervalSchedule.objects.get_or_create(
+        every=settings.DIRECTORIES_MAINTENANCE_EVERY, period=IntervalSchedule.SECONDS
+    )
+    task, created = PeriodicTask.objects.get_or_create(
+        name=DIRECTORIES_MAINTENANCE_TASK,
+        defaults={'interval': schedule, 'task': 'pl_resources.tasks.maintain_directories'},
+    )
+    if created:
+        logger.info('Creating periodic task to maintain the directories')
+    elif task.interval_id != schedule.pk:
+        task.interval = schedule
+        task.save()
+
+
 @receiver(create_defaults)
 def on_create_defaults(sender, config, **kwargs):
     logger.info(f'creating pl_resources defaults')
@@ -62,3 +197,20 @@ def on_create_defaults(sender, config, **kwargs):
         [Topic(name=item) for item in topics],
         ignore_conflicts=True
     )
+
+
+@receiver(directory_committed)
+def on_directory_committed(sender, directory: Directory, before: str, after: str, **kwargs):
+    kind, _, pk = directory.root.name.partition(':')
+    if kind != 'resource' or not Resource.objects.filter(pk=pk).exists():
+        return
+
+    def update_index():
+        logger.info(f'indexing the files of {directory.root.name} changed by {after}')
+        ResourceFile.update_index(
+            int(pk),
+            directory.iter_changes(before, after, max_size=settings.DIRECTORIES_INDEX_MAX_FILE_SIZE)
+        )
+
+    # the commits are immutable so the other writers do not have to wait for the indexing
+    directory.on_unlock(update_index)
@@ -1,3 +1,5 @@
+from typing import Set
+
 from django.contrib.auth import get_user_model
 from django.db import models
 from pl_users.serializers import UserSerializer
@@ -12,6 +14,24 @@ from .files import Directory
 User = get_user_model()
 
 
+def member_circles(context: dict) -> Set[int]:
+    """Gets the ids of the circles the user of the request is a member of.
+
+    The ids are loaded once and kept in the serializer `context` which is shared
+    by every item of a list so the permissions of a page are evaluated in memory.
+
+    Args:
+        context (dict): Context of the serializer.
+
+    Returns:
+        Set[int]: The ids of the circles.
+    """
+
+    if 'member_circles' not in context:
+        context['member_circles'] = models.Circle.member_circles(context['request'].user)
+    return context['member_circles']
+
+
 class TopicSerializer(serializers.ModelSerializer):
     references = serializers.IntegerField(read_only=True)
 
@@ -84,8 +104,9 @@ class CircleSerializer(serializers.ModelSerializer):
 
     def get_permissions(self, value: models.Circle):
         request = self.context['request']
+        circles = None if request.user.is_admin else member_circles(self.context)
         return {
-            'write': value.is_editable_by(request.user),
+            'write': value.is_editable_by(request.user, circles),
             'delete': value.is_deletable_by(request.user)
         }
 
@@ -273,14 +294,12 @@ class ResourceSerializer(serializers.ModelSerializer):
 
         directory = Directory.create(f'resource:{instance.pk}', instance.author)
         if files:
-            directory.ignore_commits = True
-            for k, v in files.items():
-                if v['type'] == 'folder':
-                    directory.create_dir(k)
-                else:
-                    directory.create_file(k, v['content'])
-            directory.ignore_commits = False
-            directory.commit('create files')
+            with directory.transaction('create files'):
+                for k, v in files.items():
+                    if v['type'] == 'folder':
+                        directory.create_dir(k)
+                    else:
+                        directory.create_file(k, v['content'])
         return instance
 
     def to_representation(self, value: models.Resource):
@@ -309,15 +328,35 @@ class ResourceSerializer(serializers.ModelSerializer):
 
     def get_permissions(self, value: models.Resource):
         request = self.context['request']
+        circles = None if request.user.is_admin else member_circles(self.context)
         return {
-            'write': value.is_editable_by(request.user),
+            'write': value.is_editable_by(request.user, circles),
             'delete': value.is_deletable_by(request.user)
         }
 
 
+class FileOperationSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(
+        choices=['create', 'mkdir', 'write', 'move', 'copy', 'rename', 'delete'],
+        required=True
+    )
+    path = serializers.CharField(max_length=1024, required=True)
+    newpath = serializers.CharField(max_length=1024, required=False)
+    content = serializers.CharField(max_length=134217728, required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        if attrs['action'] in ('move', 'copy', 'rename') and not attrs.get('newpath'):
+            raise serializers.ValidationError({'newpath': 'This field is required.'})
+        if attrs['action'] == 'write' and 'content' not in attrs:
+            raise serializers.ValidationError({'content': 'This field is required.'})
+        return attrs
+
+
 class FileCreateSerializer(serializers.Serializer):
     file = serializers.FileField(required=False)
     files = serializers.JSONField(required=False)
+    operations = FileOperationSerializer(many=True, required=False)
+    message = serializers.CharField(max_length=1024, required=False)
 
 
 class FileRenameSerializer(serializers.Serializer):
@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  signals.py
+#
+#  Authors:
+#       - Mamadou CISSE <mciissee.@gmail.com>
+#
+
+from django.dispatch import Signal
+
+# sent by `Directory` each time `HEAD` moves to a new commit.
+# `before` is the previous commit hexsha (None for the first commit) and `after` the new one.
+directory_committed = Signal(providing_args=["directory", "before", "after"])
@@ -0,0 +1,55 @@
+import logging
+from pathlib import Path
+from typing import List
+
+from celery import shared_task
+from git import GitError
+
+from pl_resources import files
+from pl_resources.files import Directory
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def maintain_directories(names: List[str] = None, force: bool = False) -> dict:
+    """Repacks the directories with too many loose objects or packs (see `Directory.maintain`).
+
+    The task is scheduled every `DIRECTORIES_MAINTENANCE_EVERY` seconds by the periodic task created
+    after the migrations (see `pl_resources.receivers`). The returned summary (saved bytes, duration,
+    the report of each maintained directory and the error of each failure) is kept by the result backend.
+    A directory that cannot be maintained (missing, locked, not a valid repository...) does not stop the
+    maintenance of the others.
+    """
+
+    root = Path(files.DIRECTORIES_ROOT)
+    if not names:
+        names = sorted(
+            entry.name for entry in root.iterdir() if entry.is_dir() and not entry.name.startswith('.')
+        ) if root.exists() else []
+
+    reports, failures = [], {}
+    for name in names:
+        try:
+            report = Directory.get(name).maintain(force=force)
+        except (FileNotFoundError, TimeoutError, GitError) as error:
+            logger.warning(f'{name}: maintenance failed: {error!r}')
+            failures[name] = repr(error)
+            continue
+        if report['actions']:
+            reports.append(report)
+
+    summary = {
+        'directories': len(names),
+        'maintained': len(reports),
+        'failures': failures,
+        'duration': sum(report['duration'] for report in reports),
+        'saved': sum(report['size_before'] - report['size_after'] for report in reports),
+        'loose_objects': sum(report['loose_before'] - report['loose_after'] for report in reports),
+        'reports': reports,
+    }
+    logger.info(
+        f'{summary["maintained"]}/{summary["directories"]} directories maintained in {summary["duration"]:.2f}s, '
+        f'{summary["loose_objects"]} loose objects packed, {summary["saved"]} bytes saved'
+    )
+    return summary
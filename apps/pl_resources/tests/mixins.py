@@ -0,0 +1,23 @@
+import tempfile
+
+from mock import patch
+from pl_resources import files
+from pl_resources.files import REPO_POOL, TREE_CACHE
+
+
+class DirectoriesMixin:
+    """Stores the directories created by each test inside its own temporary `DIRECTORIES_ROOT`.
+
+    The temporary folder (`self.tmp`) and the caches of the repositories and of the trees are
+    cleaned up after each test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = patch.object(files, 'DIRECTORIES_ROOT', self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(REPO_POOL.clear)
+        self.addCleanup(TREE_CACHE.clear)
@@ -0,0 +1,663 @@
+import io
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.test import TestCase
+from django_celery_beat.models import PeriodicTask
+from git.index.typ import BaseIndexEntry, IndexEntry
+from mock import PropertyMock, patch
+from pl_core.asgi import ASGIHandler, AsyncStreamingHttpResponse
+from pl_resources import files
+from pl_resources.files import TREE_CACHE, AsyncDirectory, BareDirectory, Directory
+from pl_resources.tasks import maintain_directories
+from pl_resources.tests.mixins import DirectoriesMixin
+from rest_framework.request import Request
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory
+
+User = get_user_model()
+
+
+class DirectoryTestCase(DirectoriesMixin, TestCase):
+    """ Test functions of pl_resources.files modules. """
+
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', email='user@platon', password='12345')
+
+
+    def setUp(self):
+        super().setUp()
+        self.directory = Directory.create('resource:1', self.user)
+
+
+    def test_get_reuses_repo(self):
+        first = Directory.get('resource:1', self.user)
+        second = Directory.get('resource:1')
+        self.assertIs(first.repo, second.repo)
+
+        Directory.delete('resource:1')
+        with self.assertRaises(FileNotFoundError):
+            Directory.get('resource:1')
+
+
+    def test_commit_author(self):
+        with patch.object(files, 'DIRECTORIES_BARE', True):
+            bare = Directory.create('resource:2', self.user)
+        for directory in (self.directory, bare):
+            commit = directory.repo.head.commit
+            self.assertEqual((commit.message, commit.parents), ('init', ()))
+            self.assertEqual(list(commit.tree.blobs), [commit.tree['.keep']])
+
+        self.directory.create_file('main.py', 'print("hello")')
+        commit = self.directory.repo.head.commit
+        self.assertEqual(commit.author.name, 'user')
+        self.assertEqual(commit.author.email, 'user@platon')
+        self.assertEqual(commit.message, 'create main.py')
+
+        with self.directory.repo.config_reader('repository') as reader:
+            self.assertFalse(reader.has_section('user'))
+
+
+    def test_read(self):
+        self.directory.create_dir('src')
+        self.directory.create_file('src/main.py', 'print("hello")')
+        self.directory.create_file('README.md', '# readme')
+
+        tree = self.directory.repo.tree('master')
+        listing = self.directory.read()
+        self.assertEqual(listing['hexsha'], tree.hexsha)
+        self.assertEqual(
+            [(node['path'], node['type']) for node in listing['files']],
+            [('README.md', 'file'), ('src', 'folder')]
+        )
+
+        readme, src = listing['files']
+        self.assertEqual(readme['size'], tree['README.md'].size)
+        self.assertEqual(readme['mime'], tree['README.md'].mime_type)
+        self.assertEqual(src['size'], tree['src'].size)
+        self.assertEqual(src['hexsha'], tree['src'].hexsha)
+        self.assertEqual([node['path'] for node in src['children']], ['src/main.py'])
+
+        self.assertEqual(self.directory.read('src')['files'], src['children'])
+        self.assertEqual(self.directory.read('src/main.py'), b'print("hello")')
+
+
+    def test_read_urls(self):
+        self.directory.create_dir('my folder')
+        request = Request(APIRequestFactory().get('/'))
+
+        for _ in range(2):  # the second read is served from the cache
+            listing = self.directory.read(request=request)
+            url = reverse('pl_resources:files', request=request, kwargs={
+                'directory': 'resource:1',
+                'path': 'my folder'
+            })
+            self.assertEqual(listing['files'][0]['url'], f'{url}?version=master')
+            self.assertEqual(listing['files'][0]['download_url'], f'{url}?version=master&download')
+
+        self.assertNotIn('url', self.directory.read()['files'][0])
+
+
+    def test_etag(self):
+        self.directory.create_dir('src')
+        self.directory.create_file('src/main.py', 'print("hello")')
+        before = [self.directory.etag('src'), self.directory.etag('src/main.py', variant='download')]
+        archive = self.directory.etag('src', variant='download')
+        self.assertNotEqual(archive, self.directory.etag(variant='download'))
+
+        # the archive of an unchanged folder embeds the new commit
+        self.directory.create_file('README.md')
+        self.assertEqual([
+            self.directory.etag('src'), self.directory.etag('src/main.py', variant='download')
+        ], before)
+        self.assertNotEqual(self.directory.etag('src', variant='download'), archive)
+
+
+    async def test_aiter_archive(self):
+        chunks = [chunk async for chunk in self.directory.aiter_archive()]
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertEqual(archive.namelist(), ['.keep'])
+
+
+    def test_transaction(self):
+        head = self.directory.repo.head.commit
+        with self.directory.transaction('create files'):
+            self.directory.create_dir('src')
+            self.directory.create_file('src/main.py', 'print("hello")')
+            self.directory.rename('src/main.py', 'src/app.py')
+        self.assertEqual(self.directory.repo.head.commit.parents, (head,))
+        self.assertEqual(self.directory.repo.head.commit.message, 'create files')
+        self.assertEqual(self.directory.read('src/app.py'), b'print("hello")')
+
+        head = self.directory.repo.head.commit
+        with self.assertRaises(FileExistsError):
+            with self.directory.transaction('update files'):
+                self.directory.write_text('src/app.py', 'print("world")')
+                self.directory.create_file('src/lib.py')
+                self.directory.create_file('src/lib.py')
+        self.assertEqual(self.directory.repo.head.commit, head)
+        self.assertFalse(self.directory.exists('src/lib.py'))
+        self.assertEqual(self.directory.root.joinpath('src/app.py').read_text(), 'print("hello")')
+        self.assertFalse(self.directory.repo.is_dirty(untracked_files=True))
+
+
+    def test_commit_paths(self):
+        self.directory.create_dir('src')
+        self.directory.create_file('src/main.py', 'print("hello")')
+        self.directory.move('src', '.', copy=True)
+        self.directory.move('src(1)', 'src')
+        self.assertEqual(self.directory.read('src/src(1)/main.py'), b'print("hello")')
+
+        self.directory.remove('src/src(1)')
+        self.assertFalse(self.directory.commit('nothing', ['src/main.py']))
+        self.assertEqual(
+            sorted(item.path for item in self.directory.repo.tree('master').traverse()),
+            ['.keep', 'src', 'src/.keep', 'src/main.py']
+        )
+        self.assertEqual(self.directory.repo.git.status('--porcelain'), '')
+
+
+    def test_bare(self):
+        with patch.object(files, 'DIRECTORIES_BARE', True):
+            directory = Directory.create('resource:2', self.user)
+        self.assertIsInstance(directory, BareDirectory)
+        self.assertTrue(directory.repo.bare)
+        self.assertIsInstance(Directory.get('resource:2'), BareDirectory)
+
+        head = directory.repo.head.commit
+        with directory.transaction('create files'):
+            directory.create_dir('src')
+            directory.create_file('src/main.py', 'print("hello")')
+            directory.move('src/main.py', '.', copy=True)
+            directory.rename('main.py', 'app.py')
+        self.assertEqual(directory.repo.head.commit.parents, (head,))
+        self.assertEqual(directory.read('app.py'), b'print("hello")')
+        self.assertEqual(
+            [node['path'] for node in directory.read()['files']],
+            ['app.py', 'src']
+        )
+
+        head = directory.repo.head.commit
+        with self.assertRaises(FileExistsError):
+            with directory.transaction('update files'):
+                directory.write_text('app.py', 'print("world")')
+                directory.create_file('src/main.py')
+        self.assertEqual(directory.repo.head.commit, head)
+        self.assertEqual(directory.read('app.py'), b'print("hello")')
+
+        directory.remove('src')
+        self.assertFalse(directory.exists('src/main.py'))
+        self.assertTrue(directory.is_file('app.py'))
+        with self.assertRaises(PermissionError):
+            directory.create_file('../main.py')
+
+        # the mode of a file is kept when it is copied or overwritten
+        with directory.transaction('add script'):
+            directory.create_dir('src')
+            directory.create_file('run.sh', 'echo 1')
+            entries = directory._BareDirectory__pending().entries
+            entry = BaseIndexEntry((0o100755, entries[('run.sh', 0)].binsha, 0, 'run.sh'))
+            entries[('run.sh', 0)] = IndexEntry.from_base(entry)
+        directory.move('run.sh', 'src', copy=True)
+        directory.write_text('run.sh', 'echo 2')
+        tree = directory.repo.head.commit.tree
+        self.assertEqual((tree / 'run.sh').mode, 0o100755)
+        self.assertEqual((tree / 'src/run.sh').mode, 0o100755)
+
+        # only the given paths are committed, the other changes stay pending
+        with directory.transaction('add a'):
+            directory.create_file('a.txt', 'a')
+            directory.create_file('src/b.txt', 'b')
+            self.assertTrue(directory.commit('add b', ['src']))
+            self.assertEqual(directory.repo.head.commit.stats.files.keys(), {'src/b.txt'})
+        self.assertEqual(directory.repo.head.commit.message, 'add a')
+        self.assertEqual(directory.repo.head.commit.stats.files.keys(), {'a.txt'})
+
+
+    def test_convertdirectories(self):
+        self.directory.create_file('main.py', 'print("hello")')
+        head = self.directory.repo.head.commit
+
+        call_command('convertdirectories', stdout=io.StringIO())
+        directory = Directory.get('resource:1')
+        self.assertIsInstance(directory, BareDirectory)
+        self.assertEqual(directory.repo.head.commit, head)
+        self.assertEqual(os.listdir(self.tmp.name), ['resource:1'])
+
+        call_command('convertdirectories', '--to-worktree', stdout=io.StringIO())
+        directory = Directory.get('resource:1')
+        self.assertNotIsInstance(directory, BareDirectory)
+        self.assertEqual(directory.root.joinpath('main.py').read_text(), 'print("hello")')
+        self.assertFalse(directory.repo.is_dirty(untracked_files=True))
+
+
+    def test_search(self):
+        self.directory.create_dir('src')
+        self.directory.create_file('src/main.py', 'import os\nprint("Hello")\nhello_world()')
+        self.directory.create_file('README.md', '# hello')
+        self.directory.write_bytes('src/data.bin', b'hello\0')
+        cwd = os.getcwd()
+
+        matches = self.directory.search('hello')
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(
+            [(match['path'], match['line'], match['column']) for match in matches],
+            [('README.md', 1, 3), ('src/main.py', 2, 8), ('src/main.py', 3, 1)]
+        )
+        self.assertEqual(matches[1]['match'], 'print("Hello")')
+
+        self.assertEqual(len(self.directory.search('hello', match_case=True)), 2)
+        self.assertEqual(len(self.directory.search('hello', match_word=True)), 2)
+        self.assertEqual(len(self.directory.search('hello', path='src', limit=1)), 1)
+        self.assertEqual(len(self.directory.search(r'^h\w+\(', use_regex=True)), 1)
+        self.assertEqual(self.directory.search('world(', path='src/main.py')[0]['line'], 3)
+
+        # the big binary file is skipped without desynchronizing the blobs read after it
+        self.directory.write_bytes('a.bin', b'\0' * 10000)
+        self.directory.create_file('b.txt', 'hello')
+        self.assertIn('b.txt', [match['path'] for match in self.directory.search('hello')])
+
+        self.directory.create_file('long.txt', 'x' * 10000 + '\nhello')
+        self.assertEqual(self.directory.search('hello', path='long.txt')[0]['line'], 2)
+        with patch.object(files, 'DIRECTORIES_SEARCH_MAX_FILE_SIZE', 8):
+            self.assertEqual([match['path'] for match in self.directory.search('hello')], ['README.md', 'b.txt'])
+
+        cancel = threading.Event()
+        iterator = self.directory.iter_search('hello', cancel=cancel)
+        next(iterator)
+        cancel.set()
+        self.assertEqual(list(iterator), [])
+
+        with self.assertRaises(ValueError):
+            self.directory.search('(', use_regex=True)
+
+
+    async def test_async_directory(self):
+        directory = await AsyncDirectory.get('resource:1', self.user)
+        await directory.create_dir('src')
+        await directory.create_file('src/main.py', 'print("hello")')
+        self.assertEqual(await directory.read('src/main.py'), b'print("hello")')
+        self.assertTrue(await directory.is_dir('src'))
+
+        def rename(directory: Directory):
+            directory.rename('src/main.py', 'src/app.py')
+            directory.write_text('src/app.py', 'print("world")')
+
+        head = self.directory.repo.head.commit
+        await directory.transaction('update files', rename)
+        self.assertEqual(self.directory.repo.head.commit.parents, (head,))
+        self.assertEqual(len(await directory.search('world')), 1)
+
+        # the streamed content is sent chunk by chunk by the ASGI handler
+        response = await directory.download('src')
+        self.assertIsInstance(response, AsyncStreamingHttpResponse)
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await ASGIHandler().send_response(response, send)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn((b'Content-Type', b'application/zip'), messages[0]['headers'])
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+        content = b''.join(message['body'] for message in messages[1:-1])
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertEqual(archive.read('src/app.py'), b'print("world")')
+
+        with self.assertRaises(FileNotFoundError):
+            await AsyncDirectory.get('resource:2')
+
+
+    def test_lock(self):
+        other = Directory(self.directory.root, self.user)
+        with self.directory.lock():
+            with self.directory.lock():  # reentrant
+                pass
+            # reentrant for the thread whatever the object
+            with other.lock(), Directory.get('resource:1', self.user).lock():
+                other.create_file('lib.py')
+            self.assertTrue(self.directory.is_file('lib.py'))
+
+            def lock():
+                with other.lock():
+                    pass
+
+            with patch.object(files, 'DIRECTORIES_LOCK_TIMEOUT', 0.05), ThreadPoolExecutor(1) as executor:
+                with self.assertRaises(TimeoutError):
+                    executor.submit(lock).result()
+
+            def create_file():
+                try:
+                    other.create_file('main.py')
+                finally:
+                    connection.close()  # the commit receivers opened a connection in this thread
+
+            thread = threading.Thread(target=create_file)
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())  # waits for the lock
+            self.assertFalse(other.exists('main.py'))
+        thread.join()
+        self.assertFalse(vars(files.LOCK_DEPTHS)['depths'])
+        self.assertEqual(self.directory.read('main.py'), b'')
+
+
+    def test_commit_queue(self):
+        head = self.directory.repo.head.commit
+        with patch.object(files.COMMIT_QUEUE, 'delay', 60):
+            self.directory.create_file('main.py', 'print("hello")')
+            self.directory.create_dir('src')
+            self.assertEqual(self.directory.repo.head.commit, head)
+            files.COMMIT_QUEUE.flush()
+
+        commit = self.directory.repo.head.commit
+        self.assertEqual(commit.parents, (head,))
+        self.assertEqual(commit.message, '2 changes\n\ncreate main.py\ncreate src')
+        self.assertEqual(self.directory.read('main.py'), b'print("hello")')
+        self.assertEqual(self.directory.repo.git.status('--porcelain'), '')
+
+
+    def test_commit_queue_before_commit(self):
+        other = User.objects.create_user(username='other', email='other@platon', password='12345')
+        head = self.directory.repo.head.commit
+        with patch.object(files.COMMIT_QUEUE, 'delay', 60):
+            self.directory.create_file('a.py')
+            Directory(self.directory.root, other, self.directory.repo).create_file('b.py')
+            with self.directory.transaction('create c.py'):
+                self.directory.create_file('c.py')
+
+        commit = self.directory.repo.head.commit
+        self.assertEqual(commit.message, 'create c.py')
+        self.assertEqual(commit.stats.files.keys(), {'c.py'})
+        queued = commit.parents[0]
+        self.assertEqual(queued.parents, (head,))
+        self.assertEqual(queued.author.name, 'user')
+        self.assertEqual(
+            queued.message,
+            '2 changes\n\ncreate a.py\ncreate b.py\n\nCo-authored-by: other <other@platon>'
+        )
+        self.assertEqual(queued.stats.files.keys(), {'a.py', 'b.py'})
+
+
+    def test_read_lazily(self):
+        with self.directory.transaction('create files'):
+            self.directory.create_dir('src')
+            self.directory.create_dir('src/lib')
+            self.directory.create_file('src/lib/lib.py')
+            for name in ('a.py', 'b.py', 'c.py'):
+                self.directory.create_file(name)
+
+        full = self.directory.read()
+        listing = self.directory.read(depth=2)
+        self.assertEqual(listing['depth'], 2)
+        src = listing['files'][-1]
+        self.assertEqual(src['path'], 'src')
+        self.assertEqual([node['path'] for node in src['children']], ['src/lib'])
+        self.assertIsNone(src['children'][0]['children'])
+        self.assertEqual(full['files'][-1]['children'][0]['children'][0]['path'], 'src/lib/lib.py')
+
+        # the truncated folders differ from the empty ones and only the requested levels are listed
+        self.directory.create_dir('empty')
+        TREE_CACHE.clear()
+        with patch.object(Directory, '_Directory__iterate', side_effect=AssertionError('full tree read')):
+            listing = self.directory.read(depth=2)
+        empty, src = listing['files'][-2:]
+        self.assertEqual((empty['path'], empty['children']), ('empty', []))
+        self.assertEqual([node['path'] for node in src['children']], ['src/lib'])
+        self.assertIsNone(src['children'][0]['children'])
+        full = self.directory.read()
+        self.assertEqual(listing['files'], [
+            {**node, 'children': [
+                {**child, 'children': None} if child['type'] == 'folder' else child
+                for child in node['children']
+            ]} if node['type'] == 'folder' else node
+            for node in full['files']
+        ])
+
+        paths, cursor = [], None
+        while True:
+            listing = self.directory.read(cursor=cursor, limit=2, depth=1)
+            paths += [node['path'] for node in listing['files']]
+            cursor = listing.get('next_cursor')
+            if not cursor:
+                break
+        self.assertEqual(paths, [node['path'] for node in full['files']])
+
+        with self.assertRaises(ValueError):
+            self.directory.read(cursor='invalid')
+        with self.assertRaises(ValueError):
+            self.directory.read(depth=0)
+
+
+    def test_write_zip(self):
+        def upload(entries: dict) -> SimpleUploadedFile:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for name, content in entries.items():
+                    archive.writestr(name, content)
+            return SimpleUploadedFile('course.zip', buffer.getvalue(), content_type='application/zip')
+
+        with patch.object(files, 'DIRECTORIES_BARE', True):
+            bare = Directory.create('resource:2', self.user)
+
+        for directory in (self.directory, bare):
+            directory.create_file('main.py', 'print("hello")')
+            head = directory.repo.head.commit
+            directory.write_file('.', upload({'src/lib.py': 'import os', 'data.txt': 'x' * 1000}))
+            self.assertEqual(directory.repo.head.commit.parents, (head,))
+            self.assertEqual(directory.read('src/lib.py'), b'import os')
+            self.assertEqual(sorted(directory.repo.head.commit.stats.files), ['data.txt', 'src/lib.py'])
+            self.assertFalse(directory.exists('course.zip'))
+
+            head = directory.repo.head.commit
+            with patch.object(files, 'DIRECTORIES_UPLOAD_MAX_SIZE', 500):
+                with self.assertRaises(ValueError):
+                    directory.write_file('src', upload({'big.txt': 'x' * 1000}))
+            with patch.object(files, 'DIRECTORIES_UPLOAD_MAX_ENTRIES', 1):
+                with self.assertRaises(ValueError):
+                    directory.write_file('src', upload({'a.txt': 'a', 'b.txt': 'b'}))
+            with self.assertRaises(PermissionError):
+                directory.write_file('src', upload({'a.txt': 'a', '../../evil.txt': 'b'}))
+            self.assertEqual(directory.repo.head.commit, head)
+            self.assertFalse(directory.exists('src/a.txt'))
+
+            # a file cannot replace a folder and conversely
+            with self.assertRaises(FileExistsError):
+                directory.write_file('.', upload({'main.py/a.txt': 'a'}))
+            with self.assertRaises(IsADirectoryError):
+                directory.write_file('.', upload({'src': 'a'}))
+            self.assertEqual(directory.repo.head.commit, head)
+            self.assertTrue(directory.is_file('main.py'))
+            self.assertTrue(directory.is_dir('src'))
+
+        def copy(source, destfile, length):
+            destfile.write(source.read(1))
+            raise OSError('No space left on device')
+
+        with patch.object(files.shutil, 'copyfileobj', side_effect=copy):
+            with self.assertRaises(OSError):
+                self.directory.write_file('.', upload({'new/deep/a.txt': 'a', 'main.py': 'partial'}))
+        self.assertFalse(os.path.exists(os.path.join(self.directory.root, 'new')))
+        self.assertEqual(self.directory.read('main.py'), b'print("hello")')
+        self.assertEqual(self.directory.repo.git.status('--porcelain'), '')
+
+
+    def test_write_git_path(self):
+        with patch.object(files, 'DIRECTORIES_BARE', True):
+            bare = Directory.create('resource:2', self.user)
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('src/.git/config', '[core]')
+
+        for directory in (self.directory, bare):
+            directory.create_dir('src')
+            head = directory.repo.head.commit
+            for path in ('.git/evil', 'src/.git', 'src/.GIT/hooks/post-checkout'):
+                with self.assertRaises(PermissionError):
+                    directory.create_file(path, 'evil')
+            with self.assertRaises(PermissionError):
+                directory.rename('src', '.git')
+            with self.assertRaises(PermissionError):
+                directory.write_file('.', SimpleUploadedFile(
+                    'course.zip', buffer.getvalue(), content_type='application/zip'
+                ))
+            with self.assertRaises(PermissionError):
+                directory.write_file('src', SimpleUploadedFile('.git', b'evil'))
+            self.assertEqual(directory.repo.head.commit, head)
+            self.assertEqual(directory.repo.git.fsck('--strict'), '')
+
+
+    def test_parse_range(self):
+        self.assertEqual(files.parse_range('bytes=0-99', 50), (0, 49))
+        self.assertEqual(files.parse_range('bytes=10-', 50), (10, 49))
+        self.assertEqual(files.parse_range('bytes=-10', 50), (40, 49))
+        self.assertEqual(files.parse_range('bytes=-100', 50), (0, 49))
+        self.assertIsNone(files.parse_range('bytes=0-1,5-6', 50))
+        self.assertIsNone(files.parse_range('bytes=9-1', 50))
+        with self.assertRaises(ValueError):
+            files.parse_range('bytes=50-', 50)
+        self.assertEqual(list(files.iter_range([b'abc', b'def', b'ghi'], 2, 6)), [b'c', b'def', b'g'])
+
+
+    def test_maintain(self):
+        for index in range(5):
+            self.directory.create_file(f'file{index}.py', f'print({index})')
+        head = self.directory.repo.head.commit
+
+        report = self.directory.maintain(loose_objects=1000)
+        self.assertEqual(report['actions'], [])
+
+        report = self.directory.maintain(loose_objects=10)
+        self.assertEqual(report['actions'], ['repack', 'prune', 'commit-graph'])
+        self.assertEqual(report['loose_after'], 0)
+        self.assertEqual(report['packs_after'], 1)
+        self.assertTrue(os.path.exists(os.path.join(self.directory.repo.git_dir, 'objects/info/commit-graph')))
+        self.assertEqual(self.directory.repo.head.commit, head)
+        self.assertEqual(self.directory.read('file4.py'), b'print(4)')
+
+        self.directory.create_file('main.py')
+        stdout = io.StringIO()
+        call_command('maintaindirectories', '--force', stdout=stdout)
+        self.assertIn('resource:1: repack-all', stdout.getvalue())
+        self.assertEqual(self.directory.count_objects()['count'], 0)
+
+        # an invalid directory is reported without stopping the maintenance of the others
+        os.mkdir(os.path.join(self.tmp.name, 'resource:0'))
+        summary = maintain_directories(force=True)
+        self.assertEqual(summary['directories'], 2)
+        self.assertEqual(summary['maintained'], 1)
+        self.assertEqual(list(summary['failures']), ['resource:0'])
+        self.assertIn('InvalidGitRepositoryError', summary['failures']['resource:0'])
+
+        task = PeriodicTask.objects.get(name='directories_maintenance')
+        self.assertEqual(task.task, 'pl_resources.tasks.maintain_directories')
+        self.assertEqual(task.interval.every, settings.DIRECTORIES_MAINTENANCE_EVERY)
+        with self.settings(DIRECTORIES_MAINTENANCE_EVERY=60):
+            emit_post_migrate_signal(0, False, 'default')
+        self.assertEqual(PeriodicTask.objects.get(name='directories_maintenance').interval.every, 60)
+
+
+    def test_diff(self):
+        self.directory.create_dir('src')
+        self.directory.create_file('src/main.py', 'print("hello")\n')
+        self.directory.create_file('README.md', 'readme')
+        self.directory.create_version('v1', 'first version')
+
+        with self.directory.transaction('update files'):
+            self.directory.write_text('src/main.py', 'print("world")\n')
+            self.directory.create_file('src/lib.py', 'import os')
+            self.directory.remove('README.md')
+
+        changes = self.directory.diff('v1')
+        self.assertEqual(
+            [(change['path'], change['status']) for change in changes],
+            [('README.md', 'deleted'), ('src/lib.py', 'added'), ('src/main.py', 'modified')]
+        )
+        self.assertIsNone(changes[0]['new_hexsha'])
+        self.assertIsNone(changes[1]['patch'])
+
+        changes = self.directory.diff('v1', path='src/main.py', patch=True)
+        self.assertEqual(changes[0]['patch'], (
+            '--- a/src/main.py\n+++ b/src/main.py\n@@ -1 +1 @@\n-print("hello")\n+print("world")\n'
+        ))
+        changes = self.directory.diff('v1', path='src', patch=True)
+        self.assertTrue(changes[0]['patch'].endswith('+import os\n\\ No newline at end of file\n'))
+
+        self.assertEqual(self.directory.diff('master', 'master'), [])
+        with self.assertRaises(ValueError):
+            self.directory.diff('v2')
+
+
+    def test_bundle(self):
+        self.directory.create_file('main.py', 'print("hello")')
+        base = self.directory.repo.head.commit.hexsha
+        self.directory.write_text('main.py', 'print("world")')
+        cache = os.path.join(self.directory.repo.git_dir, 'bundles')
+
+        full = b''.join(self.directory.iter_bundle())
+        self.assertTrue(full.startswith(b'# v2 git bundle'))
+        self.assertEqual(b''.join(self.directory.iter_bundle(bases=['0' * 40, 'unknown'])), full)
+        self.assertEqual(len(os.listdir(cache)), 1)
+
+        incremental = b''.join(self.directory.iter_bundle(bases=[base]))
+        self.assertIn(f'\n-{base}'.encode(), incremental.split(b'\n\n')[0])
+        self.assertLess(len(incremental), len(full))
+        self.assertEqual(len(os.listdir(cache)), 2)
+        self.assertNotEqual(self.directory.etag(variant='git-bundle'), self.directory.etag(
+            variant='git-bundle', bases=[base]
+        ))
+
+        with self.assertRaises(ValueError):
+            self.directory.bundle(bases=[self.directory.repo.head.commit.hexsha])
+
+        with patch.object(files, 'DIRECTORIES_BUNDLE_CACHE_SIZE', 1):
+            self.directory.create_file('lib.py')
+            self.directory.bundle()
+        self.assertEqual(len(os.listdir(cache)), 1)
+
+        # a bundle handed out before its eviction is still streamed entirely
+        chunks = self.directory.iter_bundle()
+        with patch.object(files, 'DIRECTORIES_BUNDLE_CACHE_SIZE', 0):
+            self.directory.create_file('app.py')
+            self.directory.bundle()
+        self.assertEqual(os.listdir(cache), [])
+        self.assertTrue(b''.join(chunks).startswith(b'# v2 git bundle'))
+
+        full = b''.join(self.directory.iter_bundle())
+        self.assertEqual(b''.join(self.directory.iter_bundle(bases=[f'{base}\nHEAD', ''])), full)
+        with patch.object(files, 'DIRECTORIES_BUNDLE_MAX_BASES', 1):
+            self.assertEqual(b''.join(self.directory.iter_bundle(bases=['unknown', base])), full)
+
+
+    def test_list_versions(self):
+        self.directory.create_file('main.py', 'print("hello")')
+        self.assertEqual(self.directory.list_versions(), [])
+
+        version = self.directory.create_version('v1', 'first\nversion')
+        self.assertEqual(version['target'], self.directory.repo.head.commit.hexsha)
+        self.directory.write_text('main.py', 'print("world")')
+        self.directory.create_version('v2', 'second version')
+
+        with patch.object(files.Repo, 'tags', new_callable=PropertyMock) as tags:
+            versions = self.directory.list_versions()
+            tags.assert_not_called()
+        self.assertEqual([item['name'] for item in versions], ['v1', 'v2'])
+        self.assertEqual(versions[0], version)
+
+        # tags created without `create_version` are detected by the stamp of the cache.
+        self.directory.repo.create_tag('v3')
+        versions = self.directory.list_versions()
+        self.assertEqual([item['name'] for item in versions], ['v1', 'v2', 'v3'])
+        self.assertEqual(versions[1]['message'], self.directory.repo.tags[1].tag.message)
+        self.assertEqual(versions[2]['target'], self.directory.repo.head.commit.hexsha)
@@ -0,0 +1,569 @@
+import io
+import os
+import zipfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from mock import patch
+from rest_framework_simplejwt.tokens import AccessToken
+from pl_resources import files
+from pl_resources.enums import MemberStatus, ResourceStatus, ResourceTypes
+from pl_resources.completion import RESOURCE_COMPLETION, CompletionIndex
+from pl_resources.files import Directory
+from pl_resources.models import Circle, Level, Member, Resource, ResourceFile, Topic
+from pl_resources.tests.mixins import DirectoriesMixin
+
+User = get_user_model()
+
+
+class FileViewSetTestCase(DirectoriesMixin, TestCase):
+    """ Test views of pl_resources.views.FileViewSet. """
+
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='12345', is_staff=True, is_editor=True)
+
+
+    def setUp(self):
+        super().setUp()
+        self.directory = Directory.create('resource:1', self.user)
+        self.directory.create_file('main.py', 'print("hello")')
+        self.client.force_login(self.user)
+
+
+    def url(self, path: str = None):
+        kwargs = {'directory': 'resource:1'}
+        if path:
+            kwargs['path'] = path
+        return reverse('pl_resources:files', kwargs=kwargs)
+
+
+    def test_get_etag(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{self.directory.repo.tree("master").hexsha}"')
+
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(self.url('main.py') + '?download', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        download_etag = response['ETag']
+        self.assertNotEqual(download_etag, etag)
+
+        response = self.client.get(self.url('main.py') + '?download', HTTP_IF_NONE_MATCH=f'W/{download_etag}')
+        self.assertEqual(response.status_code, 304)
+
+        self.directory.write_text('main.py', 'print("world")')
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+    def test_get_download(self):
+        self.directory.create_dir('src')
+        self.directory.create_file('src/lib.py', 'import os')
+
+        response = self.client.get(self.url('main.py') + '?download')
+        self.assertEqual(response.content, b'print("hello")')
+
+        response = self.client.get(self.url('src') + '?download')
+        self.assertTrue(response.streaming)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.read('src/lib.py'), b'import os')
+
+        response = self.client.get(self.url() + '?git-bundle')
+        self.assertTrue(response.streaming)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'# v2 git bundle'))
+
+        response = self.client.get(self.url(), {'git-bundle': '', 'base': self.directory.repo.head.commit.hexsha})
+        self.assertEqual(response.status_code, 204)
+
+
+    def test_get_range(self):
+        url = self.url('main.py') + '?download'
+        response = self.client.get(url)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], '14')
+        etag = response['ETag']
+
+        with patch.object(files, 'iter_command') as iter_command:
+            response = self.client.get(url, HTTP_RANGE='bytes=5-')
+        iter_command.assert_not_called()  # small files are read without spawning a command
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'("hello")')
+        self.assertEqual(response['Content-Range'], 'bytes 5-13/14')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-3', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'o")')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'print("hello")')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */14')
+
+        content = os.urandom(files.STREAM_MIN_SIZE + 10)
+        self.directory.write_bytes('data.bin', content)
+        response = self.client.get(self.url('data.bin') + '?download', HTTP_RANGE='bytes=5-')
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), content[5:])
+        response = self.client.get(self.url('data.bin') + '?download', HTTP_RANGE='bytes=-10')
+        self.assertEqual(response.content, content[-10:])
+
+
+    def test_get_diff(self):
+        base = self.directory.repo.head.commit.hexsha
+        self.directory.write_text('main.py', 'print("world")')
+
+        response = self.client.get(self.url(), {'diff': base, 'patch': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([change['path'] for change in response.json()], ['main.py'])
+        self.assertIn('+print("world")', response.json()[0]['patch'])
+
+        response = self.client.get(self.url(), {'diff': 'unknown'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['code'], 'files/invalid-diff')
+
+
+    def test_post_operations(self):
+        head = self.directory.repo.head.commit
+        response = self.client.post(self.url(), {
+            'message': 'refactor',
+            'operations': [
+                {'action': 'mkdir', 'path': 'src'},
+                {'action': 'move', 'path': 'main.py', 'newpath': 'src'},
+                {'action': 'write', 'path': 'src/main.py', 'content': 'print("world")'},
+            ]
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.directory.repo.head.commit.parents, (head,))
+        self.assertEqual(self.directory.read('src/main.py'), b'print("world")')
+
+        response = self.client.post(self.url(), {
+            'operations': [
+                {'action': 'delete', 'path': 'src/main.py'},
+                {'action': 'delete', 'path': 'unknown.py'},
+            ]
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail']['index'], 1)
+        self.assertTrue(self.directory.exists('src/main.py'))
+
+        with patch.object(Directory, 'lock', side_effect=TimeoutError('busy')):
+            response = self.client.post(self.url(), {
+                'operations': [{'action': 'mkdir', 'path': 'lib'}]
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(self.directory.exists('lib'))
+
+
+    def test_get_search(self):
+        self.directory.create_file('lib.py', 'print("hello")')
+
+        response = self.client.get(self.url() + '?search=hello&limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'path': 'lib.py', 'line': 1, 'column': 8, 'match': 'print("hello")'}])
+
+        response = self.client.get(self.url() + '?search=(&use_regex=true')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['code'], 'files/invalid-search')
+
+
+    def test_get_tree_query(self):
+        self.directory.create_dir('src')
+        self.directory.create_file('src/lib.py')
+
+        response = self.client.get(self.url(), {'depth': 1, 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        listing = response.json()
+        self.assertEqual([node['path'] for node in listing['files']], ['main.py'])
+
+        response = self.client.get(self.url(), {'depth': 1, 'cursor': listing['next_cursor']})
+        self.assertEqual([(node['path'], node['children']) for node in response.json()['files']], [('src', None)])
+        self.assertNotIn('next_cursor', response.json())
+
+        response = self.client.get(self.url(), {'depth': 'one'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['code'], 'files/invalid-tree-query')
+
+
+class AsyncFileViewTestCase(DirectoriesMixin, TransactionTestCase):
+    """ Test views of pl_resources.views.AsyncFileView. """
+
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='user', password='12345', is_staff=True, is_editor=True)
+        self.directory = Directory.create('resource:1', self.user)
+        self.directory.create_file('main.py', 'print("hello")')
+        self.client.force_login(self.user)
+
+
+    def url(self, path: str = None):
+        kwargs = {'directory': 'resource:1'}
+        if path:
+            kwargs['path'] = path
+        return reverse('pl_resources:async-files', kwargs=kwargs)
+
+
+    def test_requests(self):
+        url = self.url('main.py')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), 'print("hello")')
+        etag = response['ETag']
+        self.assertEqual(etag, self.client.get(url.replace('async/', ''))['ETag'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.post(url.replace('main.py', ''), {
+            'operations': [
+                {'action': 'mkdir', 'path': 'src'},
+                {'action': 'move', 'path': 'main.py', 'newpath': 'src'},
+                {'action': 'delete', 'path': 'unknown.py'},
+            ]
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail']['index'], 2)
+        self.assertTrue(self.directory.exists('main.py'))
+
+        response = self.client.patch(url, {'action': 'rename', 'newpath': 'app.py'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.directory.read('app.py'), b'print("hello")')
+
+        base = self.directory.repo.head.commit.parents[0].hexsha
+        response = self.client.get(url.replace('main.py', ''), {'diff': base})
+        self.assertEqual([change['status'] for change in response.json()], ['added', 'deleted'])
+
+        response = self.client.get(url.replace('main.py', 'app.py') + '?download', HTTP_RANGE='bytes=0-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'print')
+
+        response = self.client.get(url.replace('main.py', '') + '?download')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.read('app.py'), b'print("hello")')
+
+        response = self.client.get(url.replace('main.py', 'app.py') + '?search=hello')
+        self.assertEqual(response.json()[0]['line'], 1)
+
+        self.assertEqual(self.client.get(url.replace('main.py', 'unknown.py')).status_code, 404)
+        self.assertEqual(self.client.delete(url.replace('main.py', '.git/config')).status_code, 403)
+        with patch.object(Directory, 'lock', side_effect=TimeoutError('busy')):
+            response = self.client.post(url.replace('main.py', ''), {
+                'operations': [{'action': 'mkdir', 'path': 'lib'}]
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+
+        self.client.logout()
+        response = self.client.delete(url.replace('main.py', 'app.py'))
+        self.assertEqual(response.status_code, 403)
+
+        # the same authentication as `FileViewSet`: JWT requests carry no CSRF token
+        token = AccessToken.for_user(self.user)
+        client = Client(enforce_csrf_checks=True)
+        response = client.delete(url.replace('main.py', 'app.py'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(self.directory.exists('app.py'))
+
+
+class CircleViewSetTestCase(TestCase):
+    """ Test views of pl_resources.views.CircleViewSet. """
+
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='12345', is_staff=True, is_editor=True)
+
+
+    def setUp(self):
+        self.addCleanup(Circle.invalidate_tree)
+        Circle.invalidate_tree()
+        self.client.force_login(self.user)
+
+
+    def test_get_tree(self):
+        root = Circle.objects.create(name='root')
+        first = Circle.objects.create(name='first', parent=root)
+        Circle.objects.create(name='nested', parent=first)
+        Circle.objects.create(name='second', parent=root)
+
+        Circle.tree()  # creates the stamp of the tree
+        Circle.invalidate_tree()
+        with self.assertNumQueries(2):
+            Circle.tree()
+        with self.assertNumQueries(1):
+            Circle.tree()
+
+        url = reverse('pl_resources:circle-tree')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        tree = response.json()
+        self.assertEqual(tree['name'], 'root')
+        self.assertEqual([node['name'] for node in tree['children']], ['first', 'second'])
+        self.assertEqual(tree['children'][0]['children'][0]['name'], 'nested')
+        self.assertNotIn('children', tree['children'][1])
+
+        # the cached trees are not removed (the caches are local to each process): the renewed stamp changes their key
+        first.name = 'renamed'
+        first.save()
+        self.assertEqual(self.client.get(url).json()['children'][0]['name'], 'renamed')
+
+        first.delete()
+        self.assertEqual([node['name'] for node in self.client.get(url).json()['children']], ['second'])
+
+
+    def test_paths(self):
+        root = Circle.objects.create(name='root')
+        first = Circle.objects.create(name='first', parent=root)
+        nested = Circle.objects.create(name='nested', parent=first)
+        second = Circle.objects.create(name='second', parent=root)
+        self.assertEqual(nested.path, f'/{root.pk}/{first.pk}/{nested.pk}/')
+
+        self.assertEqual(list(Circle.objects.descendants(root).order_by('pk')), [first, nested, second])
+        self.assertEqual(list(Circle.objects.ancestors(nested)), [root, first])
+        self.assertEqual(list(Circle.objects.ancestors(nested, include_self=True)), [root, first, nested])
+
+        # the subtree neither matches every circle nor the circles whose id shares the same digits
+        sibling = Circle.objects.create(pk=int(f'{root.pk}999'), name='sibling')
+        self.assertNotIn(sibling, Circle.objects.descendants(Circle(pk=root.pk, path=f'/{root.pk}')))
+        with self.assertRaises(ValueError):
+            Circle.objects.descendants(Circle(name='unsaved'))
+
+        stale = Circle.objects.get(pk=nested.pk)
+        first.parent = second
+        first.save()
+        nested.refresh_from_db()
+        self.assertEqual(nested.path, f'/{root.pk}/{second.pk}/{first.pk}/{nested.pk}/')
+
+        # saving an object loaded before its ancestor moved keeps the new path
+        stale.name = 'renamed'
+        stale.save()
+        nested.refresh_from_db()
+        self.assertEqual((nested.name, nested.path), ('renamed', f'/{root.pk}/{second.pk}/{first.pk}/{nested.pk}/'))
+        self.assertEqual(list(Circle.objects.descendants(second).order_by('pk')), [first, nested])
+
+        second.parent = nested
+        with self.assertRaises(ValueError):
+            second.save()
+
+
+    def test_counters(self):
+        root = Circle.objects.create(name='root')
+        child = Circle.objects.create(name='child', parent=root)
+        other = User.objects.create_user(username='other', password='12345')
+        Member.objects.create(user=self.user, circle=root, status=MemberStatus.MEMBER)
+        root.watchers.add(other)
+        for kind in (ResourceTypes.MODEL, ResourceTypes.EXERCISE, ResourceTypes.EXERCISE):
+            Resource.objects.create(
+                name=kind, type=kind, status=ResourceStatus.DRAFT, author=self.user, circle=root
+            )
+
+        root.name = 'renamed'
+        root.save()  # the outdated counters in memory are not written
+        root.refresh_from_db()
+        self.assertEqual(
+            [getattr(root, counter) for counter in Circle.COUNTERS],
+            [1, 1, 2, 1, 2, 0, 3]
+        )
+
+        resource = root.resources.filter(type=ResourceTypes.MODEL).get()
+        resource.circle = child
+        resource.save()
+        other.watched_circles.clear()
+        child.delete()
+        root.refresh_from_db()
+        self.assertEqual((root.children_count, root.watchers_count, root.resources_count), (0, 1, 2))
+
+        response = self.client.get(reverse('pl_resources:circle-list'), {'ordering': '-resources_count'})
+        self.assertEqual(response.status_code, 200)
+
+        Circle.objects.update(members_count=10)
+        call_command('updatecirclecounters', stdout=io.StringIO())
+        root.refresh_from_db()
+        self.assertEqual(root.members_count, 1)
+
+
+class ResourceViewSetTestCase(DirectoriesMixin, TestCase):
+    """ Test views of pl_resources.views.ResourceViewSet. """
+
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='12345', is_staff=True, is_editor=True)
+        cls.circle = Circle.objects.create(name='circle')
+
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+
+    def create_resource(self, name: str) -> Resource:
+        resource = Resource.objects.create(
+            name=name,
+            type=ResourceTypes.EXERCISE,
+            status=ResourceStatus.DRAFT,
+            author=self.user,
+            circle=self.circle,
+        )
+        return resource, Directory.create(f'resource:{resource.pk}', self.user)
+
+
+    def test_get_files_search(self):
+        first, directory = self.create_resource('first')
+        directory.create_file('main.py', 'def fibonacci(n):\n    pass')
+        second, directory = self.create_resource('second')
+        directory.create_file('main.py', 'print("Fibonacci")')
+        directory.write_bytes('data.bin', b'fibonacci\0')
+
+        url = reverse('pl_resources:resource-files-search')
+        response = self.client.get(url, {'query': 'fibonacci(', 'no_page': ''})
+        self.assertEqual([item['id'] for item in response.json()], [first.pk])
+
+        response = self.client.get(url, {'query': 'FIBONACCI', 'no_page': ''})
+        self.assertEqual(sorted(item['id'] for item in response.json()), [first.pk, second.pk])
+
+        directory.rename('main.py', 'app.py')
+        self.assertEqual(
+            sorted(ResourceFile.objects.filter(resource=second).values_list('path', flat=True)),
+            ['app.py']
+        )
+
+        # the files are indexed once the lock of the directory is released
+        with directory.lock():
+            directory.create_file('lib.py', 'fibonacci')
+            self.assertFalse(ResourceFile.objects.filter(resource=second, path='lib.py').exists())
+        self.assertTrue(ResourceFile.objects.filter(resource=second, path='lib.py').exists())
+        directory.remove('lib.py')
+
+        directory.remove('app.py')
+        response = self.client.get(url, {'query': 'fibonacci', 'no_page': ''})
+        self.assertEqual([item['id'] for item in response.json()], [first.pk])
+
+        response = self.client.get(url, {'query': 'fi'})
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_filter_subtree(self):
+        child = Circle.objects.create(name='child', parent=self.circle)
+        first, _ = self.create_resource('first')
+        second, _ = self.create_resource('second')
+        second.circle = child
+        second.save()
+
+        url = reverse('pl_resources:resource-list')
+        response = self.client.get(url, {'subtree': self.circle.pk, 'no_page': ''})
+        self.assertEqual(sorted(item['id'] for item in response.json()), [first.pk, second.pk])
+
+        response = self.client.get(url, {'subtree': child.pk, 'no_page': ''})
+        self.assertEqual([item['id'] for item in response.json()], [second.pk])
+
+
+    def test_list_permissions(self):
+        member = User.objects.create_user(username='member', password='12345', is_editor=True)
+        Member.objects.create(user=member, circle=self.circle, status=MemberStatus.MEMBER)
+        child = Circle.objects.create(name='child', parent=self.circle)
+        first, _ = self.create_resource('first')
+        second, _ = self.create_resource('second')
+        second.circle = child
+        second.save()
+
+        self.client.force_login(member)
+        url = reverse('pl_resources:resource-list')
+        self.client.get(url, {'no_page': ''})
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url, {'no_page': ''})
+        self.assertEqual(
+            {item['id']: item['permissions'] for item in response.json()},
+            {
+                first.pk: {'write': True, 'delete': False},
+                second.pk: {'write': False, 'delete': False},
+            }
+        )
+
+        for i in range(3):
+            self.create_resource(f'other{i}')
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url, {'no_page': ''})
+        self.assertEqual(len(response.json()), 5)
+        self.assertEqual(len(many), len(few))
+
+        response = self.client.get(reverse('pl_resources:circle-detail', args=[child.pk]))
+        self.assertEqual(response.json()['permissions'], {'write': False, 'delete': False})
+        response = self.client.get(reverse('pl_resources:circle-detail', args=[self.circle.pk]))
+        self.assertEqual(response.json()['permissions'], {'write': True, 'delete': False})
+
+
+    def test_list_cursor(self):
+        resources = [self.create_resource(f'resource{i}')[0] for i in range(5)]
+        resources.reverse()  # most recently updated first
+
+        url = reverse('pl_resources:resource-list')
+        response = self.client.get(url, {'cursor': '', 'limit': 2})
+        self.assertNotIn('count', response.json())
+        ids = [item['id'] for item in response.json()['results']]
+        while response.json()['next']:
+            response = self.client.get(response.json()['next'])
+            ids += [item['id'] for item in response.json()['results']]
+        self.assertEqual(ids, [resource.pk for resource in resources])
+
+        response = self.client.get(url, {'cursor': '', 'limit': 2, 'count': 'true'})
+        self.assertEqual(response.json()['count'], 5)
+
+        with patch('pl_core.pagination.CappedPagination.max_results', 3):
+            response = self.client.get(url, {'no_page': ''})
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(response['X-Truncated'], 'true')
+
+
+    def test_get_completion(self):
+        self.addCleanup(RESOURCE_COMPLETION.clear)
+        RESOURCE_COMPLETION.clear()
+        python, pytest = Topic.objects.create(name='Python'), Topic.objects.create(name='pytest')
+        level = Level.objects.create(name='L1')
+        first, _ = self.create_resource('Parser')
+        first.topics.add(python)
+        second, _ = self.create_resource('parity')
+        second.topics.add(python, pytest)
+        second.levels.add(level)
+
+        url = reverse('pl_resources:resource-completion')
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {
+            'names': ['Parser', 'parity'],
+            'topics': ['Python', 'pytest'],
+            'levels': ['L1'],
+        })
+
+        response = self.client.get(url, {'query': 'py', 'limit': 1})
+        self.assertEqual(response.json(), {'names': [], 'topics': ['Python'], 'levels': []})
+        with self.assertNumQueries(1):
+            self.assertEqual(RESOURCE_COMPLETION.search('PAR', 10)['names'], ['Parser', 'parity'])
+
+        # an index with its own memory, like in another process, is invalidated through the stamps
+        other = CompletionIndex(Resource)
+        self.assertEqual(other.terms('names'), ['Parser', 'parity'])
+
+        first.name = 'Lexer'
+        first.save()
+        first.topics.remove(python)
+        response = self.client.get(url, {'query': 'p'})
+        self.assertEqual(response.json(), {'names': ['parity'], 'topics': ['Python', 'pytest'], 'levels': []})
+        self.assertEqual(other.terms('names'), ['Lexer', 'parity'])
+
+        second.delete()
+        response = self.client.get(url, {'query': ''})
+        self.assertEqual(response.json(), {'names': ['Lexer'], 'topics': [], 'levels': []})
+
+        response = self.client.get(url, {'query': 'p', 'limit': 'all'})
+        self.assertEqual(response.status_code, 400)
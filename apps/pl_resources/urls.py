@@ -111,6 +111,11 @@ urlpatterns = [
         views.ResourceViewSet.as_recent_views(),
         name='resource-recent-views'
     ),
+    path(
+        'resources/files-search/',
+        views.ResourceViewSet.as_files_search(),
+        name='resource-files-search'
+    ),
     path(
         'resources/<int:resource_id>/',
         views.ResourceViewSet.as_detail(),
@@ -118,6 +123,11 @@ urlpatterns = [
     ),
 
     # Files
+    url(
+        r'^async/files/(?P<directory>(circle|resource):\d+)/(?P<path>[^\?]*)?',
+        views.AsyncFileView.as_view(),
+        name='async-files'
+    ),
     url(
         r'files/(?P<directory>(circle|resource):\d+)/(?P<path>[^\?]*)?',
         views.FileViewSet.as_detail(),
@@ -1,14 +1,27 @@
+from typing import Optional
+
+from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import classonlymethod
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
-from pl_core.mixins import CrudViewSet
+from pl_core.errors import RestError
+from pl_core.mixins import AsyncView, CrudViewSet
 from pl_core.permissions import (AdminOrReadonlyPermission,
                                  AdminOrTeacherPermission)
 from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from pl_resources.files import Directory
+from pl_resources.completion import (CIRCLE_COMPLETION, COMPLETION_LIMIT, COMPLETION_PARTS,
+                                     RESOURCE_COMPLETION, CompletionIndex)
+from pl_resources.files import DIRECTORIES_SEARCH_LIMIT, AsyncDirectory, Directory, async_streaming_response
 
 from . import models, permissions, serializers
 from .filters import CircleFilter, ResourceFilter
@@ -71,48 +84,10 @@ class CircleViewSet(CrudViewSet):
         return [permissions.CirclePermission()]
 
     def get_tree(self, request):
-        root = models.Circle.find_root()
-
-        def traverse(circle):
-            node = {
-                'id': circle.pk,
-                'name': circle.name,
-                'desc': circle.desc,
-            }
-
-            children = []
-            for child in circle.children.all():
-                children.append(
-                    traverse(child)
-                )
-
-            if len(children):
-                node['children'] = children
-            return node
-
-        return Response(traverse(root), status=status.HTTP_200_OK)
+        return Response(models.Circle.tree(), status=status.HTTP_200_OK)
 
     def get_completion(self, request):
-        query = models.Circle.objects.values_list(
-            'name', 'topics', 'levels'
-        ).distinct()
-
-        names = set()
-        topics = set()
-        levels = set()
-
-        for name, topic, level in query:
-            names.add(name)
-            if topic:
-                topics.add(topic)
-            if level:
-                levels.add(level)
-
-        return Response({
-            "names": names,
-            "topics": topics,
-            "levels": levels
-        }, status=status.HTTP_200_OK)
+        return completion_response(request, CIRCLE_COMPLETION)
 
     @classmethod
     def as_tree(cls):
@@ -141,6 +116,7 @@ class EventViewSet(CrudViewSet):
     serializer_class = serializers.EventSerializer
     lookup_field = 'pk'
     lookup_url_kwarg = 'event_id'
+    cursor_ordering = ('-date', '-id')
 
     def get_queryset(self):
         return models.Event.of_circle(
@@ -320,10 +296,14 @@ class ResourceViewSet(CrudViewSet):
     search_fields = ['name', 'topics__name', 'levels__name']
     ordering_fields = ['updated_at', 'name']
     ordering = ['-updated_at']
+    cursor_ordering = ('-updated_at', '-id')
 
     def get_queryset(self):
         if self.action == 'get_recent_views':
             return models.RecentView.objects.of_user(self.request.user)
+        if self.action == 'get_files_search':
+            files = models.ResourceFile.search(self.request.query_params.get('query', ''))
+            return models.Resource.list_all(pk__in=files.values('resource_id'))
         return models.Resource.list_all()
 
     def get_permissions(self):
@@ -361,31 +341,21 @@ class ResourceViewSet(CrudViewSet):
         return super().retrieve(request, *args, **kwargs)
 
     def get_completion(self, request, *args, **kwargs):
-        query = models.Resource.objects.values_list(
-            'name', 'topics', 'levels'
-        ).distinct()
-
-        names = set()
-        topics = set()
-        levels = set()
-
-        for name, topic, level in query:
-            names.add(name)
-            if topic:
-                topics.add(topic)
-            if level:
-                levels.add(level)
-
-        return Response({
-            "names": names,
-            "topics": topics,
-            "levels": levels
-        }, status=status.HTTP_200_OK)
+        return completion_response(request, RESOURCE_COMPLETION)
 
     def get_recent_views(self, request, *args, **kwargs):
         self.pagination_class = None
         return self.list(request, *args, **kwargs)
 
+    def get_files_search(self, request, *args, **kwargs):
+        # the trigram index cannot serve queries shorter than a trigram
+        if len(request.query_params.get('query', '')) < 3:
+            return Response(
+                RestError('resources/invalid-query', 'query should contain at least 3 characters'),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.list(request, *args, **kwargs)
+
     @classmethod
     def as_completion(cls):
         return cls.as_view({'get': 'get_completion'})
@@ -394,9 +364,186 @@ class ResourceViewSet(CrudViewSet):
     def as_recent_views(cls):
         return cls.as_view({'get': 'get_recent_views'})
 
+    @classmethod
+    def as_files_search(cls):
+        return cls.as_view({'get': 'get_files_search'})
+
 
 # FILES
 
+def etag_matches(request, etag: str) -> bool:
+    """Checks whether `etag` matches the `If-None-Match` header of the `request`."""
+
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    # If-None-Match uses the weak comparison function so "W/" prefixes are ignored
+    return '*' in etags or etag in (item[2:] if item.startswith('W/') else item for item in etags)
+
+
+def range_header(request, etag: str) -> Optional[str]:
+    """Gets the `Range` header of the `request` unless its `If-Range` precondition fails.
+
+    Only entity tags are accepted in `If-Range` (with the strong comparison function), a date
+    never matches since the files have no modification date in git.
+    """
+
+    header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if header and if_range and if_range.strip() != etag:
+        return None
+    return header
+
+
+def tree_query_params(query_params) -> dict:
+    """Parses the `depth`, `cursor` and `limit` parameters used to read trees lazily.
+
+    Raises:
+        `ValueError`: If `depth` or `limit` are not integers.
+    """
+
+    depth = query_params.get('depth')
+    limit = query_params.get('limit')
+    return {
+        'depth': int(depth) if depth else None,
+        'cursor': query_params.get('cursor') or None,
+        'limit': int(limit) if limit else None,
+    }
+
+
+def completion_response(request, index: CompletionIndex) -> Response:
+    """Gets the terms of the given completion `index`.
+
+    Every term of the index is returned unless a `query` is given, then only the `limit`
+    (`COMPLETION_LIMIT` by default) most referenced terms starting with the query are returned.
+    """
+
+    query = request.query_params.get('query')
+    if query is None:
+        return Response({part: index.terms(part) for part in COMPLETION_PARTS}, status=status.HTTP_200_OK)
+
+    limit = request.query_params.get('limit', '')
+    if limit and (not limit.isdigit() or not int(limit)):
+        return Response(
+            RestError('resources/invalid-completion', 'limit should be a positive integer'),
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response(index.search(query, int(limit) if limit else COMPLETION_LIMIT), status=status.HTTP_200_OK)
+
+
+def file_response(request, directory: Directory, path: str, version: str) -> HttpResponse:
+    """Gets the response of a `GET` request to the file `path` of `directory` at the given `version`.
+
+    The response is shared by `FileViewSet` and `AsyncFileView` (which calls it inside the executor
+    of `AsyncDirectory`) so it only uses django responses.
+    """
+
+    query_params = request.GET
+
+    search = query_params.get('search')
+    if 'download' in query_params:
+        variant = 'download'
+    elif 'git-bundle' in query_params:
+        variant = 'git-bundle'
+    elif 'git-describe' in query_params:
+        return JsonResponse({"hash": directory.describe()})
+    elif 'diff' in query_params:
+        patch = query_params.get('patch', 'false') == 'true'
+        try:
+            changes = directory.diff(query_params.get('diff'), version, path, patch)
+        except ValueError as error:
+            return JsonResponse(RestError('files/invalid-diff', str(error)), status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse(changes, safe=False)
+    elif search:
+        use_regex = query_params.get('use_regex', 'false') == 'true'
+        match_word = query_params.get('match_word', 'false') == 'true'
+        match_case = query_params.get('match_case', 'false') == 'true'
+        try:
+            limit = min(int(query_params.get('limit', DIRECTORIES_SEARCH_LIMIT)), DIRECTORIES_SEARCH_LIMIT)
+            matches = directory.search(
+                search,
+                path=path,
+                version=version,
+                match_word=match_word,
+                match_case=match_case,
+                use_regex=use_regex,
+                limit=max(limit, 1)
+            )
+        except ValueError as error:
+            return JsonResponse(RestError('files/invalid-search', str(error)), status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse(matches, safe=False)
+    else:
+        variant = None
+
+    # the content is identified by git hashes so the client cache
+    # can be validated before reading anything from the repository.
+    bases = query_params.getlist('base')
+    etag = directory.etag(path, version, variant, bases)
+    if etag_matches(request, etag):
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    if variant == 'download':
+        response = directory.download(path, version, range_header(request, etag))
+    elif variant == 'git-bundle':
+        try:
+            response = directory.bundle(version, bases)
+        except ValueError:  # the client is up to date
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT, headers={'ETag': etag})
+    else:
+        try:
+            content = directory.read(path, version, request=request, **tree_query_params(query_params))
+        except ValueError as error:
+            return JsonResponse(RestError('files/invalid-tree-query', str(error)), status=status.HTTP_400_BAD_REQUEST)
+        response = JsonResponse(content.decode() if isinstance(content, bytes) else content, safe=False)
+
+    response['ETag'] = etag
+    return response
+
+
+FILE_ERRORS = (
+    (KeyError, status.HTTP_404_NOT_FOUND),  # the path does not exists at the requested version
+    (FileNotFoundError, status.HTTP_404_NOT_FOUND),
+    (FileExistsError, status.HTTP_409_CONFLICT),
+    ((NotADirectoryError, IsADirectoryError), status.HTTP_400_BAD_REQUEST),
+    (PermissionError, status.HTTP_403_FORBIDDEN),
+    (TimeoutError, status.HTTP_503_SERVICE_UNAVAILABLE),  # the lock of the directory is busy
+)
+
+
+def file_error_response(error: Exception) -> Optional[JsonResponse]:
+    """Gets the response of the file views for the given `error` (`None` if the error is unexpected)."""
+
+    for types, code in FILE_ERRORS:
+        if isinstance(error, types):
+            detail = f'{error}: No such file or directory' if isinstance(error, KeyError) else str(error)
+            return JsonResponse({'detail': detail}, status=code)
+    return None
+
+
+def apply_file_operation(directory: Directory, operation: dict):
+    """Applies an operation validated by `FileOperationSerializer` to the `directory`."""
+
+    action = operation['action']
+    path = operation['path']
+    if action == 'create':
+        directory.create_file(path, operation.get('content'))
+    elif action == 'mkdir':
+        directory.create_dir(path)
+    elif action == 'write':
+        directory.write_text(path, operation['content'])
+    elif action == 'move':
+        directory.move(path, operation['newpath'])
+    elif action == 'copy':
+        directory.move(path, operation['newpath'], copy=True)
+    elif action == 'rename':
+        directory.rename(path, operation['newpath'])
+    elif action == 'delete':
+        if path.strip() in permissions.UNDELETABLE_PATHS:
+            raise PermissionError(f'Cannot delete "{path}"')
+        directory.remove(path)
+
+
 class FileViewSet(CrudViewSet):
 
     def get_serializer_class(self):
@@ -412,39 +559,17 @@ class FileViewSet(CrudViewSet):
         return [permissions.FilePermission()]
 
     def get(self, request, *args, **kwargs):
-        query_params = request.query_params
-
-        path = kwargs.get('path', '.')
-        version = query_params.get('version', 'master')
-
-        directory = kwargs.get('directory')
-        directory = Directory.get(directory, request.user)
-
-        if 'download' in query_params:
-            return directory.download(path, version)
-
-        if 'git-bundle' in query_params:
-            return directory.bundle(version)
-
-        if 'git-describe' in query_params:
-            return Response({"hash": directory.describe()})
+        directory = Directory.get(kwargs.get('directory'), request.user)
+        return file_response(
+            request,
+            directory,
+            kwargs.get('path', '.'),
+            request.query_params.get('version', 'master')
+        )
 
-        search = query_params.get('search')
-        if search:
-            use_regex = query_params.get('use_regex', 'false') == 'true'
-            match_word = query_params.get('match_word', 'false') == 'true'
-            match_case = query_params.get('match_case', 'false') == 'true'
-            return Response(
-                directory.search(
-                    search,
-                    path=path,
-                    version=version,
-                    match_word=match_word,
-                    match_case=match_case,
-                    use_regex=use_regex
-                )
-            )
-        return Response(directory.read(path, version, request=request))
+    def handle_exception(self, exc):
+        response = file_error_response(exc)
+        return super().handle_exception(exc) if response is None else response
 
     def put(self, request, *args, **kwargs):
         directory = kwargs.get('directory')
@@ -479,20 +604,38 @@ class FileViewSet(CrudViewSet):
 
         if file:
             path = self.kwargs.get('path')
-            directory.write_file(path, file)
+            try:
+                directory.write_file(path, file)
+            except ValueError as error:
+                return Response(RestError('files/invalid-archive', str(error)), status=status.HTTP_400_BAD_REQUEST)
             return Response(status=status.HTTP_201_CREATED)
 
         if files:
-            directory.ignore_commits = True
-            for k, v in files.items():
-                if v['type'] == 'folder':
-                    directory.create_dir(k)
-                else:
-                    directory.create_file(k, v['content'])
-            directory.ignore_commits = False
-            directory.commit('create files')
+            with directory.transaction('create files'):
+                for k, v in files.items():
+                    if v['type'] == 'folder':
+                        directory.create_dir(k)
+                    else:
+                        directory.create_file(k, v['content'])
             return Response(status=status.HTTP_201_CREATED)
 
+        operations = serializer.validated_data.get('operations')
+        if operations:
+            message = serializer.validated_data.get('message', 'update files')
+            index = None  # the transaction may fail before the first operation
+            try:
+                with directory.transaction(message):
+                    for index, operation in enumerate(operations):
+                        apply_file_operation(directory, operation)
+            except TimeoutError:  # the lock is busy, not an invalid operation
+                raise
+            except (OSError, TypeError) as error:
+                return Response(
+                    RestError('files/invalid-operation', {'index': index, 'message': str(error)}),
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(status=status.HTTP_200_OK)
+
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
     def patch(self, request, *args, **kwargs):
@@ -535,3 +678,169 @@ class FileViewSet(CrudViewSet):
             'post': 'post',
             'delete': 'delete'
         })
+
+
+class AsyncFileView(AsyncView):
+    """Asynchronous version of `FileViewSet` for ASGI deployments.
+
+    The requests and the responses are the same as `FileViewSet` but the git operations
+    are awaited through `AsyncDirectory` so they do not hold a worker while they run.
+    """
+
+    http_method_names = ['get', 'put', 'post', 'patch', 'delete']
+
+    @classonlymethod
+    def as_view(cls, **kwargs):
+        view = super().as_view(**kwargs)
+        # like `APIView`, the CSRF token is checked by `SessionAuthentication` (JWT requests have none)
+        view.csrf_exempt = True
+        return view
+
+
+    async def get(self, request, directory: str, path: str = None):
+        return await self.__handle(request, directory, path, self.__get)
+
+    async def put(self, request, directory: str, path: str = None):
+        return await self.__handle(request, directory, path, self.__put)
+
+    async def post(self, request, directory: str, path: str = None):
+        return await self.__handle(request, directory, path, self.__post)
+
+    async def patch(self, request, directory: str, path: str = None):
+        return await self.__handle(request, directory, path, self.__patch)
+
+    async def delete(self, request, directory: str, path: str = None):
+        return await self.__handle(request, directory, path, self.__delete)
+
+
+    async def __handle(self, request, name: str, path: str, handler):
+        path = path or '.'
+        version = request.GET.get('version', 'master')
+
+        # the request is authenticated like `FileViewSet` (sessions with CSRF checks and JWT)
+        request = Request(
+            request,
+            parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+            authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        )
+        permission = permissions.FilePermission()
+        try:
+            authorized = await database_sync_to_async(self.__authorize)(request, permission, name, path, version)
+        except APIException as error:
+            return JsonResponse({'detail': error.detail}, status=error.status_code)
+        if not authorized:
+            detail = getattr(permission, 'message', 'You do not have permission to perform this action.')
+            return JsonResponse({'detail': detail}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            directory = await AsyncDirectory.get(name, request.user)
+            return await handler(request, directory, path, version)
+        except Exception as error:
+            response = file_error_response(error)
+            if response is None:
+                raise
+            return response
+
+    async def __get(self, request, directory: AsyncDirectory, path: str, version: str):
+        def get(directory: Directory):
+            response = file_response(request, directory, path, version)
+            return async_streaming_response(response)
+
+        return await directory.apply(get)
+
+    async def __put(self, request, directory: AsyncDirectory, path: str, version: str):
+        serializer = serializers.FileUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        bundle = serializer.validated_data.get('bundle')
+        content = serializer.validated_data.get('content')
+
+        if content:
+            await directory.write_text(path, content)
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        if bundle:
+            await directory.merge(bundle)
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+
+    async def __post(self, request, directory: AsyncDirectory, path: str, version: str):
+        serializer = serializers.FileCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        file = serializer.validated_data.get('file')
+        files = serializer.validated_data.get('files')
+
+        if file:
+            try:
+                await directory.write_file(path, file)
+            except ValueError as error:
+                return JsonResponse(RestError('files/invalid-archive', str(error)), status=status.HTTP_400_BAD_REQUEST)
+            return HttpResponse(status=status.HTTP_201_CREATED)
+
+        if files:
+            def create_files(directory: Directory):
+                for k, v in files.items():
+                    if v['type'] == 'folder':
+                        directory.create_dir(k)
+                    else:
+                        directory.create_file(k, v['content'])
+
+            await directory.transaction('create files', create_files)
+            return HttpResponse(status=status.HTTP_201_CREATED)
+
+        operations = serializer.validated_data.get('operations')
+        if operations:
+            message = serializer.validated_data.get('message', 'update files')
+            applied = []
+
+            def apply_operations(directory: Directory):
+                for operation in operations:
+                    apply_file_operation(directory, operation)
+                    applied.append(operation)
+
+            try:
+                await directory.transaction(message, apply_operations)
+            except TimeoutError:  # the lock is busy, not an invalid operation
+                raise
+            except (OSError, TypeError) as error:
+                return JsonResponse(
+                    RestError('files/invalid-operation', {'index': len(applied), 'message': str(error)}),
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+
+    async def __patch(self, request, directory: AsyncDirectory, path: str, version: str):
+        serializer = serializers.FileRenameSerializer(data=request.data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        action = serializer.validated_data.get('action')
+        newpath = serializer.validated_data.get('newpath')
+
+        if action == "move":
+            await directory.move(path, newpath, serializer.validated_data.get('copy', False))
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        if action == 'rename':
+            await directory.rename(path, newpath)
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+
+    async def __delete(self, request, directory: AsyncDirectory, path: str, version: str):
+        await directory.remove(path)
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+    def __authorize(self, request: Request, permission: permissions.FilePermission, name: str, path: str, version: str):
+        # the authentication and the parsing of the body hit the database or the disk so they run here
+        if not permission.check(request.user, request.method, name, path, version):
+            return False
+        if request.method not in SAFE_METHODS:
+            request.data
+        return True
@@ -24,14 +24,14 @@ class SandboxModelTests(TransactionTestCase):
     async def test_create_periodic_tasks(self):
         self.assertEquals(
             2,
-            await database_sync_to_async(PeriodicTask.objects.count)(),
+            await database_sync_to_async(PeriodicTask.objects.filter(name__startswith='sandbox_').count)(),
         )
         await database_sync_to_async(Sandbox.objects.create)(
             name="Test2", url="http://localhost:7001/", enabled=True
         )
         self.assertEquals(
             4,
-            await database_sync_to_async(PeriodicTask.objects.count)()
+            await database_sync_to_async(PeriodicTask.objects.filter(name__startswith='sandbox_').count)()
         )
 
 
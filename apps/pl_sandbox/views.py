@@ -9,6 +9,7 @@ from django.http import Http404, JsonResponse
 from pl_core.async_db import has_perm_async
 from pl_core.enums import ErrorCode
 from pl_core.mixins import AsyncView
+from pl_core.pagination import evaluate_query
 from pl_core.validators import check_unknown_fields, check_unknown_missing_fields
 from .models import CommandResult, ContainerSpecs, Request, Response, Sandbox, SandboxSpecs, Usage
 
@@ -354,10 +355,7 @@ class SandboxUsageView(AsyncView):
                     "row":    await database_sync_to_async(dgeq.serialize)(usage)
                 }
             else:
-                query = dgeq.GenericQuery(
-                    Usage, request.GET, user=request.user, use_permissions=True
-                )
-                response = await database_sync_to_async(query.evaluate)()
+                response = await database_sync_to_async(evaluate_query)(Usage, request.GET, request.user)
             status = 200
         
         except Usage.DoesNotExist as e:
@@ -531,10 +529,7 @@ class RequestView(AsyncView):
                     "row":    await database_sync_to_async(dgeq.serialize)(execution)
                 }
             else:
-                query = dgeq.GenericQuery(
-                    Request, request.GET, user=request.user, use_permissions=True
-                )
-                response = await database_sync_to_async(query.evaluate)()
+                response = await database_sync_to_async(evaluate_query)(Request, request.GET, request.user)
             status = 200
         
         except Request.DoesNotExist as e:
@@ -4,6 +4,7 @@ from rest_framework import generics, mixins
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.response import Response
 
+from pl_core.pagination import CappedPagination
 from pl_users.filters import UserFilter
 
 from .serializers import UserSerializer
@@ -25,7 +26,7 @@ class UserListView(mixins.ListModelMixin, generics.GenericAPIView):
 
     def get(self, request, *args, **kwargs):
         if 'no_page' in self.request.query_params:
-            self.pagination_class = None
+            self.pagination_class = CappedPagination
         return self.list(request, *args, **kwargs)
 
 
@@ -8,8 +8,13 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'platon.settings')
 
-application = get_asgi_application()
+# same as `get_asgi_application` with an handler streaming the asynchronous responses
+django.setup(set_prefix=False)
+
+from pl_core.asgi import ASGIHandler  # noqa: E402
+
+application = ASGIHandler()
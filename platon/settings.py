@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 import sys
+import atexit
+import shutil
 import hashlib
 import logging
+import tempfile
 from datetime import timedelta
 
 import dj_database_url
@@ -315,9 +318,12 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.DjangoFilterBackend',),
     'PAGE_SIZE': 100,
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'pl_core.pagination.LimitOffsetPagination',
 }
 
+# Maximum number of results returned by a list endpoint (page size limit, `no_page` and `dgeq` queries)
+PAGINATION_MAX_RESULTS = int(os.getenv('PAGINATION_MAX_RESULTS', '1000').strip())
+
 
 # Elasticsearch
 # https://django-elasticsearch-dsl.readthedocs.io/en/latest/settings.html
@@ -348,6 +354,10 @@ STATICFILES_DIRS = [
 ]
 
 MEDIA_ROOT = os.path.abspath(os.path.join(BASE_DIR, 'media'))
+if TESTING:
+    # the files uploaded by the tests (avatars...) are not written into the working tree
+    MEDIA_ROOT = tempfile.mkdtemp(prefix='platon-media-')
+    atexit.register(shutil.rmtree, MEDIA_ROOT, True)
 MEDIA_URL = '/media/'
 
 ################################################################################
@@ -392,8 +402,54 @@ SANDBOX_POLL_SPECS_EVERY = 60 * 10
 SANDBOX_URL = os.getenv('SANDBOX_URL', 'http://localhost:7000/')
 ################################################################################
 
+# Circles
+# Number of seconds during which the tree of the circles is cached (it is also invalidated when a circle changes).
+CIRCLES_TREE_CACHE_TIMEOUT = 60 * 60
+
+# Number of terms returned by the completion endpoints of the circles and the resources for a query
+COMPLETION_LIMIT = 10
+
 # Directories
 DIRECTORIES_ROOT = os.path.join(BASE_DIR, "directories")
+# Maximum number of git repositories kept open by the process.
+DIRECTORIES_REPO_POOL_SIZE = 64
+# Maximum number of directory trees cached in memory by the process.
+DIRECTORIES_TREE_CACHE_SIZE = 256
+# Alias of a django cache (see CACHES) shared by all the processes to cache directory trees.
+DIRECTORIES_TREE_CACHE_ALIAS = os.getenv('DIRECTORIES_TREE_CACHE_ALIAS', None)
+# Store new directories as bare git repositories (no working tree on disk).
+# Existing directories can be converted with `python manage.py convertdirectories`.
+DIRECTORIES_BARE = (os.getenv('DIRECTORIES_BARE', 'false').strip().lower() == 'true')
+# Maximum number of matches returned by a search inside a directory.
+DIRECTORIES_SEARCH_LIMIT = 1000
+# Files bigger than this size (in bytes) are ignored by the searches inside a directory.
+DIRECTORIES_SEARCH_MAX_FILE_SIZE = int(os.getenv('DIRECTORIES_SEARCH_MAX_FILE_SIZE', str(1024 * 1024)).strip())
+# Files bigger than this size (in bytes) are not added to the full-text index of the resources.
+DIRECTORIES_INDEX_MAX_FILE_SIZE = 512 * 1024
+# Number of threads running the blocking git operations of the asynchronous views.
+DIRECTORIES_EXECUTOR_WORKERS = int(os.getenv('DIRECTORIES_EXECUTOR_WORKERS', '8').strip())
+# Maximum number of seconds to wait for the write lock of a directory.
+DIRECTORIES_LOCK_TIMEOUT = 30
+# Number of seconds during which the writes to a directory are merged into a single commit (0 to disable).
+DIRECTORIES_COMMIT_DELAY = float(os.getenv('DIRECTORIES_COMMIT_DELAY', '0').strip())
+# Maximum total uncompressed size (in bytes) of a zip archive extracted into a directory.
+DIRECTORIES_UPLOAD_MAX_SIZE = int(os.getenv('DIRECTORIES_UPLOAD_MAX_SIZE', str(512 * 1024 * 1024)).strip())
+# Maximum number of files of a zip archive extracted into a directory.
+DIRECTORIES_UPLOAD_MAX_ENTRIES = int(os.getenv('DIRECTORIES_UPLOAD_MAX_ENTRIES', '20000').strip())
+# Files bigger than this size (in bytes) have no patch in the diffs between two versions of a directory.
+DIRECTORIES_DIFF_MAX_FILE_SIZE = 512 * 1024
+# Number of git bundles kept in the cache of each directory to answer the synchronizations of the clients.
+DIRECTORIES_BUNDLE_CACHE_SIZE = 16
+# Maximum number of commits sent by a client (as `base`) which are excluded from the git bundles.
+DIRECTORIES_BUNDLE_MAX_BASES = 256
+# Number of seconds between two maintenances of the directories (repack, prune, commit-graph).
+DIRECTORIES_MAINTENANCE_EVERY = int(os.getenv('DIRECTORIES_MAINTENANCE_EVERY', str(60 * 60 * 24)).strip())
+# Minimum number of loose objects for a directory to be repacked during a maintenance.
+DIRECTORIES_MAINTENANCE_LOOSE_OBJECTS = 500
+# Maximum number of packs of a directory before all its objects are repacked into a single pack.
+DIRECTORIES_MAINTENANCE_MAX_PACKS = 20
+# Unreachable objects are only pruned once they are older than this git date.
+DIRECTORIES_MAINTENANCE_PRUNE_EXPIRE = '2.weeks.ago'
 
 # Identicon (default avatar)
 IDENTICON_OPTIONS = {